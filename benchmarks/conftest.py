@@ -0,0 +1,40 @@
+import glob
+import os
+
+import matplotlib
+import pytest
+
+from nifty.bench import BENCH_SIZES, synthetic_spectrum, synthetic_windows
+
+matplotlib.use('Agg')
+
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'example')
+
+
+def example_files(pattern):
+    return sorted(glob.glob(os.path.join(EXAMPLE_DIR, '*', pattern)))
+
+
+@pytest.fixture(params=example_files('*_handy_bcorr.fits'), ids=lambda f: os.path.basename(os.path.dirname(f)))
+def example_fits(request):
+    return request.param
+
+
+@pytest.fixture(params=example_files('*.norm'), ids=lambda f: os.path.basename(os.path.dirname(f)))
+def example_norm(request, tmp_path):
+    # a private copy, so the binary cache is not written next to the examples
+    norm_file = str(tmp_path / os.path.basename(request.param))
+    with open(request.param) as src, open(norm_file, 'w') as dst:
+        dst.write(src.read())
+    return norm_file
+
+
+@pytest.fixture(scope='session', params=BENCH_SIZES, ids=lambda n: f'{n}px')
+def synthetic(request):
+    return synthetic_spectrum(request.param)
+
+
+@pytest.fixture(scope='session')
+def windows(synthetic):
+    return synthetic_windows(synthetic.features)
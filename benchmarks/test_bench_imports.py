@@ -0,0 +1,14 @@
+"""Benchmark of the start up time of the command line interface."""
+
+import os
+import subprocess
+import sys
+
+import nifty
+
+
+def test_import_cli(benchmark):
+    # a fresh interpreter every round, as on every call of the `nifty` command
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(nifty.__file__))))
+    benchmark.pedantic(subprocess.run, args=([sys.executable, '-c', 'import nifty.cli'],),
+                       kwargs=dict(env=env, check=True), rounds=5)
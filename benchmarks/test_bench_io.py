@@ -0,0 +1,21 @@
+"""Benchmarks of `nifty.io`."""
+
+from nifty import io
+
+
+def test_read_fits_cold(benchmark, example_fits):
+    benchmark.pedantic(io.read_2d_fits_spectrum, args=(example_fits,), setup=io.clear_fits_cache, rounds=20)
+
+
+def test_read_fits_cached(benchmark, example_fits):
+    io.read_2d_fits_spectrum(example_fits)
+    benchmark(io.read_2d_fits_spectrum, example_fits)
+
+
+def test_read_norm_text(benchmark, example_norm):
+    benchmark(io.read_norm_text, example_norm)
+
+
+def test_read_norm_cache(benchmark, example_norm):
+    cache_file = io.convert_norm_file(example_norm)
+    benchmark(io.read_norm_cache, cache_file)
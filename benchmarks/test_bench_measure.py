@@ -0,0 +1,72 @@
+"""Benchmarks of continuum fitting, normalization and EW integration."""
+
+import numpy as np
+
+from nifty.batch import measure_spectrum
+from nifty.continuum import ContinuumFit, fit_continuum, get_indices, normalize
+from nifty.ew import EWIntegrator, equivalent_widths
+from nifty.profiles import fit_profiles
+from nifty.synthetic import create_spectrum
+from nifty.uncertainty import MonteCarloEW
+
+
+def fit_bounds(spectrum, windows):
+    return get_indices(spectrum.xs, [windows[str(feature)]['fit'] for feature in spectrum.features.tolist()])
+
+
+def test_fit_continuum(benchmark, synthetic, windows):
+    bounds = fit_bounds(synthetic, windows)
+    benchmark(fit_continuum, synthetic.xs, synthetic.ys, bounds, synthetic.features)
+
+
+def test_incremental_fit(benchmark, synthetic, windows):
+    indmin, indmax = fit_bounds(synthetic, windows)[0, 0]
+
+    def add_and_solve():
+        fit = ContinuumFit(synthetic.xs, synthetic.ys, synthetic.features[0])
+        fit.add(indmin, indmax)
+        return fit.coefficients
+
+    benchmark(add_and_solve)
+
+
+def test_normalize(benchmark, synthetic):
+    ys_fit, ys_norm = np.empty(len(synthetic.xs)), np.empty(len(synthetic.xs))
+    benchmark(normalize, synthetic.xs, synthetic.ys, [1e-4, 1.], 400., ys_fit, ys_norm)
+
+
+def test_equivalent_widths(benchmark, synthetic, windows):
+    bounds = fit_bounds(synthetic, windows)
+    coefficients = fit_continuum(synthetic.xs, synthetic.ys, bounds, synthetic.features)
+    ew_bounds = get_indices(synthetic.xs, np.stack([synthetic.features - 1.5, synthetic.features + 1.5], axis=1))
+    benchmark(equivalent_widths, synthetic.xs, synthetic.ys, ew_bounds, coefficients, synthetic.features)
+
+
+def test_fit_profiles(benchmark, synthetic, windows):
+    coefficients = fit_continuum(synthetic.xs, synthetic.ys, fit_bounds(synthetic, windows), synthetic.features)
+    ew_bounds = get_indices(synthetic.xs, np.stack([synthetic.features - 1.5, synthetic.features + 1.5], axis=1))
+    benchmark(fit_profiles, synthetic.xs, synthetic.ys, ew_bounds, synthetic.features, coefficients=coefficients)
+
+
+def test_monte_carlo_ews(benchmark, synthetic, windows):
+    ew_bounds = get_indices(synthetic.xs, np.stack([synthetic.features - 1.5, synthetic.features + 1.5], axis=1))
+    monte_carlo = MonteCarloEW(synthetic.xs, synthetic.ys, ew_bounds, synthetic.features,
+                               fit_bounds=fit_bounds(synthetic, windows))
+    benchmark(monte_carlo.sample, 20, seed=1)
+
+
+def test_ew_integrator(benchmark, synthetic):
+    ranges = np.stack([synthetic.features - 1.5, synthetic.features + 1.5], axis=1)
+
+    def integrate():
+        return EWIntegrator(synthetic.xs, synthetic.ys).measure(ranges)
+
+    benchmark(integrate)
+
+
+def test_measure_spectrum(benchmark, synthetic, windows):
+    benchmark(measure_spectrum, synthetic.xs, synthetic.ys, synthetic.features.tolist(), windows)
+
+
+def test_create_spectrum(benchmark):
+    benchmark(create_spectrum, (400., 1000.), 10 ** 6, 1000, sigma_range=(0.05, 0.5), seed=0)
@@ -0,0 +1,40 @@
+"""Benchmarks of headless `PlotUI` redraw cycles."""
+
+from types import SimpleNamespace
+
+import pytest
+from matplotlib import pyplot as plt
+
+from nifty.ui import PlotConfig, PlotUI
+
+
+@pytest.fixture
+def ui(synthetic):
+    config = PlotConfig(synthetic.xs, synthetic.ys, synthetic.features.tolist())
+    config.x_range_factor = 0.01
+    ui = PlotUI(config, show=False)
+    yield ui
+    plt.close(ui.fig)
+
+
+def test_create_ui(benchmark, synthetic):
+    def create():
+        plt.close(PlotUI(PlotConfig(synthetic.xs, synthetic.ys, synthetic.features.tolist()), show=False).fig)
+
+    benchmark.pedantic(create, rounds=5)
+
+
+def test_fit_and_measure(benchmark, ui):
+    dib = ui.config.selected_dib
+
+    def select():
+        ui.onselect_fit_range(dib - 3., dib - 2.)
+        ui.onselect_fit_range(dib + 2., dib + 3.)
+        ui.onselect_ew_range(dib - 1.5, dib + 1.5)
+        ui.onpress(SimpleNamespace(key='r'))
+
+    benchmark(select)
+
+
+def test_next_dib(benchmark, ui):
+    benchmark(ui.onpress, SimpleNamespace(key='right'))
@@ -0,0 +1,8 @@
+"""Run the nifty command line interface with `python -m nifty`."""
+import sys
+
+from nifty.cli import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())  # pragma: no cover
@@ -0,0 +1,114 @@
+import numpy as np
+
+from nifty.continuum import fit_continuum
+
+
+# scales the median absolute deviation to the standard deviation of normally distributed noise
+MAD_SCALE = 1.4826
+
+
+def block_quantile(ys, width, q=0.5, mask=None):
+    """Return a smooth quantile filter of `ys` with a window of `width` pixels.
+
+    The quantile `q` is computed for consecutive blocks of `width` pixels (ignoring NaNs and pixels outside
+    `mask`) by sorting all blocks at once in O(n log width) and interpolated linearly between the block
+    centers. Blocks without any valid pixel are skipped, if no block is valid the result is all NaN.
+    """
+    ys = np.asarray(ys, dtype=float)
+    n = len(ys)
+    width = max(1, min(int(width), n))
+    n_blocks = -(-n // width)
+    valid = np.isfinite(ys) if mask is None else mask & np.isfinite(ys)
+
+    # invalid pixels are sorted to the end of every block as +inf
+    values = np.full(n_blocks * width, np.inf)
+    values[:n][valid] = ys[valid]
+    values = np.sort(values.reshape(n_blocks, width), axis=1)
+    counts = np.bincount(np.nonzero(valid)[0] // width, minlength=n_blocks)
+
+    filled = counts > 0
+    if not filled.any():
+        return np.full(n, np.nan)
+    values, counts = values[filled], counts[filled]
+    rows = np.arange(len(values))
+    position = q * (counts - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, counts - 1)
+    quantiles = values[rows, lower] + (values[rows, upper] - values[rows, lower]) * (position - lower)
+
+    starts = np.arange(n_blocks)[filled] * width
+    centers = starts + 0.5 * (np.minimum(starts + width, n) - 1 - starts)
+    return np.interp(np.arange(n), centers, quantiles)
+
+
+def sigma_clip_continuum(ys, width=501, q=0.5, lower=2., upper=3., iterations=10, mask=None):
+    """Estimate the continuum of a spectrum by iterative sigma clipping around a quantile filter.
+
+    In every iteration the continuum is the `block_quantile` of the unclipped pixels and the noise the
+    scaled median absolute deviation from it (per block as well, so varying S/N is followed). Pixels more
+    than `lower` sigma below or `upper` sigma above the continuum are clipped, until the clipped pixels no
+    longer change. `width` has to be several times the width of the broadest feature, otherwise the filter
+    follows the feature instead of the continuum. Returns the continuum and the mask of continuum pixels.
+    """
+    ys = np.asarray(ys, dtype=float)
+    initial = np.isfinite(ys) if mask is None else mask & np.isfinite(ys)
+    mask = initial
+    for _ in range(iterations):
+        continuum = block_quantile(ys, width, q, mask)
+        residuals = ys - continuum
+        sigma = MAD_SCALE * block_quantile(np.abs(residuals), width, 0.5, mask)
+        with np.errstate(invalid='ignore'):
+            clipped = initial & (residuals >= -lower * sigma) & (residuals <= upper * sigma)
+        if np.array_equal(clipped, mask):
+            break
+        mask = clipped
+    return continuum, mask
+
+
+def exclude_ranges(mask, bounds):
+    """Return a copy of `mask` with the pixels in the index bounds of shape (n, 2) set to False."""
+    # +1 at every start and -1 at every end, pixels with a positive running sum are covered
+    marks = np.zeros(len(mask) + 1, dtype=int)
+    bounds = np.clip(np.asarray(bounds, dtype=int).reshape(-1, 2), 0, len(mask))
+    np.add.at(marks, bounds[:, 0], 1)
+    np.add.at(marks, bounds[:, 1], -1)
+    return mask & (np.cumsum(marks[:-1]) <= 0)
+
+
+def mask_runs(mask, bounds=None):
+    """Return the index bounds [indmin, indmax) of the consecutive True pixels of `mask` within `bounds`."""
+    indmin, indmax = (0, len(mask)) if bounds is None else bounds
+    changes = np.diff(np.concatenate([[False], mask[indmin:indmax], [False]]).astype(int))
+    starts = np.nonzero(changes == 1)[0]
+    stops = np.nonzero(changes == -1)[0]
+    return np.stack([starts, stops], axis=1) + indmin
+
+
+def feature_bounds(xs, features, factor):
+    """Return the index bounds of the ranges `feature * (1 -+ factor)` with shape (n_features, 2)."""
+    features = np.atleast_1d(np.asarray(features, dtype=float))
+    return np.searchsorted(xs, np.stack([features * (1 - factor), features * (1 + factor)], axis=1))
+
+
+def continuum_mask(xs, ys, features, core_factor=1e-3, **kwargs):
+    """Return the mask of continuum pixels of a spectrum, excluding the cores of all `features`.
+
+    The spectrum is sigma clipped once with `sigma_clip_continuum` (keyword arguments are passed on), the
+    ranges `feature * (1 -+ core_factor)` are excluded as well so weak features do not bias the continuum.
+    """
+    _, mask = sigma_clip_continuum(ys, **kwargs)
+    return exclude_ranges(mask, feature_bounds(xs, features, core_factor))
+
+
+def auto_continuum(xs, ys, features, degree=1, fit_factor=1e-2, core_factor=1e-3, **kwargs):
+    """Fit a polynomial continuum around every feature to automatically selected continuum pixels.
+
+    The continuum pixels of the whole spectrum are selected in one pass with `continuum_mask`, the continuum
+    of each feature is fitted to those within `feature * (1 -+ fit_factor)`. Returns the coefficients like
+    `fit_continuum` (in `x - feature`) and the continuum mask.
+    """
+    features = np.atleast_1d(np.asarray(features, dtype=float))
+    mask = continuum_mask(xs, ys, features, core_factor=core_factor, **kwargs)
+    bounds = feature_bounds(xs, features, fit_factor)
+    coefficients = fit_continuum(xs, ys, bounds[:, np.newaxis], features, degree=degree, weights=mask)
+    return coefficients, mask
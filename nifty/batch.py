@@ -0,0 +1,262 @@
+import glob
+import logging
+import os
+import zlib
+from functools import partial
+
+import numpy as np
+
+from nifty.autocontinuum import auto_continuum
+from nifty.continuum import ContinuumTemplate, fit_continuum, get_indices
+from nifty.ew import EWIntegrator, equivalent_widths
+from nifty.features import FeatureIndex
+from nifty.io import norm_cache_path, read_2d_fits_spectrum, read_cont, read_spectrum, write_norm_cache
+from nifty.parallel import run_parallel
+from nifty.profiles import fit_profiles, profile_properties
+from nifty.timing import timed, timer
+from nifty.uncertainty import DEFAULT_PERCENTILES, MonteCarloEW, ew_error, ew_percentiles
+from nifty.velocity import doppler_factor, shift_features
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _pad_ranges(ranges_per_feature):
+    n_windows = max([len(ranges) for ranges in ranges_per_feature] + [1])
+    ranges = np.zeros((len(ranges_per_feature), n_windows, 2))
+    mask = np.zeros((len(ranges_per_feature), n_windows), dtype=bool)
+    for i, feature_ranges in enumerate(ranges_per_feature):
+        ranges[i, :len(feature_ranges)] = feature_ranges
+        mask[i, :len(feature_ranges)] = True
+    return ranges, mask
+
+
+def feature_window_sets(windows, feature):
+    """Return the window sets of `feature` in `windows`, a single dict of 'fit' and 'ew' ranges or a list."""
+    window_sets = windows.get(str(feature), [])
+    return [window_sets] if isinstance(window_sets, dict) else window_sets
+
+
+def _profile_records(fit, factor):
+    # rest frame properties and the fitted parameters (in the frame of the spectrum) of every window
+    properties = profile_properties(fit)
+    for name in ('center', 'center_error', 'fwhm', 'fwhm_error', 'ew', 'ew_error'):
+        properties[name] = properties[name] / factor
+    for i in range(len(fit.parameters)):
+        record = {name: values[i].tolist() for name, values in properties.items()}
+        record.update(name=fit.profile, parameters=fit.parameters[i].tolist(),
+                      covariance=fit.covariances[i].tolist(), chi2=float(fit.chi2[i]),
+                      converged=bool(fit.converged[i]))
+        yield record
+
+
+@timed('batch.measure_records')
+def measure_records(xs, ys, features, windows, degree=1, normalized=False, auto=False, velocity=0., profile=None,
+                    components=1, realizations=0, seed=None):
+    """Fit the continua and measure the EWs of all features with stored windows in one pass.
+
+    `windows` maps `str(feature)` to a dict with the continuum ranges under 'fit' and the integration ranges
+    under 'ew', or to a list of such dicts, one per continuum fit the feature was measured with (as recorded
+    by `PlotUI`). Every set of integration ranges is measured against the continuum of its own fit. An already
+    `normalized` spectrum is measured against a continuum of one and needs no 'fit' ranges, with `auto` the
+    continua are fitted to automatically selected continuum pixels instead (see `auto_continuum`). Returns
+    one record per EW with the feature, the EW, its integration range, the fit ranges and the continuum
+    coefficients, as stored by `MeasurementStore.add`.
+
+    Features and windows are given at rest, with a `velocity` (km/s) they are moved into the frame of the
+    spectrum before measuring and the EWs are scaled back to the rest frame. Ranges stay in the rest frame.
+
+    With a `profile` ('gaussian' or 'voigt') `components` profiles are fitted to every integration window as
+    well, all windows at once with `fit_profiles`. Every record then holds a 'profile' dict with center,
+    FWHM, depth and EW of each component (in the rest frame), their errors, the parameters and covariance.
+    With `realizations` the EW uncertainties (continuum placement included) are estimated from as many Monte
+    Carlo realizations of the spectrum (see `MonteCarloEW`), records get the 'ew_error' and 'ew_percentiles'
+    (`DEFAULT_PERCENTILES`).
+    """
+    factor = doppler_factor(velocity)
+    # only features covered by the spectrum, e.g. by the one X-shooter arm it comes from
+    index = FeatureIndex(features)
+    covered = index[index.in_range(xs[0] / factor, xs[-1] / factor)].tolist()
+    # one continuum per window set, a feature measured against several fits has several of them
+    measured, window_sets = [], []
+    for feature in covered:
+        for window_set in feature_window_sets(windows, feature):
+            if window_set.get('ew') and (normalized or auto or window_set.get('fit')):
+                measured.append(feature)
+                window_sets.append(window_set)
+    if not measured:
+        return []
+    centers = shift_features(measured, velocity)
+
+    fit_bounds = None
+    with timer('batch.continuum'):
+        if normalized:
+            coefficients = np.ones((len(measured), 1))
+        elif auto:
+            coefficients, _ = auto_continuum(xs, ys, centers, degree=degree)
+        else:
+            fit_ranges, fit_mask = _pad_ranges([window_set['fit'] for window_set in window_sets])
+            fit_bounds = get_indices(xs, fit_ranges * factor)
+            fit_bounds[~fit_mask] = 0
+            coefficients = fit_continuum(xs, ys, fit_bounds, centers, degree=degree)
+
+    with timer('batch.equivalent_widths'):
+        ew_ranges, ew_mask = _pad_ranges([window_set['ew'] for window_set in window_sets])
+        ew_bounds = get_indices(xs, ew_ranges[ew_mask] * factor)
+        groups = np.nonzero(ew_mask)[0]
+        if normalized:
+            # windows of a normalized spectrum share one integral, measured at the edges of their pixels
+            integrator = EWIntegrator(xs, ys)
+            ews = integrator.measure(integrator.edges[ew_bounds]) / factor
+        else:
+            ews = equivalent_widths(xs, ys, ew_bounds, coefficients, centers, groups=groups) / factor
+    profiles = [None] * len(ews)
+    if profile is not None:
+        with timer('batch.profiles'):
+            fit = fit_profiles(xs, ys, ew_bounds, centers[groups], profile=profile, components=components,
+                               coefficients=coefficients[groups])
+            profiles = list(_profile_records(fit, factor))
+    errors = percentiles = [None] * len(ews)
+    if realizations:
+        with timer('batch.uncertainties'):
+            # continua fitted to fixed windows are refitted in every realization, the others stay fixed
+            monte_carlo = MonteCarloEW(xs, ys, ew_bounds, centers, fit_bounds=fit_bounds, coefficients=coefficients,
+                                       degree=degree, groups=groups)
+            samples = monte_carlo.sample(realizations, seed=seed) / factor
+            errors = ew_error(samples).tolist()
+            percentiles = ew_percentiles(samples, DEFAULT_PERCENTILES).T.tolist()
+
+    records = []
+    # integration windows holding other features measure the whole blend
+    blend_bounds = index.in_ranges(ew_ranges[ew_mask])
+    for group, ew_range, ew, profile_record, error, percentile, (start, stop) in zip(
+            groups, ew_ranges[ew_mask], ews, profiles, errors, percentiles, blend_bounds):
+        feature = measured[group]
+        if stop - start > 1:
+            blend = [other for other in index[start:stop].tolist() if other != feature]
+            LOGGER.warning(f'The integration window {ew_range.tolist()} of {feature} is blended with {blend}.')
+        fit_ranges = None if normalized or auto else window_sets[group]['fit']
+        record = dict(feature=feature, ew=ew, ew_range=ew_range.tolist(), fit_ranges=fit_ranges,
+                      coefficients=coefficients[group].tolist())
+        if profile_record is not None:
+            record['profile'] = profile_record
+        if error is not None:
+            record.update(ew_error=error, ew_percentiles=percentile)
+        records.append(record)
+    return records
+
+
+def records_to_results(features, records):
+    results = {str(feature): [] for feature in features}
+    for record in records:
+        results[str(record['feature'])].append(record['ew'])
+    return results
+
+
+def measure_spectrum(xs, ys, features, windows, degree=1, normalized=False, auto=False, velocity=0.):
+    """Measure all features with stored windows like `measure_records`, as dict shaped like `Measurements.results`."""
+    return records_to_results(features, measure_records(xs, ys, features, windows, degree=degree,
+                                                        normalized=normalized, auto=auto, velocity=velocity))
+
+
+def find_spectra(input_dir, pattern='*.fits'):
+    return sorted(glob.glob(os.path.join(input_dir, pattern), recursive=True))
+
+
+def spectrum_seed(seed, spectrum_file):
+    """Return the Monte Carlo seed of a spectrum, derived from `seed` and its file name."""
+    return [seed, zlib.crc32(os.path.basename(spectrum_file).encode())]
+
+
+def measure_file(spectrum_file, windows, features, xkey='lambda', ykey='flux', degree=1, auto=False, records=False,
+                 velocity=0., profile=None, components=1, realizations=0, seed=0):
+    xs, ys, normalized = read_spectrum(spectrum_file, xkey=xkey, ykey=ykey)
+    # Monte Carlo uncertainties are reproducible, independent of the order and the worker spectra are measured in
+    seed = spectrum_seed(seed, spectrum_file)
+    # normalized spectra (binary caches or ASCII .norm files) skip the continuum fit
+    if normalized:
+        measured = measure_records(xs, ys, features, windows, normalized=True, velocity=velocity, profile=profile,
+                                   components=components, realizations=realizations, seed=seed)
+    else:
+        measured = measure_records(xs, ys, features, windows, degree=degree, auto=auto, velocity=velocity,
+                                   profile=profile, components=components, realizations=realizations, seed=seed)
+    return measured if records else records_to_results(features, measured)
+
+
+@timed('batch.normalize_files')
+def normalize_files(spectrum_files, cont_file, xkey='lambda', ykey='flux', x_scale=1.):
+    """Normalize spectra of one arm with the continuum definition of a `.cont` file.
+
+    Spectra on the same wavelength grid are normalized together in one vectorized pass with a shared
+    `ContinuumTemplate`. Every result is written as normalized spectrum cache next to its spectrum, the paths
+    of the caches are returned.
+    """
+    definition = read_cont(cont_file)
+    grids = []
+    for spectrum_file in spectrum_files:
+        xs, ys = read_2d_fits_spectrum(spectrum_file, xkey=xkey, ykey=ykey)
+        for grid_xs, grid_files in grids:
+            if len(grid_xs) == len(xs) and np.array_equal(grid_xs, xs):
+                grid_files.append(spectrum_file)
+                break
+        else:
+            grids.append((xs, [spectrum_file]))
+
+    output_files = {}
+    for xs, grid_files in grids:
+        LOGGER.info(f'Normalizing {len(grid_files)} spectra with {len(xs)} pixels')
+        template = ContinuumTemplate(definition, xs, x_scale=x_scale)
+        ys = np.stack([read_2d_fits_spectrum(spectrum_file, xkey=xkey, ykey=ykey)[1]
+                       for spectrum_file in grid_files])
+        ys_fit, ys_norm = template.normalize(ys)
+        for i, spectrum_file in enumerate(grid_files):
+            output_file = norm_cache_path(spectrum_file)
+            provenance = {'source': os.path.abspath(spectrum_file),
+                          'source_mtime': os.path.getmtime(spectrum_file),
+                          'continuum_definition': os.path.abspath(cont_file)}
+            write_norm_cache(output_file, xs, ys_norm[i], ys_fit[i], provenance=provenance)
+            output_files[spectrum_file] = output_file
+    return [output_files[spectrum_file] for spectrum_file in spectrum_files]
+
+
+def merge_results(results):
+    """Merge per spectrum results into a single dict shaped like `Measurements.results`."""
+    merged = {}
+    for spectrum_results in results.values():
+        for feature, ews in spectrum_results.items():
+            merged.setdefault(feature, []).extend(ews)
+    return merged
+
+
+def run_batch(input_dir, windows, features=None, xkey='lambda', ykey='flux', pattern='*.fits', degree=1,
+              workers=1, chunksize=1, ordered=True, auto=False, store=None, velocity=0., profile=None, components=1,
+              realizations=0, seed=0):
+    """Measure every spectrum matching `pattern` in `input_dir`, in parallel for `workers` > 1.
+
+    Returns the results keyed by the path relative to `input_dir` and the errors of spectra that failed. With a
+    `MeasurementStore` the measurements of every spectrum are appended to it as soon as they are done. The
+    features are measured moved by `velocity` (km/s) in all spectra and with a `profile` or `realizations` the
+    profile fits and Monte Carlo uncertainties of `measure_records` are added to the store. The Monte Carlo
+    realizations of every spectrum are drawn from `seed` combined with its file name (see `spectrum_seed`).
+    """
+    if features is None:
+        features = sorted(float(feature) for feature in windows)
+
+    func = partial(measure_file, windows=windows, features=features, xkey=xkey, ykey=ykey, degree=degree,
+                   auto=auto, records=store is not None, velocity=velocity, profile=profile, components=components,
+                   realizations=realizations, seed=seed)
+    results = {}
+    errors = {}
+    for spectrum_file, result, error in run_parallel(func, find_spectra(input_dir, pattern), workers=workers,
+                                                     chunksize=chunksize, ordered=ordered):
+        name = os.path.relpath(spectrum_file, input_dir)
+        if error is not None:
+            LOGGER.error(f'Measuring {name} failed: {error}')
+            errors[name] = error
+        else:
+            LOGGER.info(f'Measured {name}')
+            if store is not None:
+                store.add_many(name, result)
+                result = records_to_results(features, result)
+            results[name] = result
+    return results, errors
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+
+from nifty.autocontinuum import auto_continuum
+from nifty.batch import measure_spectrum
+from nifty.continuum import fit_continuum, get_indices
+from nifty.ew import equivalent_widths
+from nifty.profiles import fit_profiles
+from nifty.synthetic import create_spectrum
+
+
+BENCH_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+BENCH_FEATURES = 150
+
+
+def synthetic_spectrum(n, number_of_features=BENCH_FEATURES):
+    """The synthetic spectrum of `n` pixels used by the benchmarks (a log grid from 400 to 1000)."""
+    return create_spectrum((400., 1000.), n, number_of_features, sigma_range=(0.05, 0.5), depth_range=(0.05, 0.3),
+                           sn=100, grid='log', continuum=(1e-4, 1.), seed=n)
+
+
+def synthetic_windows(features):
+    """Two continuum windows on both sides and one integration window for every feature."""
+    features = np.asarray(features, dtype=float)
+    fit = np.stack([np.stack([features - 3., features - 2.], axis=1), np.stack([features + 2., features + 3.], axis=1)],
+                   axis=1)
+    ew = np.stack([features - 1.5, features + 1.5], axis=1)[:, np.newaxis]
+    return {str(feature): {'fit': f.tolist(), 'ew': e.tolist()} for feature, f, e in zip(features.tolist(), fit, ew)}
+
+
+def best_time(func, repeat=5):
+    """Return the fastest of `repeat` calls of `func` in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmarks(sizes=BENCH_SIZES, repeat=5):
+    """Time the measurement steps on synthetic spectra, yields the name, size and best time of every step."""
+    for n in sizes:
+        spectrum = synthetic_spectrum(n)
+        features = spectrum.features.tolist()
+        windows = synthetic_windows(features)
+        fit_bounds = get_indices(spectrum.xs, [windows[str(feature)]['fit'] for feature in features])
+        ew_bounds = get_indices(spectrum.xs, [windows[str(feature)]['ew'][0] for feature in features])
+        coefficients = fit_continuum(spectrum.xs, spectrum.ys, fit_bounds, features)
+
+        steps = [
+            ('create_spectrum', lambda: synthetic_spectrum(n)),
+            ('fit_continuum', lambda: fit_continuum(spectrum.xs, spectrum.ys, fit_bounds, features)),
+            ('equivalent_widths', lambda: equivalent_widths(spectrum.xs, spectrum.ys, ew_bounds, coefficients,
+                                                            features)),
+            ('measure_spectrum', lambda: measure_spectrum(spectrum.xs, spectrum.ys, features, windows)),
+            ('auto_continuum', lambda: auto_continuum(spectrum.xs, spectrum.ys, features)),
+            ('fit_profiles', lambda: fit_profiles(spectrum.xs, spectrum.ys, ew_bounds, features,
+                                                  coefficients=coefficients)),
+        ]
+        for name, func in steps:
+            yield name, n, best_time(func, repeat)
@@ -1,14 +1,254 @@
 """Console script for nifty."""
+import os
 import sys
 import click
 
+from nifty.batch import find_spectra, normalize_files, run_batch
+from nifty.bench import BENCH_SIZES, run_benchmarks
+from nifty.features import FeatureIndex
+from nifty.io import (convert_norm_file, read_features, read_spectrum, read_windows_json, write_measurements_json,
+                      write_spectrum_cache, write_windows_json)
+from nifty.prefetch import Prefetcher, create_executor
+from nifty.store import MeasurementStore
+from nifty.stitch import stitch as stitch_arms
+from nifty.table import MeasurementTable
+from nifty.timing import TIMING_ENV, enable, env_timings_file, write_timings_json
+from nifty.velocity import shift_spectrum
 
-@click.command()
-def main(args=None):
-    """Console script for nifty."""
-    click.echo("Replace this message by putting your code into "
-               "nifty.cli.main")
-    click.echo("See click documentation at https://click.palletsprojects.com/")
+
+@click.group(invoke_without_command=True)
+@click.option('--timings', default=None, type=click.Path(dir_okay=False),
+              help=f'Record the latencies of reading, measuring and UI callbacks and write them as JSON '
+                   f'(or set {TIMING_ENV}=FILE).')
+@click.pass_context
+def main(ctx, timings=None):
+    """Local spectrum normalization and absorption line measurements."""
+    if timings is None:
+        timings = env_timings_file()
+    if timings is not None:
+        enable()
+        ctx.call_on_close(lambda: write_timings_json(timings))
+    if ctx.invoked_subcommand is None:
+        click.echo(ctx.get_help())
+    return 0
+
+
+def _interactive_config(spectrum, xkey, ykey, features, velocity, executor):
+    # runs in the prefetch thread for all but the first spectrum
+    from nifty.ui import PlotConfig
+
+    xs, ys, _ = read_spectrum(spectrum, xkey=xkey, ykey=ykey)
+    if velocity:
+        ys = shift_spectrum(xs, ys, -velocity)
+    covered = features[features.in_range(xs[0], xs[-1])].tolist()
+    if not covered:
+        raise click.ClickException(f'No features between {xs[0]} and {xs[-1]} in "{spectrum}", '
+                                   f'check --feature-scale.')
+    config = PlotConfig(xs, ys, covered, executor=executor)
+    config.prepare()
+    return config
+
+
+@main.command()
+@click.argument('spectra', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--xkey', default='lambda', show_default=True, help='Key of x values in input files.')
+@click.option('--ykey', default='flux', show_default=True, help='Key of y values in input files.')
+@click.option('-f', '--features', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Absorption feature list, defaults to the packaged DIB list.')
+@click.option('--feature-scale', default=1., show_default=True,
+              help='Factor converting the feature wavelengths into those of the spectrum.')
+@click.option('-o', '--output', default=None, type=click.Path(dir_okay=False),
+              help='Measurement output file, keyed by spectrum for several SPECTRA.')
+@click.option('-w', '--windows', default=None, type=click.Path(dir_okay=False),
+              help='Output file of the continuum and integration windows, to replay them with batch.')
+@click.option('-s', '--store', default=None, type=click.Path(dir_okay=False),
+              help='SQLite measurement store every measurement is appended to.')
+@click.option('--velocity', default=0., show_default=True,
+              help='Velocity (km/s) of the features, the spectrum is resampled into their rest frame.')
+def interactive(spectra, xkey, ykey, features, feature_scale, output, windows, store, velocity):
+    """Measure the features of SPECTRA interactively, without SPECTRA on a synthetic demo spectrum.
+
+    The spectra are opened one after the other, the next one is read and prepared in the background.
+    """
+    # matplotlib is only needed (and imported) here
+    from nifty.ui import PlotConfig, PlotUI
+
+    if not spectra:
+        click.echo('Demo mode with a synthetic spectrum.')
+    index = FeatureIndex([feature * feature_scale for feature in read_features(features)])
+    executor = create_executor()
+    # the current and the next spectrum, memory stays flat however many spectra are measured
+    prefetcher = Prefetcher(executor, maxsize=2)
+    store = MeasurementStore(store) if store is not None else None
+    results = {}
+    measured_windows = {}
+    errors = {}
+    try:
+        for i, spectrum in enumerate(spectra or [None]):
+            try:
+                config = PlotConfig() if spectrum is None else prefetcher.get(spectrum, _interactive_config, spectrum,
+                                                                              xkey, ykey, index, velocity, executor)
+            except (click.ClickException, OSError, ValueError) as e:
+                if len(spectra) == 1:
+                    raise
+                # skip spectra that cannot be opened, the others of the session are still measured
+                errors[spectrum] = e.format_message() if isinstance(e, click.ClickException) else str(e)
+                click.echo(f'Failed to open {spectrum}: {errors[spectrum]}', err=True)
+                continue
+            finally:
+                # prefetched only once the current spectrum is taken, it would evict that one otherwise
+                if i + 1 < len(spectra):
+                    prefetcher.prefetch(spectra[i + 1], _interactive_config, spectra[i + 1], xkey, ykey, index,
+                                        velocity, executor)
+            try:
+                ui = PlotUI(config, store=store, spectrum=spectrum or 'synthetic')
+            finally:
+                config.close()
+            results[spectrum] = ui.measurements.results
+            # windows of later spectra replace those of the same feature measured before
+            measured_windows.update(ui.measurements.windows)
+    finally:
+        prefetcher.close()
+        executor.shutdown(wait=False)
+        if store is not None:
+            store.close()
+        # written also if the session ends with an error, nothing measured before is lost
+        if output is not None and results:
+            write_measurements_json(results if len(spectra) > 1 else next(iter(results.values())), output)
+        if windows is not None and results:
+            write_windows_json(measured_windows, windows)
+    if errors:
+        sys.exit(1)
+    return 0
+
+
+@main.command()
+@click.argument('input_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('-w', '--windows', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Continuum and integration windows stored by an interactive session.')
+@click.option('-f', '--features', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Absorption feature list, defaults to all features in the windows file.')
+@click.option('-o', '--output', default=None, type=click.Path(dir_okay=False), help='Measurement output file.')
+@click.option('--xkey', default='lambda', show_default=True, help='Key of x values in input files.')
+@click.option('--ykey', default='flux', show_default=True, help='Key of y values in input files.')
+@click.option('--pattern', default='*.fits', show_default=True, help='File name pattern of input spectra.')
+@click.option('--degree', default=1, show_default=True, help='Polynomial degree of the local continuum.')
+@click.option('-j', '--workers', default=1, show_default=True, help='Number of worker processes.')
+@click.option('--chunksize', default=1, show_default=True, help='Number of spectra sent to a worker at once.')
+@click.option('--ordered/--unordered', default=True, show_default=True,
+              help='Collect results in input order or as they complete.')
+@click.option('--auto-continuum', is_flag=True,
+              help='Fit the continua to automatically selected pixels instead of the stored fit windows.')
+@click.option('-s', '--store', default=None, type=click.Path(dir_okay=False),
+              help='SQLite measurement store every measurement is appended to as soon as it is done.')
+@click.option('--velocity', default=0., show_default=True,
+              help='Velocity (km/s) the features are moved by in the spectra, e.g. of the absorbing cloud.')
+@click.option('-t', '--table', 'table_file', default=None, type=click.Path(dir_okay=False),
+              help='Measurement table output, a FITS table or Parquet for a .parquet extension.')
+@click.option('--profile', default=None, type=click.Choice(['gaussian', 'voigt']),
+              help='Fit absorption profiles to the integration windows, the fits are added to the store.')
+@click.option('--components', default=1, show_default=True, help='Number of profile components per window.')
+@click.option('--realizations', default=0, show_default=True,
+              help='Monte Carlo realizations for EW uncertainties (continuum included), added to the store.')
+@click.option('--seed', default=0, show_default=True,
+              help='Seed of the Monte Carlo realizations, combined with the file name of every spectrum.')
+def batch(input_dir, windows, features, output, xkey, ykey, pattern, degree, workers, chunksize, ordered,
+          auto_continuum, store, velocity, table_file, profile, components, realizations, seed):
+    """Measure all spectra in INPUT_DIR with stored windows."""
+    if (profile is not None or realizations) and store is None:
+        raise click.UsageError('Profile fits and EW uncertainties are only kept in a measurement store, use --store.')
+    features = read_features(features) if features is not None else None
+    store = MeasurementStore(store) if store is not None else None
+    try:
+        results, errors = run_batch(input_dir, read_windows_json(windows), features=features, xkey=xkey,
+                                    ykey=ykey, pattern=pattern, degree=degree, workers=workers, chunksize=chunksize,
+                                    ordered=ordered, auto=auto_continuum, store=store,
+                                    velocity=velocity, profile=profile, components=components,
+                                    realizations=realizations, seed=seed)
+    finally:
+        if store is not None:
+            store.close()
+    for spectrum in errors:
+        click.echo(f'Failed to measure {spectrum}', err=True)
+    table = MeasurementTable.from_results(results, features)
+    if table_file is not None:
+        if table_file.endswith('.parquet'):
+            table.to_parquet(table_file)
+        else:
+            table.to_fits(table_file, overwrite=True)
+    if output is not None:
+        write_measurements_json(results, output)
+    else:
+        for spectrum in table.spectra:
+            click.echo(spectrum)
+            for feature, ews in table.results(spectrum).items():
+                if ews:
+                    click.echo(f'\t{feature} {ews}')
+        click.echo(table.summary())
+    if errors:
+        sys.exit(1)
+    return 0
+
+
+@main.command()
+@click.argument('norm_files', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def convert(norm_files):
+    """Convert ASCII .norm files into binary normalized spectrum caches."""
+    for norm_file in norm_files:
+        click.echo(convert_norm_file(norm_file))
+    return 0
+
+
+@main.command()
+@click.argument('input_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('-c', '--cont', 'cont_file', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Continuum definition (.cont) file applied to all spectra.')
+@click.option('--xkey', default='lambda', show_default=True, help='Key of x values in input files.')
+@click.option('--ykey', default='flux', show_default=True, help='Key of y values in input files.')
+@click.option('--pattern', default='*.fits', show_default=True, help='File name pattern of input spectra.')
+@click.option('--x-scale', default=1., show_default=True,
+              help='Factor converting the wavelengths of the definition into those of the spectra.')
+def normalize(input_dir, cont_file, xkey, ykey, pattern, x_scale):
+    """Normalize all spectra in INPUT_DIR with a stored continuum definition."""
+    for output_file in normalize_files(find_spectra(input_dir, pattern), cont_file, xkey=xkey, ykey=ykey,
+                                       x_scale=x_scale):
+        click.echo(output_file)
+    return 0
+
+
+@main.command()
+@click.argument('arm_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--output', required=True, type=click.Path(dir_okay=False),
+              help='Output spectrum cache (.npy), can be opened by interactive and batch.')
+@click.option('--xkey', default='lambda', show_default=True, help='Key of x values in input files.')
+@click.option('--ykey', default='flux', show_default=True, help='Key of y values in input files.')
+@click.option('--x-scale', 'x_scales', multiple=True, type=float,
+              help='Factor converting the wavelengths of an arm into common units, once per arm [default: 1].')
+def stitch(arm_files, output, xkey, ykey, x_scales):
+    """Stitch the spectra of several arms (ARM_FILES) onto one wavelength grid, weighted by their S/N."""
+    if x_scales and len(x_scales) != len(arm_files):
+        raise click.BadParameter(f'Got {len(x_scales)} scales for {len(arm_files)} arms.', param_hint='--x-scale')
+    arms, normalized = [], True
+    for arm_file, x_scale in zip(arm_files, x_scales or [1.] * len(arm_files)):
+        xs, ys, arm_normalized = read_spectrum(arm_file, xkey=xkey, ykey=ykey)
+        arms.append((xs * x_scale, ys))
+        normalized &= arm_normalized
+    xs, ys, errors = stitch_arms(arms)
+    provenance = {'sources': [os.path.abspath(arm_file) for arm_file in arm_files], 'x_scales': list(x_scales),
+                  'xkey': xkey, 'ykey': ykey}
+    write_spectrum_cache(output, xs, ys, errors, provenance, normalized=normalized)
+    click.echo(f'{output}: {len(xs)} px from {xs[0]} to {xs[-1]}')
+    return 0
+
+
+@main.command()
+@click.option('-n', '--size', 'sizes', multiple=True, type=int,
+              help=f'Number of pixels of the synthetic spectra, can be repeated [default: {BENCH_SIZES}].')
+@click.option('-r', '--repeat', default=5, show_default=True, help='Number of timed calls, the fastest counts.')
+def bench(sizes, repeat):
+    """Time the measurement steps on synthetic spectra."""
+    for name, n, seconds in run_benchmarks(sizes or BENCH_SIZES, repeat):
+        click.echo(f'{name:20s} {n:>9d} px {seconds * 1e3:10.3f} ms')
     return 0
 
 
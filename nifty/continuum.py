@@ -0,0 +1,252 @@
+import numpy as np
+
+
+# number of pixels a selection is extended to the blue side (matches the interactive span selection)
+SELECTION_PADDING = 2
+
+
+def get_indices(xs, ranges):
+    """Map wavelength ranges of shape (..., 2) onto pixel index bounds [indmin, indmax)."""
+    indices = np.searchsorted(xs, np.asarray(ranges, dtype=float))
+    indices[..., 0] = np.maximum(0, indices[..., 0] - SELECTION_PADDING)
+    indices[..., 1] = np.minimum(len(xs) - 1, indices[..., 1])
+    return indices
+
+
+def index_ranges(xs, bounds):
+    """Return the wavelength ranges that `get_indices` maps back onto the index bounds [indmin, indmax)."""
+    bounds = np.asarray(bounds, dtype=int)
+    starts = np.where(bounds[..., 0] > 0, bounds[..., 0] + SELECTION_PADDING, 0)
+    return np.stack([xs[np.minimum(starts, len(xs) - 1)], xs[np.minimum(bounds[..., 1], len(xs) - 1)]], axis=-1)
+
+
+def concatenate_ranges(bounds):
+    """Return the pixel indices covered by index bounds of shape (n, 2) and the range each belongs to."""
+    bounds = np.asarray(bounds, dtype=int).reshape(-1, 2)
+    lengths = np.clip(bounds[:, 1] - bounds[:, 0], 0, None)
+    offsets = np.cumsum(lengths) - lengths
+    ranges = np.repeat(np.arange(len(bounds)), lengths)
+    pixels = np.arange(lengths.sum()) - offsets[ranges] + bounds[ranges, 0]
+    return pixels, ranges
+
+
+def window_sums(xs, ys, bounds, centers, degree=1, weights=None):
+    """Return the power sums Σx^k (k <= 2d) and Σx^k·y (k <= d) of pixel windows in `x - center`.
+
+    `bounds` holds the index bounds of the windows with shape (n_windows, 2), `centers` one center per window.
+    Optional per pixel `weights` (e.g. a boolean mask of continuum pixels) weight every pixel in the sums.
+    """
+    bounds = np.asarray(bounds, dtype=int).reshape(-1, 2)
+    centers = np.broadcast_to(np.asarray(centers, dtype=float), (len(bounds),))
+    pixels, windows = concatenate_ranges(bounds)
+
+    dx = xs[pixels] - centers[windows]
+    y = ys[pixels]
+    powers = np.ones_like(dx) if weights is None else np.asarray(weights, dtype=float)[pixels]
+    sums_xx = np.empty((len(bounds), 2 * degree + 1))
+    sums_xy = np.empty((len(bounds), degree + 1))
+    for k in range(2 * degree + 1):
+        sums_xx[:, k] = np.bincount(windows, weights=powers, minlength=len(bounds))
+        if k <= degree:
+            sums_xy[:, k] = np.bincount(windows, weights=powers * y, minlength=len(bounds))
+        powers = powers * dx
+    return sums_xx, sums_xy
+
+
+def fit_continuum(xs, ys, bounds, centers, degree=1, weights=None):
+    """Fit one polynomial continuum per feature to the pixels of its fit windows.
+
+    `bounds` holds the index bounds of the fit windows with shape (n_features, n_windows, 2), empty windows
+    (indmin >= indmax) are ignored. The polynomials are fitted in `x - center` of each feature via the normal
+    equations and returned with shape (n_features, degree + 1), highest power first like `np.polyfit`.
+    Features without enough pixels to constrain the fit get NaN coefficients. Pixel `weights` are passed on
+    to `window_sums`.
+    """
+    centers = np.atleast_1d(np.asarray(centers, dtype=float))
+    bounds = np.asarray(bounds, dtype=int).reshape(len(centers), -1, 2)
+    n_features, n_windows = bounds.shape[:2]
+    sums_xx, sums_xy = window_sums(xs, ys, bounds.reshape(-1, 2), np.repeat(centers, n_windows), degree,
+                                   weights=weights)
+    # windows are accumulated in order, exactly like `ContinuumFit.add` does
+    sums_xx = sums_xx.reshape(n_features, n_windows, -1).sum(axis=1)
+    sums_xy = sums_xy.reshape(n_features, n_windows, -1).sum(axis=1)
+    return solve_normal_equations(sums_xx, sums_xy)
+
+
+def solve_normal_equations(sums_xx, sums_xy):
+    """Solve stacked normal equations given the power sums Σx^k (k <= 2d) and Σx^k·y (k <= d)."""
+    sums_xx = np.atleast_2d(sums_xx)
+    sums_xy = np.atleast_2d(sums_xy)
+    degree = sums_xy.shape[-1] - 1
+    exponents = np.add.outer(np.arange(degree + 1), np.arange(degree + 1))
+    matrices = sums_xx[:, exponents]
+
+    # a fit needs more than `degree` distinct pixels, everything else is left undetermined
+    valid = sums_xx[:, 0] > degree
+    matrices[~valid] = np.eye(degree + 1)
+    coefficients = np.linalg.solve(matrices, sums_xy[..., np.newaxis])[..., 0]
+    coefficients[~valid] = np.nan
+    return coefficients[:, ::-1]
+
+
+def evaluate_continuum(coefficients, dx, out=None):
+    """Evaluate polynomial coefficients (highest power first) at `dx`, broadcasting over leading axes.
+
+    The result is written into `out` if given, which must not overlap with `dx`.
+    """
+    coefficients = np.asarray(coefficients, dtype=float)
+    if out is None:
+        out = np.empty(np.broadcast(coefficients[..., 0], dx).shape)
+    # Horner scheme in place
+    out[...] = coefficients[..., 0]
+    for i in range(1, coefficients.shape[-1]):
+        out *= dx
+        out += coefficients[..., i]
+    return out
+
+
+def normalize(xs, ys, coefficients, center, ys_fit=None, ys_norm=None, bounds=None):
+    """Return the fitted continuum and the normalized flux.
+
+    Results are written into `ys_fit` and `ys_norm` if given, so the same arrays can be reused across fits.
+    With index `bounds` only the pixels in [indmin, indmax) are evaluated and the rest is set to NaN.
+    """
+    if ys_fit is None:
+        ys_fit = np.empty(len(xs))
+    if ys_norm is None:
+        ys_norm = np.empty(len(xs))
+    indmin, indmax = (0, len(xs)) if bounds is None else bounds
+    if bounds is not None:
+        ys_fit[:indmin] = ys_fit[indmax:] = np.nan
+        ys_norm[:indmin] = ys_norm[indmax:] = np.nan
+
+    fit = ys_fit[indmin:indmax]
+    norm = ys_norm[indmin:indmax]
+    # `norm` serves as scratch space for x - center before it receives the normalized flux
+    np.subtract(xs[indmin:indmax], center, out=norm)
+    evaluate_continuum(coefficients, norm, out=fit)
+    np.divide(ys[indmin:indmax], fit, out=norm)
+    return ys_fit, ys_norm
+
+
+def to_polyfit_coefficients(coefficients, center):
+    """Convert coefficients in `x - center` into plain `np.polyfit` coefficients in `x`."""
+    polynomial = np.poly1d([0.])
+    for c in coefficients:
+        polynomial = polynomial * np.poly1d([1., -center]) + c
+    return np.concatenate([np.zeros(len(coefficients) - len(polynomial.coeffs)), polynomial.coeffs])
+
+
+class ContinuumFit:
+    """Polynomial continuum fit that is updated incrementally from its normal equations.
+
+    Adding or removing a window of pixels only touches the pixels of that window, solving is independent of
+    the number of fitted pixels. Coefficients are identical to `fit_continuum` for the same windows.
+    """
+    def __init__(self, xs, ys, center, degree=1):
+        self.xs = xs
+        self.ys = ys
+        self.center = center
+        self.degree = degree
+        self.windows = []
+        self.sums_xx = np.zeros(2 * degree + 1)
+        self.sums_xy = np.zeros(degree + 1)
+        self._coefficients = None
+
+    def add(self, indmin, indmax):
+        sums_xx, sums_xy = window_sums(self.xs, self.ys, [(indmin, indmax)], self.center, self.degree)
+        self.sums_xx += sums_xx[0]
+        self.sums_xy += sums_xy[0]
+        self.windows.append((indmin, indmax))
+        self._coefficients = None
+
+    def remove(self, indmin, indmax):
+        self.windows.remove((indmin, indmax))
+        sums_xx, sums_xy = window_sums(self.xs, self.ys, [(indmin, indmax)], self.center, self.degree)
+        self.sums_xx -= sums_xx[0]
+        self.sums_xy -= sums_xy[0]
+        if not self.windows:
+            # drop the rounding residue of the subtractions
+            self.sums_xx[:] = 0
+            self.sums_xy[:] = 0
+        self._coefficients = None
+
+    def undo(self):
+        if self.windows:
+            self.remove(*self.windows[-1])
+
+    @property
+    def coefficients(self):
+        """Coefficients in `x - center`, highest power first."""
+        if self._coefficients is None:
+            self._coefficients = solve_normal_equations(self.sums_xx, self.sums_xy)[0]
+        return self._coefficients
+
+    @property
+    def polyfit_coefficients(self):
+        """Coefficients in `x` as returned by `np.polyfit`, i.e. `k, d` for a linear continuum."""
+        return to_polyfit_coefficients(self.coefficients, self.center)
+
+    @property
+    def slope(self):
+        return self.coefficients[-2] if self.degree > 0 else 0.
+
+    @property
+    def xs_data(self):
+        return np.concatenate([self.xs[indmin:indmax] for indmin, indmax in self.windows] + [[]])
+
+    @property
+    def ys_data(self):
+        return np.concatenate([self.ys[indmin:indmax] for indmin, indmax in self.windows] + [[]])
+
+
+class ContinuumTemplate:
+    """A continuum definition mapped onto one wavelength grid, to normalize any number of spectra on that grid.
+
+    The ranges of every region are mapped onto pixel indices once and the least squares solution of the
+    region polynomial is precomputed, so fitting a batch of spectra costs one matrix product per region.
+    Inside a region (from its first to its last range) the continuum is the region polynomial, between regions
+    it is interpolated linearly between the ends of the neighbouring regions and outside it is NaN. The
+    `definition` is a `nifty.io.ContinuumDefinition`, e.g. read from a `.cont` file. `x_scale` converts the
+    wavelengths of the definition into the units of `xs` (e.g. 1e-3 from nm to micron).
+    """
+    def __init__(self, definition, xs, x_scale=1.):
+        self.xs = np.asarray(xs, dtype=float)
+        self.regions = []
+        for ranges, order in zip(definition.regions, definition.orders):
+            ranges = np.asarray(ranges, dtype=float).reshape(-1, 2) * x_scale
+            # ranges include both ends
+            bounds = np.stack([np.searchsorted(self.xs, ranges[:, 0], side='left'),
+                               np.searchsorted(self.xs, ranges[:, 1], side='right')], axis=1)
+            pixels, _ = concatenate_ranges(bounds)
+            if len(pixels) <= order:
+                continue
+            indmin, indmax = bounds[0, 0], bounds[-1, 1]
+            # polynomials in (x - center) / scale keep the high orders well conditioned
+            center = 0.5 * (self.xs[indmin] + self.xs[indmax - 1])
+            scale = max(0.5 * (self.xs[indmax - 1] - self.xs[indmin]), np.finfo(float).tiny)
+            solver = np.linalg.pinv(np.vander((self.xs[pixels] - center) / scale, order + 1))
+            design = np.vander((self.xs[indmin:indmax] - center) / scale, order + 1)
+            self.regions.append((pixels, indmin, indmax, solver, design))
+
+    def continuum(self, ys):
+        """Return the continua of spectra `ys` with shape (n,) or (n_spectra, n)."""
+        ys = np.asarray(ys, dtype=float)
+        flux = np.atleast_2d(ys)
+        continuum = np.full(flux.shape, np.nan)
+        for pixels, indmin, indmax, solver, design in self.regions:
+            coefficients = solver @ flux[:, pixels].T
+            continuum[:, indmin:indmax] = (design @ coefficients).T
+
+        for (_, _, start, _, _), (_, stop, _, _, _) in zip(self.regions[:-1], self.regions[1:]):
+            if stop <= start:
+                continue
+            weights = (self.xs[start:stop] - self.xs[start - 1]) / (self.xs[stop] - self.xs[start - 1])
+            continuum[:, start:stop] = (continuum[:, start - 1, np.newaxis] * (1 - weights)
+                                        + continuum[:, stop, np.newaxis] * weights)
+        return continuum.reshape(ys.shape)
+
+    def normalize(self, ys):
+        """Return the continua and the normalized flux of spectra `ys` with shape (n,) or (n_spectra, n)."""
+        ys_fit = self.continuum(ys)
+        return ys_fit, ys / ys_fit
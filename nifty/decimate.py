@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def _minmax_pairs(ys, mins, maxs):
+    # merge neighbouring bins pairwise, an odd bin at the end is merged with itself
+    if len(mins) % 2:
+        mins = np.append(mins, mins[-1])
+        maxs = np.append(maxs, maxs[-1])
+    a, b = mins[0::2], mins[1::2]
+    mins = np.where(ys[a] <= ys[b], a, b)
+    a, b = maxs[0::2], maxs[1::2]
+    maxs = np.where(ys[a] >= ys[b], a, b)
+    return mins, maxs
+
+
+def _points(mins, maxs):
+    # the extrema of every bin in pixel order, so the decimated line still runs from left to right
+    return np.sort(np.stack([mins, maxs], axis=1), axis=1).ravel()
+
+
+def minmax_decimate(xs, ys, max_points):
+    """Reduce a line to at most ~`max_points` points keeping the minimum and maximum of every bin."""
+    if len(xs) <= max_points:
+        return xs, ys
+    bin_size = int(np.ceil(2 * len(xs) / max_points))
+    n_bins = int(np.ceil(len(xs) / bin_size))
+    padded = np.full(n_bins * bin_size, np.nan)
+    padded[:len(ys)] = ys
+    bins = padded.reshape(n_bins, bin_size)
+    offsets = np.arange(n_bins) * bin_size
+    with np.errstate(invalid='ignore'):
+        mins = offsets + np.argmin(np.where(np.isnan(bins), np.inf, bins), axis=1)
+        maxs = offsets + np.argmax(np.where(np.isnan(bins), -np.inf, bins), axis=1)
+    indices = _points(np.minimum(mins, len(xs) - 1), np.minimum(maxs, len(xs) - 1))
+    return xs[indices], ys[indices]
+
+
+class MinMaxPyramid:
+    """Min/max preserving decimation levels of a spectrum for drawing it at any zoom.
+
+    Level l keeps the minimum and maximum pixel of bins of 2^(l + 1) pixels, so narrow absorption features
+    stay visible at every level. All levels are built once in O(n) by merging the bins of the previous level.
+    """
+    def __init__(self, xs, ys):
+        self.xs = xs
+        self.ys = ys
+        self.levels = []
+
+        n = len(xs)
+        mins = maxs = np.arange(n)
+        while len(mins) > 2:
+            mins, maxs = _minmax_pairs(ys, mins, maxs)
+            if len(mins) * 2 < n:
+                self.levels.append(_points(mins, maxs))
+
+    def select(self, xmin, xmax, max_points):
+        """Return the points in [xmin, xmax] of the finest level with at most `max_points` of them."""
+        indmin, indmax = np.searchsorted(self.xs, (xmin, xmax))
+        if indmax - indmin <= max_points or not self.levels:
+            indices = slice(max(0, indmin - 1), indmax + 1)
+            return self.xs[indices], self.ys[indices]
+
+        for level in self.levels:
+            start, stop = np.searchsorted(level, (indmin, indmax))
+            if stop - start <= max_points:
+                break
+        # one point beyond each side keeps the line running to the edges of the axis
+        indices = level[max(0, start - 1):stop + 1]
+        return self.xs[indices], self.ys[indices]
@@ -0,0 +1,164 @@
+import numpy as np
+
+from nifty.continuum import concatenate_ranges, evaluate_continuum
+
+
+def pixel_edges(xs):
+    """Return the n + 1 pixel edges of a (possibly non-uniform) wavelength grid, halfway between pixels."""
+    xs = np.asarray(xs, dtype=float)
+    edges = np.empty(len(xs) + 1)
+    edges[1:-1] = 0.5 * (xs[1:] + xs[:-1])
+    edges[0] = xs[0] - (edges[1] - xs[0])
+    edges[-1] = xs[-1] + (xs[-1] - edges[-2])
+    return edges
+
+
+def pixel_widths(xs, pixels=None):
+    """Return the widths of all pixels, or only of the given pixel indices."""
+    if pixels is None:
+        return np.diff(pixel_edges(xs))
+    # half the distance between the neighbours, at the ends of the grid the distance to the one neighbour
+    lower = xs[np.maximum(pixels - 1, 0)]
+    upper = xs[np.minimum(pixels + 1, len(xs) - 1)]
+    widths = 0.5 * (upper - lower)
+    ends = (pixels == 0) | (pixels == len(xs) - 1)
+    widths[ends] *= 2
+    return widths
+
+
+def equivalent_widths(xs, ys, bounds, coefficients, centers, groups=None, errors=None):
+    """Measure the equivalent width of absorption windows against local polynomial continua.
+
+    `bounds` holds the index bounds of the integration windows with shape (n_windows, 2). Window i is
+    normalized with the continuum `coefficients[groups[i]]` fitted around `centers[groups[i]]`, by default
+    every window has its own continuum. The EW integrates 1 - F/Fc over whole pixels weighted by their width.
+    If the flux `errors` are given, the EW uncertainties are returned as well.
+    """
+    bounds = np.asarray(bounds, dtype=int).reshape(-1, 2)
+    coefficients = np.atleast_2d(coefficients)
+    centers = np.atleast_1d(np.asarray(centers, dtype=float))
+    if groups is None:
+        groups = np.arange(len(bounds))
+
+    pixels, windows = concatenate_ranges(bounds)
+    features = np.asarray(groups, dtype=int)[windows]
+    ys_fit = evaluate_continuum(coefficients[features], xs[pixels] - centers[features])
+    widths = pixel_widths(xs, pixels)
+    ews = np.bincount(windows, weights=(1 - ys[pixels] / ys_fit) * widths, minlength=len(bounds))
+    if errors is None:
+        return ews
+    variances = np.bincount(windows, weights=(errors[pixels] / ys_fit * widths) ** 2, minlength=len(bounds))
+    return ews, np.sqrt(variances)
+
+
+class EWIntegrator:
+    """Equivalent widths of arbitrary wavelength windows of one normalized spectrum.
+
+    The integral of 1 - F/Fc is precomputed once as prefix sums over the spectrum, afterwards every window
+    costs two lookups independent of its width. With `method='edges'` every pixel is a box between its edges
+    (partially covered pixels count with their covered fraction), with `method='trapezoid'` the depth is
+    interpolated linearly between pixel centers. `errors` are the uncertainties of the normalized flux.
+    Windows overlapping pixels that are not finite are NaN, the others are not affected by them.
+
+    Either way the EW is a weighted sum of the pixel depths, the weight of a pixel being the integral of its
+    box or hat function over the window. The variance sums the squared errors times these weights: for the
+    pixels covered completely from prefix sums, for the at most four partially covered pixels at the window
+    ends directly.
+    """
+    def __init__(self, xs, ys_norm, errors=None, method='edges'):
+        if method not in ('edges', 'trapezoid'):
+            raise ValueError(f'Unknown integration method "{method}".')
+        self.method = method
+        self.xs = np.asarray(xs, dtype=float)
+        depth = 1 - np.asarray(ys_norm, dtype=float)
+        invalid = ~np.isfinite(depth)
+        self.depth = np.where(invalid, 0., depth)
+
+        edges = pixel_edges(self.xs)
+        widths = np.diff(edges)
+        if method == 'edges':
+            self.nodes = edges
+            self.cumulative = np.concatenate([[0.], np.cumsum(self.depth * widths)])
+            # support of the box of every pixel
+            self.lows, self.highs = edges[:-1], edges[1:]
+        else:
+            self.nodes = self.xs
+            steps = np.diff(self.xs)
+            self.cumulative = np.concatenate([[0.], np.cumsum(0.5 * (self.depth[1:] + self.depth[:-1]) * steps)])
+            # support of the hat of every pixel, from the previous to the next pixel within the grid
+            self.lows = np.concatenate([self.xs[:1], self.xs[:-1]])
+            self.highs = np.concatenate([self.xs[1:], self.xs[-1:]])
+
+        self.edges = edges
+        self.errors = None
+        if errors is not None:
+            errors = np.asarray(errors, dtype=float)
+            invalid |= ~np.isfinite(errors)
+            self.errors = np.where(invalid, 0., errors)
+            full = self._weights(np.arange(len(self.xs)), self.nodes[-1]) - self._weights(np.arange(len(self.xs)),
+                                                                                          self.nodes[0])
+            self.cumulative_variance = np.concatenate([[0.], np.cumsum((self.errors * full) ** 2)])
+        self.cumulative_invalid = np.concatenate([[0], np.cumsum(invalid)])
+
+    def _integral(self, x):
+        # integral of the depth from the first node up to x
+        x = np.clip(x, self.nodes[0], self.nodes[-1])
+        i = np.clip(np.searchsorted(self.nodes, x, side='right') - 1, 0, len(self.nodes) - 2)
+        dx = x - self.nodes[i]
+        if self.method == 'edges':
+            return self.cumulative[i] + self.depth[i] * dx
+        slope = (self.depth[i + 1] - self.depth[i]) / (self.nodes[i + 1] - self.nodes[i])
+        return self.cumulative[i] + dx * (self.depth[i] + 0.5 * slope * dx)
+
+    def _weights(self, pixels, x):
+        # integral of the box or hat function of `pixels` from the start of their support up to x
+        lows, highs = self.lows[pixels], self.highs[pixels]
+        if self.method == 'edges':
+            return np.clip(x, lows, highs) - lows
+        centers = self.xs[pixels]
+        left = np.clip(x, lows, centers) - lows
+        right = np.clip(x, centers, highs) - centers
+        with np.errstate(divide='ignore', invalid='ignore'):
+            left = np.where(centers > lows, 0.5 * left ** 2 / (centers - lows), 0.)
+            right = np.where(highs > centers, right - 0.5 * right ** 2 / (highs - centers), 0.)
+        return left + right
+
+    def _partial_pixels(self, x):
+        # the pixels whose support contains x inside, at most one box or two hats
+        first = np.searchsorted(self.highs, x, side='right')
+        stop = np.searchsorted(self.lows, x, side='left')
+        pixels = first[:, np.newaxis] + np.arange(1 if self.method == 'edges' else 2)
+        return pixels, pixels < stop[:, np.newaxis]
+
+    def _variances(self, ranges):
+        lower, upper = ranges[:, 0], ranges[:, 1]
+        # pixels with their whole support inside the window
+        start = np.searchsorted(self.lows, lower, side='left')
+        stop = np.maximum(np.searchsorted(self.highs, upper, side='right'), start)
+        variances = self.cumulative_variance[stop] - self.cumulative_variance[start]
+
+        lower_pixels, lower_valid = self._partial_pixels(lower)
+        upper_pixels, upper_valid = self._partial_pixels(upper)
+        # a pixel containing both ends is only counted once
+        upper_valid &= ~np.any((upper_pixels[:, :, np.newaxis] == lower_pixels[:, np.newaxis, :])
+                               & lower_valid[:, np.newaxis, :], axis=2)
+        for pixels, valid in ((lower_pixels, lower_valid), (upper_pixels, upper_valid)):
+            pixels = np.minimum(pixels, len(self.xs) - 1)
+            weights = self._weights(pixels, upper[:, np.newaxis]) - self._weights(pixels, lower[:, np.newaxis])
+            variances += np.where(valid, (self.errors[pixels] * weights) ** 2, 0.).sum(axis=1)
+        return variances
+
+    def measure(self, ranges):
+        """Return the EWs (and uncertainties if errors were given) of wavelength ranges of shape (n, 2)."""
+        ranges = np.clip(np.asarray(ranges, dtype=float).reshape(-1, 2), self.nodes[0], self.nodes[-1])
+        ews = self._integral(ranges[:, 1]) - self._integral(ranges[:, 0])
+        # pixels whose support overlaps the window
+        start = np.searchsorted(self.highs, ranges[:, 0], side='right')
+        stop = np.maximum(np.searchsorted(self.lows, ranges[:, 1], side='left'), start)
+        invalid = self.cumulative_invalid[stop] > self.cumulative_invalid[start]
+        ews[invalid] = np.nan
+        if self.errors is None:
+            return ews
+        errors = np.sqrt(self._variances(ranges))
+        errors[invalid] = np.nan
+        return ews, errors
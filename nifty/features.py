@@ -0,0 +1,74 @@
+import numpy as np
+
+from nifty.continuum import get_indices
+
+
+class FeatureIndex:
+    """Sorted absorption feature list with the pixel bounds of every feature region.
+
+    The region of a feature at `x` is `x * (1 -+ x_range_factor)`, like the DIB region shown by `PlotUI`, the
+    region with a margin m is widened by m times its half width on each side. The bounds of the regions and of
+    those with the `margins` in use (e.g. the normalized region) are computed for all features at once
+    whenever the grid, the range factor or the margins change. Range queries (also of the features blended
+    into integration windows) are binary searches.
+    """
+    def __init__(self, features, xs=None, x_range_factor=0.1, margins=()):
+        self.features = np.sort(np.asarray(features, dtype=float))
+        self.xs = None
+        self.x_range_factor = None
+        self.margins = ()
+        self.lows = self.highs = self.bounds = None
+        self.margin_bounds = {}
+        self.update(xs, x_range_factor, margins)
+
+    def __len__(self):
+        return len(self.features)
+
+    def __getitem__(self, i):
+        return self.features[i]
+
+    def update(self, xs=None, x_range_factor=None, margins=None):
+        if xs is not None:
+            self.xs = xs
+        if x_range_factor is not None:
+            self.x_range_factor = x_range_factor
+        if margins is not None:
+            self.margins = tuple(margins)
+        self.lows, self.highs = self.region(self.features).T
+        if self.xs is not None:
+            self.bounds = get_indices(self.xs, np.stack([self.lows, self.highs], axis=1))
+            self.margin_bounds = {margin: get_indices(self.xs, self.region(self.features, margin))
+                                  for margin in self.margins}
+
+    def region(self, feature, margin=0.):
+        """Return the region of `feature` (or of an array of features) widened by `margin`, shape (..., 2)."""
+        factor = self.x_range_factor * (1 + margin)
+        feature = np.asarray(feature, dtype=float)
+        return np.stack([feature * (1 - factor), feature * (1 + factor)], axis=-1)
+
+    def region_bounds(self, i, margin=0.):
+        """Return the pixel bounds of the region of feature `i` widened by `margin`, precomputed if in use."""
+        if margin == 0:
+            return self.bounds[i]
+        if margin in self.margin_bounds:
+            return self.margin_bounds[margin][i]
+        return get_indices(self.xs, self.region(self.features[i], margin))
+
+    def in_range(self, xmin, xmax):
+        """Return the indices of the features in [xmin, xmax] as slice."""
+        start = np.searchsorted(self.features, xmin, side='left')
+        stop = np.searchsorted(self.features, xmax, side='right')
+        return slice(start, stop)
+
+    def in_ranges(self, ranges):
+        """Return the index bounds [start, stop) of the features in every wavelength range of shape (..., 2).
+
+        A range holding more than one feature, e.g. an integration window, covers a blend.
+        """
+        ranges = np.asarray(ranges, dtype=float)
+        return np.stack([np.searchsorted(self.features, ranges[..., 0], side='left'),
+                         np.searchsorted(self.features, ranges[..., 1], side='right')], axis=-1)
+
+    def blended(self, xmin, xmax, feature):
+        """Return the features other than `feature` in [xmin, xmax], blended into an integration window."""
+        return [other for other in self.features[self.in_range(xmin, xmax)].tolist() if other != feature]
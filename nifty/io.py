@@ -1,32 +1,228 @@
 import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
-from astropy.io import fits
+import numpy as np
 
+from nifty.timing import timed
 
-def read_2d_fits_spectrum(self, input_file, xkey="lambda", ykey="flux"):
-    xs = None
-    ys = None
-    # Search FITS data for data keys
-    data_keys = [xkey, ykey]
-    fits_file = fits.open(input_file)
-    with fits.open(input_file) as fits_file:
-        for hdu in fits_file:
-            if hdu.data is None:
-                continue
-            if not hasattr(hdu.data, 'names'):
-                continue
 
-            if xkey in hdu.data.names:
-                xs = hdu.data[xkey]
-            if ykey in hdu.data.names:
-                ys = hdu.data[ykey]
+FITS_CACHE_SIZE = 32
+NORM_CACHE_SUFFIX = '.npy'
+PROVENANCE_SUFFIX = '.json'
+DEFAULT_FEATURES = 'dibs'
+CONT_SEPARATOR = '#===================================='
+
+# a continuum definition as stored in `.cont` files: the wavelength ranges (n, 2) of every region, the
+# polynomial degree of every region and the separate continuum points (n, 2) if any
+ContinuumDefinition = namedtuple('ContinuumDefinition', ['regions', 'orders', 'separate_points'])
+
+
+class LRUCache:
+    # shared by the main and the prefetch thread, every access is locked and evicted values are handed to
+    # `on_evict` after releasing the lock
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        evicted = []
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                evicted.append(self.items.popitem(last=False)[1])
+        self._evict(evicted)
+
+    def clear(self):
+        with self.lock:
+            evicted = list(self.items.values())
+            self.items.clear()
+        self._evict(evicted)
+
+    def _evict(self, values):
+        if self.on_evict is not None:
+            for value in values:
+                self.on_evict(value)
+
+
+# open (memory mapped) FITS files keyed by the path and its stat (mtime in ns, size and inode) and the columns
+# read from them keyed by the file key plus (xkey, ykey, native); a rewritten file gets a fresh entry, also
+# within the resolution of the mtime as long as its size or inode differs
+_fits_handles = LRUCache(FITS_CACHE_SIZE, on_evict=lambda fits_file: fits_file.close())
+_fits_columns = LRUCache(FITS_CACHE_SIZE)
+# held while a FITS file is read, so no other thread closes its handle on eviction in the meantime
+_fits_lock = threading.RLock()
+
+
+def clear_fits_cache():
+    with _fits_lock:
+        _fits_columns.clear()
+        _fits_handles.clear()
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _open_fits(file_key):
+    fits_file = _fits_handles.get(file_key)
+    if fits_file is None:
+        from astropy.io import fits  # astropy is only imported when FITS files are read
+        fits_file = fits.open(file_key[0], memmap=True)
+        _fits_handles.put(file_key, fits_file)
+    return fits_file
+
+
+def _find_columns(fits_file, xkey, ykey):
+    # like the reader before caching: x and y may come from different table HDUs, the search stops at the
+    # first HDU completing both; only headers are inspected, the table data is not touched until accessed
+    xs = ys = None
+    for hdu in fits_file:
+        names = hdu.columns.names if hasattr(hdu, 'columns') and hdu.size else []
+        if xkey in names:
+            xs = hdu.data.field(xkey)
+        if ykey in names:
+            ys = hdu.data.field(ykey)
+        if xs is not None and ys is not None:
+            return xs, ys
+    return None
+
+
+def _as_float64(column, native):
+    column = np.asarray(column)
+    if column.dtype.kind != 'f' or column.dtype.itemsize != 8 or (native and not column.dtype.isnative):
+        column = column.astype(np.float64)
+    else:
+        column = column.view()
+    # cached columns are shared between callers
+    column.flags.writeable = False
+    return column
+
+
+@timed('io.read_fits')
+def read_2d_fits_spectrum(input_file, xkey="lambda", ykey="flux", native=False):
+    """Read x and y columns of the FITS tables of a file as read-only float64 arrays.
+
+    The columns are taken from the first table HDUs holding them, they may be in different HDUs. The file is
+    memory mapped and the columns are returned as views of the table (FITS data is big-endian), only with
+    `native` or for non float64 columns they are converted. Results are cached, reading an unmodified file
+    again returns the cached arrays. Files are read by one thread at a time.
+    """
+    file_key = _file_key(os.path.abspath(input_file))
+    key = file_key + (xkey, ykey, native)
+    columns = _fits_columns.get(key)
+    if columns is not None:
+        return columns
+
+    with _fits_lock:
+        columns = _find_columns(_open_fits(file_key), xkey, ykey)
+        if columns is None:
+            raise ValueError(f'No table columns "{xkey}" and "{ykey}" found in "{input_file}".')
+        columns = _as_float64(columns[0], native), _as_float64(columns[1], native)
+        _fits_columns.put(key, columns)
+    return columns
+
+
+def norm_cache_path(input_file):
+    return input_file + NORM_CACHE_SUFFIX
+
+
+def write_norm_cache(output_file, xs, ys_norm, ys_fit=None, provenance=None, errors=None):
+    """Write a normalized spectrum as binary cache, a (4, n) float64 array of wave, norm, continuum and errors.
+
+    A missing continuum or missing flux errors are stored as NaN. Provenance information is stored next to it
+    in a small JSON file.
+    """
+    if ys_fit is None:
+        ys_fit = np.full(len(xs), np.nan)
+    if errors is None:
+        errors = np.full(len(xs), np.nan)
+    # write to a temporary file and swap it in, an existing cache may still be memory mapped (even by the caller)
+    with open(output_file + '.tmp', 'wb') as f:
+        np.save(f, np.stack([xs, ys_norm, ys_fit, errors]).astype(np.float64))
+    os.replace(output_file + '.tmp', output_file)
+    provenance = dict(provenance or {})
+    provenance.setdefault('created', time.strftime('%Y-%m-%dT%H:%M:%S'))
+    with open(output_file + PROVENANCE_SUFFIX, 'w') as f:
+        json.dump(provenance, f)
+
 
-            if xs is not None and ys is not None:
-                break
+def write_spectrum_cache(output_file, xs, ys, errors=None, provenance=None, normalized=False):
+    """Write a spectrum with flux errors (e.g. stitched arms) in the cache format, without a continuum.
 
-    if xs is None or ys is None:
-        raise ValueError()
-    return xs, ys
+    `read_spectrum` reports the spectrum as `normalized`.
+    """
+    write_norm_cache(output_file, xs, ys, provenance=dict(provenance or {}, normalized=normalized), errors=errors)
+
+
+@timed('io.read_norm_cache')
+def read_norm_cache(input_file):
+    """Memory map a normalized spectrum cache, returns wave, norm, continuum, flux errors and provenance.
+
+    Caches written before flux errors were stored have no errors, they are returned as NaN.
+    """
+    data = np.load(input_file, mmap_mode='r')
+    xs, ys_norm, ys_fit = data[:3]
+    errors = data[3] if len(data) > 3 else np.full(len(xs), np.nan)
+    provenance = {}
+    if os.path.isfile(input_file + PROVENANCE_SUFFIX):
+        with open(input_file + PROVENANCE_SUFFIX) as f:
+            provenance = json.load(f)
+    return xs, ys_norm, ys_fit, errors, provenance
+
+
+def read_norm_text(input_file):
+    xs, ys_norm = np.loadtxt(input_file, skiprows=1, unpack=True, ndmin=2)
+    return xs, ys_norm
+
+
+def convert_norm_file(input_file, output_file=None):
+    """Convert an ASCII `.norm` file (`wave flux` per line) into a binary normalized spectrum cache."""
+    if output_file is None:
+        output_file = norm_cache_path(input_file)
+    xs, ys_norm = read_norm_text(input_file)
+    provenance = {'source': os.path.abspath(input_file), 'source_mtime': os.path.getmtime(input_file)}
+    write_norm_cache(output_file, xs, ys_norm, provenance=provenance)
+    return output_file
+
+
+@timed('io.load_norm')
+def load_norm(input_file):
+    """Load a `.norm` file through its binary cache, converting it first if the cache is missing or stale."""
+    cache_file = norm_cache_path(input_file)
+    if not os.path.isfile(cache_file) or os.path.getmtime(cache_file) < os.path.getmtime(input_file):
+        convert_norm_file(input_file, cache_file)
+    xs, ys_norm, _, _, _ = read_norm_cache(cache_file)
+    return xs, ys_norm
+
+
+@timed('io.read_spectrum')
+def read_spectrum(input_file, xkey='lambda', ykey='flux'):
+    """Read a spectrum from a FITS table, a normalized spectrum cache or an ASCII `.norm` file.
+
+    Returns x, y and whether the spectrum is already normalized.
+    """
+    if input_file.endswith(NORM_CACHE_SUFFIX):
+        xs, ys, _, _, provenance = read_norm_cache(input_file)
+        return xs, ys, provenance.get('normalized', True)
+    if input_file.endswith('.norm'):
+        xs, ys = load_norm(input_file)
+        return xs, ys, True
+    xs, ys = read_2d_fits_spectrum(input_file, xkey=xkey, ykey=ykey)
+    return xs, ys, False
 
 
 def write_measurements_json(measurements, output_file):
@@ -35,4 +231,72 @@ def write_measurements_json(measurements, output_file):
 
 
 def read_measurements_json(input_file):
-    return json.load(input_file)
+    with open(input_file) as f:
+        return json.load(f)
+
+
+def packaged_features_path(name=DEFAULT_FEATURES):
+    """Return the path of a feature list shipped with NIFTY, independent of the working directory."""
+    # the package is installed unzipped (zip_safe=False), its resources are plain files next to this module
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', name)
+
+
+def read_features(input_file=None):
+    """Read a feature list (one wavelength per line after a header line), by default the packaged DIB list."""
+    if input_file is None:
+        input_file = packaged_features_path()
+    return np.loadtxt(input_file, skiprows=1, ndmin=1).tolist()
+
+
+def write_windows_json(windows, output_file):
+    with open(output_file, 'w') as f:
+        json.dump(windows, f)
+
+
+def read_windows_json(input_file):
+    with open(input_file) as f:
+        return json.load(f)
+
+
+def _format_cont_values(values):
+    return ''.join(f'{value:8.3f} ' for value in values)
+
+
+def read_cont(input_file):
+    """Read a continuum definition (`.cont`) file with the continuum ranges grouped in regions.
+
+    Every line of the 'Ranges grouped in regions' section holds the (start, end) pairs of one region and the
+    'Orders' section the polynomial degree of every region.
+    """
+    sections = {}
+    section = None
+    with open(input_file) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(CONT_SEPARATOR):
+                continue
+            if line.startswith('#'):
+                section = line.lstrip('#').strip()
+                sections[section] = []
+            elif section is not None:
+                sections[section].append([float(value) for value in line.split()])
+
+    lines = sections.get('Ranges grouped in regions', [])
+    if any(len(values) % 2 for values in lines):
+        raise ValueError(f'Odd number of range limits in "{input_file}".')
+    regions = [np.reshape(values, (-1, 2)) for values in lines]
+    orders = [int(order) for values in sections.get('Orders', []) for order in values]
+    if len(orders) != len(regions):
+        raise ValueError(f'{len(regions)} regions but {len(orders)} orders in "{input_file}".')
+    points = [value for values in sections.get('SeparatePoints', []) for value in values]
+    return ContinuumDefinition(regions, orders, np.reshape(points, (-1, 2)))
+
+
+def write_cont(definition, output_file):
+    lines = ['# Continuum definition file', CONT_SEPARATOR, '# Ranges grouped in regions']
+    lines += [_format_cont_values(np.ravel(ranges)) for ranges in definition.regions]
+    lines += [CONT_SEPARATOR, '# SeparatePoints']
+    lines += [_format_cont_values(point) for point in np.reshape(definition.separate_points, (-1, 2))]
+    lines += [CONT_SEPARATOR, '# Orders', ''.join(f'{order} ' for order in definition.orders), CONT_SEPARATOR]
+    with open(output_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
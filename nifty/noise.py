@@ -0,0 +1,21 @@
+import numpy as np
+
+from nifty.autocontinuum import block_quantile
+
+
+# scales the median of |2 y_i - y_i-2 - y_i+2| to the standard deviation of the noise (DER_SNR)
+DER_SNR_SCALE = 1.482602 / np.sqrt(6.)
+NOISE_WIDTH = 201
+
+
+def estimate_noise(ys, width=NOISE_WIDTH):
+    """Estimate the noise of every pixel of a spectrum from the flux itself.
+
+    The DER_SNR estimator (the scaled median of second differences over 4 pixels) is evaluated in blocks of
+    `width` pixels with `block_quantile`, so the noise follows the S/N along the spectrum. NaN pixels are
+    ignored.
+    """
+    ys = np.asarray(ys, dtype=float)
+    differences = np.full(len(ys), np.nan)
+    differences[2:-2] = np.abs(2 * ys[2:-2] - ys[:-4] - ys[4:])
+    return DER_SNR_SCALE * block_quantile(differences, width)
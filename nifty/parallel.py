@@ -0,0 +1,56 @@
+import logging
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _run_chunk(func, chunk):
+    # errors are caught per job so one failing input does not take down its whole chunk or the pool
+    outcomes = []
+    for job in chunk:
+        try:
+            outcomes.append((func(job), None))
+        except Exception:
+            # the traceback ends with the exception type and message
+            outcomes.append((None, traceback.format_exc()))
+    return outcomes
+
+
+def _chunks(jobs, chunksize):
+    return [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+
+
+def run_parallel(func, jobs, workers=None, chunksize=1, ordered=True):
+    """Run `func` on every job in a process pool and yield `(job, result, error)` tuples.
+
+    `func` has to be picklable (a module level function or a `functools.partial` of one). Jobs are sent to the
+    workers in chunks of `chunksize`; with `ordered` the outcomes are yielded in job order, otherwise as soon as
+    their chunk completes. A job raising an exception yields `result=None` and the formatted traceback as
+    `error`. With `workers=1` everything runs in the calling process.
+    """
+    jobs = list(jobs)
+    chunks = _chunks(jobs, max(1, chunksize))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(chunks))
+
+    if workers <= 1:
+        for chunk in chunks:
+            for job, (result, error) in zip(chunk, _run_chunk(func, chunk)):
+                yield job, result, error
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_chunk, func, chunk): chunk for chunk in chunks}
+        for future in (futures if ordered else as_completed(futures)):
+            chunk = futures[future]
+            try:
+                outcomes = future.result()
+            except Exception as e:
+                # the worker itself died (e.g. killed or unpicklable result), fail the jobs of this chunk only
+                outcomes = [(None, f'{type(e).__name__}: {e}')] * len(chunk)
+            for job, (result, error) in zip(chunk, outcomes):
+                yield job, result, error
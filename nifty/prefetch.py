@@ -0,0 +1,48 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from nifty.io import LRUCache
+
+
+# number of prefetched results kept per prefetcher, older ones are dropped
+PREFETCH_CACHE_SIZE = 4
+
+
+def create_executor():
+    """Return the single background thread prefetchers of an interactive session share."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='nifty-prefetch')
+
+
+class Prefetcher:
+    """Compute values in a background thread before they are needed, e.g. the next spectrum of a session.
+
+    `prefetch(key, func, *args)` submits `func(*args)` to `executor` unless `key` is already known, `get`
+    returns the result, waiting for a running computation. A computation that is still queued when it is
+    needed is done right away instead of waiting behind the others. The results are kept in an `LRUCache` of
+    `maxsize` entries, so the memory stays flat however many items are visited; evicted computations that
+    have not started yet are cancelled. The methods are called by one thread at a time, which need not be the
+    creating one: a `PlotConfig` prepared in the prefetch thread hands its prefetcher over to the main thread.
+    """
+    def __init__(self, executor=None, maxsize=PREFETCH_CACHE_SIZE):
+        self.owns_executor = executor is None
+        self.executor = create_executor() if executor is None else executor
+        self.futures = LRUCache(maxsize, on_evict=lambda future: future.cancel())
+
+    def prefetch(self, key, func, *args):
+        if self.futures.get(key) is None:
+            self.futures.put(key, self.executor.submit(func, *args))
+
+    def get(self, key, func, *args):
+        future = self.futures.get(key)
+        if future is not None and not future.cancel():
+            return future.result()
+        value = func(*args)
+        future = Future()
+        future.set_result(value)
+        self.futures.put(key, future)
+        return value
+
+    def close(self):
+        """Drop all results and cancel the pending computations (and the own executor)."""
+        self.futures.clear()
+        if self.owns_executor:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,265 @@
+from collections import namedtuple
+
+import numpy as np
+
+from nifty.continuum import concatenate_ranges, evaluate_continuum
+
+
+# parameters of one absorption component, the profile is scaled to a central depth of `depth`
+PROFILE_PARAMETERS = {'gaussian': ('center', 'sigma', 'depth'), 'voigt': ('center', 'sigma', 'gamma', 'depth')}
+# FWHM of a Gaussian in units of sigma
+GAUSSIAN_FWHM = 2 * np.sqrt(2 * np.log(2))
+
+# parameters and covariances of the fitted components with shape (n_windows, n_components, n_parameters) and
+# (n_windows, n_components * n_parameters, n_components * n_parameters), chi square and degrees of freedom
+ProfileFit = namedtuple('ProfileFit', ['profile', 'parameters', 'covariances', 'chi2', 'dof', 'converged'])
+
+
+def pad_windows(xs, ys, bounds, errors=None, coefficients=None, centers=None):
+    """Gather pixel windows of different lengths into padded arrays of shape (n_windows, longest window).
+
+    Returns x, y and the weights of every pixel, the inverse variances if `errors` are given and ones
+    otherwise. With continuum `coefficients` of every window (in `x - centers`, like `fit_continuum`) flux
+    and errors are normalized. Padding and non finite pixels have a weight of zero.
+    """
+    bounds = np.asarray(bounds, dtype=int).reshape(-1, 2)
+    pixels, windows = concatenate_ranges(bounds)
+    lengths = np.bincount(windows, minlength=len(bounds))
+    positions = np.arange(len(pixels)) - (np.cumsum(lengths) - lengths)[windows]
+    shape = (len(bounds), max(lengths.max(initial=0), 1))
+
+    ys_windows = np.asarray(ys, dtype=float)[pixels]
+    weights = np.ones(len(pixels)) if errors is None else 1 / np.asarray(errors, dtype=float)[pixels] ** 2
+    if coefficients is not None:
+        centers = np.broadcast_to(np.asarray(centers, dtype=float), (len(bounds),))
+        continua = evaluate_continuum(np.atleast_2d(coefficients)[windows], xs[pixels] - centers[windows])
+        ys_windows = ys_windows / continua
+        weights = weights * continua ** 2
+    valid = np.isfinite(ys_windows) & np.isfinite(weights)
+
+    # padding repeats the first pixel, so every x is a valid wavelength
+    x = np.repeat(xs[np.minimum(bounds[:, 0], len(xs) - 1)][:, np.newaxis], shape[1], axis=1)
+    y = np.ones(shape)
+    w = np.zeros(shape)
+    x[windows, positions] = xs[pixels]
+    y[windows[valid], positions[valid]] = ys_windows[valid]
+    w[windows[valid], positions[valid]] = weights[valid]
+    return x, y, w
+
+
+def _voigt_terms(dx, parameters):
+    # Faddeeva function at the pixels and at the center, the Voigt profile is proportional to its real part
+    from scipy.special import wofz
+    sigma = np.abs(parameters[..., 1:2]) * np.sqrt(2)
+    z = (dx - parameters[..., 0:1] + 1j * np.abs(parameters[..., 2:3])) / sigma
+    z0 = 1j * np.abs(parameters[..., 2:3]) / sigma
+    return z, wofz(z), z0, wofz(z0)
+
+
+def _unit_profiles(dx, parameters, profile):
+    # profiles with a central depth of one, dx (n, 1, m) and parameters (n, k, p) give (n, k, m)
+    if profile == 'gaussian':
+        return np.exp(-0.5 * ((dx - parameters[..., 0:1]) / np.abs(parameters[..., 1:2])) ** 2)
+    _, w, _, w0 = _voigt_terms(dx, parameters)
+    return w.real / w0.real
+
+
+def _model(dx, parameters, profile):
+    return 1 - (parameters[..., -1:] * _unit_profiles(dx, parameters, profile)).sum(axis=1)
+
+
+def _jacobian(dx, parameters, profile):
+    # derivatives of the model (n, m) with respect to all parameters, shape (n, m, k * p)
+    n, k, p = parameters.shape
+    depth = parameters[..., -1:]
+    if profile == 'gaussian':
+        sigma = np.abs(parameters[..., 1:2])
+        u = (dx - parameters[..., 0:1]) / sigma
+        g = np.exp(-0.5 * u ** 2)
+        derivatives = [-depth * g * u / sigma, -depth * g * u ** 2 / parameters[..., 1:2], -g]
+    else:
+        # the derivative of the Faddeeva function is w'(z) = 2i/sqrt(pi) - 2z w(z)
+        z, w, z0, w0 = _voigt_terms(dx, parameters)
+        dw = 2j / np.sqrt(np.pi) - 2 * z * w
+        dw0 = 2j / np.sqrt(np.pi) - 2 * z0 * w0
+        profiles = w.real / w0.real
+        sigma = parameters[..., 1:2]
+        dz_dc = -1 / (np.abs(sigma) * np.sqrt(2))
+        dz_dgamma = -1j * dz_dc * np.sign(parameters[..., 2:3])
+        derivatives = [-depth * (dw * dz_dc).real / w0.real,
+                       -depth * ((-dw * z).real - profiles * (-dw0 * z0).real) / (w0.real * sigma),
+                       -depth * ((dw * dz_dgamma).real - profiles * (dw0 * dz_dgamma).real) / w0.real,
+                       -profiles]
+    derivatives = np.stack(np.broadcast_arrays(*derivatives), axis=-1)
+    return derivatives.transpose(0, 2, 1, 3).reshape(n, dx.shape[-1], k * p)
+
+
+def _normal_matrix(jacobian, w):
+    return np.matmul(jacobian.transpose(0, 2, 1) * w[:, np.newaxis, :], jacobian)
+
+
+def _pixel_sizes(x, w):
+    # mean pixel size of the valid pixels of every padded window
+    valid = w > 0
+    lows = np.where(valid, x, np.inf).min(axis=1)
+    highs = np.where(valid, x, -np.inf).max(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return lows, highs, (highs - lows) / (valid.sum(axis=1) - 1)
+
+
+def initial_parameters(x, y, w, centers, profile='gaussian', components=1):
+    """Guess the component parameters of padded windows (see `pad_windows`) from their flux.
+
+    `centers` are the initial centers, one per window or (n_windows, components). Without explicit centers
+    of several components every component starts at the deepest pixel of one of `components` equal parts of
+    the window. Depths are taken from the flux at the centers, the widths from the absorbed area of the
+    window shared by the components.
+    """
+    n = len(x)
+    lows, highs, pixel = _pixel_sizes(x, w)
+    centers = np.asarray(centers, dtype=float)
+    if centers.ndim < 2 and components > 1:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            parts = np.floor((x - lows[:, np.newaxis]) / (highs - lows)[:, np.newaxis] * components)
+        parts = parts.clip(0, components - 1)
+        in_part = (parts[:, np.newaxis, :] == np.arange(components)[:, np.newaxis]) & (w[:, np.newaxis, :] > 0)
+        deepest = np.where(in_part, y[:, np.newaxis, :], np.inf).argmin(axis=-1)
+        centers = np.take_along_axis(x, deepest, axis=1)
+    centers = np.broadcast_to(centers.reshape(n, -1), (n, components))
+
+    nearest = np.abs(x[:, np.newaxis, :] - centers[..., np.newaxis]).argmin(axis=-1)
+    depths = np.clip(1 - np.take_along_axis(y, nearest, axis=1), 1e-3, 1.)
+    area = np.clip(((1 - y) * pixel[:, np.newaxis] * (w > 0)).sum(axis=1), 0, None)[:, np.newaxis]
+    sigmas = np.maximum(area / (depths.sum(axis=1, keepdims=True) * np.sqrt(2 * np.pi)), pixel[:, np.newaxis])
+
+    parameters = [centers, sigmas * np.ones_like(centers)]
+    if profile == 'voigt':
+        parameters.append(0.1 * parameters[1])
+    parameters.append(depths)
+    return np.stack(parameters, axis=-1)
+
+
+def fit_profile_windows(x, y, w, parameters, profile='gaussian', iterations=100, tolerance=1e-6,
+                        scale_covariances=True):
+    """Fit absorption profiles to all padded windows at once with a vectorized Levenberg-Marquardt solver.
+
+    The normalized flux of window i is modelled as 1 - Σ depth·profile over the components of
+    `parameters[i]` (shape (n_windows, n_components, n_parameters), see `PROFILE_PARAMETERS`). Every
+    iteration solves the damped normal equations of all still active windows in one batch, the damping of
+    each window is adapted separately and windows leave the batch once their chi square no longer improves
+    by more than `tolerance` (relative). Covariances are scaled by the reduced chi square with
+    `scale_covariances`, for unknown (unit) weights. Windows with too few pixels get NaN parameters.
+    """
+    if profile not in PROFILE_PARAMETERS:
+        raise ValueError(f'Unknown profile "{profile}".')
+    parameters = np.array(parameters, dtype=float)
+    n, k, p = parameters.shape
+    # fit in x relative to the initial centers of the first component for a well conditioned system
+    origins = parameters[:, 0, 0].copy()
+    dx = (x - origins[:, np.newaxis])[:, np.newaxis, :]
+    parameters[..., 0] -= origins[:, np.newaxis]
+
+    dof = (w > 0).sum(axis=1) - k * p
+    # steps to profiles narrower than a tenth of a pixel are rejected, they can only fit single pixels
+    min_widths = 0.1 * _pixel_sizes(x, w)[2]
+    residuals = y - _model(dx, parameters, profile)
+    chi2 = (w * residuals ** 2).sum(axis=1)
+    damping = np.full(n, 1e-3)
+    active = dof > 0
+    converged = np.zeros(n, dtype=bool)
+    for _ in range(iterations):
+        index = np.nonzero(active)[0]
+        if not len(index):
+            break
+        jacobian = _jacobian(dx[index], parameters[index], profile)
+        hessian = _normal_matrix(jacobian, w[index])
+        gradient = np.matmul(jacobian.transpose(0, 2, 1), (w[index] * residuals[index])[..., np.newaxis])[..., 0]
+        # Marquardt scaling of the damping, the pseudo inverse copes with components of zero depth
+        damped = hessian + np.einsum('ni,ij->nij', damping[index, np.newaxis] * np.einsum('nii->ni', hessian),
+                                     np.eye(k * p))
+        steps = np.einsum('nij,nj->ni', np.linalg.pinv(damped), gradient)
+
+        trial = parameters[index] + steps.reshape(-1, k, p)
+        trial_residuals = y[index] - _model(dx[index], trial, profile)
+        trial_chi2 = (w[index] * trial_residuals ** 2).sum(axis=1)
+        widths = np.abs(trial[..., 1:-1]) > min_widths[index, np.newaxis, np.newaxis]
+        improved = (trial_chi2 < chi2[index]) & widths.all(axis=(1, 2))
+        accepted = index[improved]
+        parameters[accepted] = trial[improved]
+        residuals[accepted] = trial_residuals[improved]
+        done = (improved & (chi2[index] - trial_chi2 <= tolerance * chi2[index])) | (damping[index] > 1e10)
+        chi2[accepted] = trial_chi2[improved]
+        damping[index] = np.where(improved, damping[index] / 10, damping[index] * 10)
+        converged[index[done]] = True
+        active[index[done]] = False
+
+    jacobian = _jacobian(dx, parameters, profile)
+    covariances = np.linalg.pinv(_normal_matrix(jacobian, w))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if scale_covariances:
+            covariances *= (chi2 / dof)[:, np.newaxis, np.newaxis]
+
+    parameters[..., 0] += origins[:, np.newaxis]
+    # the widths enter the profiles as absolute values
+    parameters[..., 1:-1] = np.abs(parameters[..., 1:-1])
+    invalid = dof <= 0
+    parameters[invalid] = np.nan
+    covariances[invalid] = np.nan
+    chi2[invalid] = np.nan
+    return ProfileFit(profile, parameters, covariances, chi2, dof, converged)
+
+
+def fit_profiles(xs, ys, bounds, centers, profile='gaussian', components=1, errors=None, coefficients=None,
+                 **kwargs):
+    """Fit `components` absorption profiles to every window of a spectrum simultaneously.
+
+    `bounds` holds the index bounds of the windows with shape (n_windows, 2), `centers` the initial centers
+    (see `initial_parameters`). The flux is normalized with the continuum `coefficients` of every window
+    around its center, without them it has to be normalized already. Keyword arguments are passed on to
+    `fit_profile_windows`, the covariances are scaled by the reduced chi square unless flux `errors` are given.
+    """
+    centers = np.asarray(centers, dtype=float)
+    x, y, w = pad_windows(xs, ys, bounds, errors, coefficients, centers if centers.ndim < 2 else centers[:, 0])
+    parameters = initial_parameters(x, y, w, centers, profile, components)
+    kwargs.setdefault('scale_covariances', errors is None)
+    return fit_profile_windows(x, y, w, parameters, profile, **kwargs)
+
+
+def profile_properties(fit):
+    """Return center, FWHM, central depth and EW of every fitted component and their uncertainties.
+
+    The result maps each property to an array of shape (n_windows, n_components) and the uncertainty of
+    property `name` to `name + '_error'`. The FWHM of Voigt profiles uses the approximation of Olivero &
+    Longbothum (1977).
+    """
+    parameters = fit.parameters
+    n, k, p = parameters.shape
+    variances = np.einsum('nii->ni', fit.covariances).reshape(n, k, p)
+    errors = np.sqrt(np.clip(variances, 0, None))
+    sigma, depth = parameters[..., 1], parameters[..., -1]
+    sigma_error, depth_error = errors[..., 1], errors[..., -1]
+
+    if fit.profile == 'gaussian':
+        fwhm = GAUSSIAN_FWHM * sigma
+        fwhm_error = GAUSSIAN_FWHM * sigma_error
+        # the integral of a unit depth profile
+        area = np.sqrt(2 * np.pi) * sigma
+        area_error = np.sqrt(2 * np.pi) * sigma_error
+    else:
+        from scipy.special import voigt_profile
+        gamma, gamma_error = parameters[..., 2], errors[..., 2]
+        fwhm_gauss = GAUSSIAN_FWHM * sigma
+        fwhm_lorentz = 2 * gamma
+        root = np.sqrt(0.2166 * fwhm_lorentz ** 2 + fwhm_gauss ** 2)
+        fwhm = 0.5346 * fwhm_lorentz + root
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fwhm_error = np.hypot((0.5346 + 0.2166 * fwhm_lorentz / root) * 2 * gamma_error,
+                                  fwhm_gauss / root * GAUSSIAN_FWHM * sigma_error)
+        area = 1 / voigt_profile(0., sigma, gamma)
+        # the relative error of the area is dominated by the width, estimated like the FWHM
+        area_error = area * fwhm_error / fwhm
+
+    ew = depth * area
+    return {'center': parameters[..., 0], 'center_error': errors[..., 0], 'fwhm': fwhm, 'fwhm_error': fwhm_error,
+            'depth': depth, 'depth_error': depth_error, 'ew': ew,
+            'ew_error': np.hypot(depth_error * area, depth * area_error)}
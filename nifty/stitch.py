@@ -0,0 +1,50 @@
+import numpy as np
+
+from nifty.noise import estimate_noise
+from nifty.velocity import Resampler
+
+
+def common_grid(arms, step=None):
+    """Return a logarithmic wavelength grid covering all arms (x arrays) with the relative pixel step `step`.
+
+    By default the step is the smallest median relative pixel step of the arms, the sampling of the finest arm.
+    """
+    if step is None:
+        step = min(np.median(np.diff(xs) / xs[1:]) for xs in arms)
+    start = min(xs[0] for xs in arms)
+    stop = max(xs[-1] for xs in arms)
+    return start * np.exp(np.log1p(step) * np.arange(int(np.log(stop / start) / np.log1p(step)) + 1))
+
+
+def stitch(arms, errors=None, grid=None):
+    """Combine the spectra of several arms onto one monotonically increasing wavelength grid.
+
+    `arms` are (xs, ys) pairs in the same units, `errors` optional flux errors per arm (estimated with
+    `estimate_noise` if None). Every arm is resampled onto `grid` (by default `common_grid`), where arms
+    overlap the fluxes are averaged with inverse variance weights, i.e. weighted by their S/N squared.
+    Non finite and zero flux pixels are treated as missing. Returns the grid, the flux and its errors,
+    NaN where no arm has data.
+    """
+    arms = [(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)) for xs, ys in arms]
+    if errors is None:
+        errors = [None] * len(arms)
+    if len(errors) != len(arms):
+        raise ValueError(f'Got {len(errors)} error arrays for {len(arms)} arms.')
+    if grid is None:
+        grid = common_grid([xs for xs, _ in arms])
+
+    fluxes = np.empty((len(arms), len(grid)))
+    variances = np.empty((len(arms), len(grid)))
+    for i, ((xs, ys), ys_errors) in enumerate(zip(arms, errors)):
+        ys = np.where(ys != 0, ys, np.nan)
+        if ys_errors is None:
+            ys_errors = estimate_noise(ys)
+        resample = Resampler(xs, grid)
+        fluxes[i], variances[i] = resample(np.stack([ys, np.asarray(ys_errors, dtype=float) ** 2]))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(np.isfinite(fluxes) & (variances > 0), 1 / variances, 0.)
+        total = weights.sum(axis=0)
+        flux = np.where(total > 0, (np.where(weights > 0, fluxes, 0.) * weights).sum(axis=0) / total, np.nan)
+        flux_errors = np.where(total > 0, 1 / np.sqrt(total), np.nan)
+    return grid, flux, flux_errors
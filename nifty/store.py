@@ -0,0 +1,117 @@
+import json
+import sqlite3
+import time
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    spectrum TEXT NOT NULL,
+    feature REAL NOT NULL,
+    ew REAL,
+    ew_error REAL,
+    ew_min REAL,
+    ew_max REAL,
+    fit_ranges TEXT,
+    coefficients TEXT,
+    profile TEXT,
+    ew_percentiles TEXT,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS measurements_spectrum ON measurements (spectrum, feature);
+CREATE INDEX IF NOT EXISTS measurements_feature ON measurements (feature);
+'''
+COLUMNS = ['id', 'spectrum', 'feature', 'ew', 'ew_error', 'ew_min', 'ew_max', 'fit_ranges', 'coefficients',
+           'profile', 'ew_percentiles', 'created']
+# columns added after the first release, added to older stores when they are opened
+ADDED_COLUMNS = ['profile', 'ew_percentiles']
+
+
+def _to_json(value):
+    if value is None:
+        return None
+    return json.dumps([list(map(float, item)) if hasattr(item, '__len__') else float(item) for item in value])
+
+
+def _from_row(row):
+    record = dict(zip(COLUMNS, row))
+    ew_min, ew_max = record.pop('ew_min'), record.pop('ew_max')
+    record['ew_range'] = None if ew_min is None else (ew_min, ew_max)
+    for key in ('fit_ranges', 'coefficients', 'profile', 'ew_percentiles'):
+        if record[key] is not None:
+            record[key] = json.loads(record[key])
+    return record
+
+
+class MeasurementStore:
+    """Append-only SQLite store of EW measurements of many spectra.
+
+    Every measurement is committed when it is added and the database runs in write-ahead log mode, so a crash
+    loses at most the measurement being written and the store can be read while a session or batch is still
+    writing. Queries by spectrum and feature use indices and stream the rows from disk.
+    Coefficients are stored like `ContinuumFit.coefficients`, in `x - feature` with the highest power first,
+    profile fits as JSON dicts and Monte Carlo EW percentiles as list (see `nifty.batch.measure_records`).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        existing = [row[1] for row in self.connection.execute('PRAGMA table_info(measurements)')]
+        for column in ADDED_COLUMNS:
+            if column not in existing:
+                self.connection.execute(f'ALTER TABLE measurements ADD COLUMN {column} TEXT')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _row(self, spectrum, feature, ew, ew_range=None, fit_ranges=None, coefficients=None, ew_error=None,
+             profile=None, ew_percentiles=None):
+        ew_min, ew_max = (None, None) if ew_range is None else map(float, ew_range)
+        return (spectrum, float(feature), float(ew), None if ew_error is None else float(ew_error), ew_min, ew_max,
+                _to_json(fit_ranges), _to_json(coefficients), None if profile is None else json.dumps(profile),
+                _to_json(ew_percentiles), time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def add(self, spectrum, feature, ew, ew_range=None, fit_ranges=None, coefficients=None, ew_error=None,
+            profile=None, ew_percentiles=None):
+        self.add_many(spectrum, [dict(feature=feature, ew=ew, ew_range=ew_range, fit_ranges=fit_ranges,
+                                      coefficients=coefficients, ew_error=ew_error, profile=profile,
+                                      ew_percentiles=ew_percentiles)])
+
+    def add_many(self, spectrum, records):
+        """Append the measurement `records` (dicts with the arguments of `add`) of a spectrum at once."""
+        rows = [self._row(spectrum, **record) for record in records]
+        with self.connection:
+            self.connection.executemany(f'INSERT INTO measurements ({", ".join(COLUMNS[1:])}) '
+                                        f'VALUES ({", ".join("?" * (len(COLUMNS) - 1))})', rows)
+
+    def query(self, spectrum=None, feature=None):
+        """Iterate over the measurements of a spectrum and/or feature (all if not given) in insertion order."""
+        conditions, parameters = [], []
+        if spectrum is not None:
+            conditions.append('spectrum = ?')
+            parameters.append(spectrum)
+        if feature is not None:
+            conditions.append('feature = ?')
+            parameters.append(float(feature))
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        for row in self.connection.execute(f'SELECT {", ".join(COLUMNS)} FROM measurements{where} ORDER BY id',
+                                           parameters):
+            yield _from_row(row)
+
+    def spectra(self):
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT spectrum FROM measurements ORDER BY 1')]
+
+    def results(self, spectrum=None):
+        """Return the EWs of a spectrum (or all spectra) as dict shaped like `Measurements.results`."""
+        results = {}
+        for record in self.query(spectrum):
+            results.setdefault(str(record['feature']), []).append(record['ew'])
+        return results
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+import numpy as np
+
+from nifty.continuum import concatenate_ranges
+
+
+SyntheticSpectrum = namedtuple('SyntheticSpectrum', ['xs', 'ys', 'errors', 'features', 'sigmas', 'gammas', 'depths'])
+
+
+def create_grid(x_range=(100, 200), number_of_values=300, grid='linear'):
+    """Return a wavelength grid, 'log' gives a constant resolution grid with growing pixel widths."""
+    x_range_min, x_range_max = x_range
+    if grid == 'linear':
+        return np.linspace(x_range_min, x_range_max, number_of_values)
+    if grid == 'log':
+        return np.geomspace(x_range_min, x_range_max, number_of_values)
+    raise ValueError(f'Unknown grid "{grid}".')
+
+
+def absorption_profiles(xs, features, sigmas, depths, gammas=None, cutoff=6.):
+    """Sum absorption profiles with the given central depths, evaluated only near each line.
+
+    Every profile is evaluated within `cutoff` times its width (sigma + gamma) around its center, so the cost
+    scales with the number of pixels covered by lines rather than pixels times lines. Profiles are Gaussian
+    or, with Lorentzian `gammas`, Voigt profiles (which requires scipy).
+    """
+    features = np.asarray(features, dtype=float)
+    widths = cutoff * (sigmas if gammas is None else sigmas + gammas)
+    bounds = np.searchsorted(xs, np.stack([features - widths, features + widths], axis=1))
+    pixels, lines = concatenate_ranges(bounds)
+
+    dx = xs[pixels] - features[lines]
+    if gammas is None:
+        profile = np.exp(-0.5 * (dx / sigmas[lines]) ** 2)
+    else:
+        from scipy.special import voigt_profile
+        profile = voigt_profile(dx, sigmas[lines], gammas[lines]) / voigt_profile(0., sigmas, gammas)[lines]
+    return np.bincount(pixels, weights=depths[lines] * profile, minlength=len(xs))
+
+
+def create_spectrum(x_range=(100, 200), number_of_values=300, number_of_features=10, sigma_range=(1, 5),
+                    depth_range=(0, 1), gamma_range=None, sn=10, grid='linear', continuum=(0., 1.), cutoff=6.,
+                    seed=None):
+    """Create a reproducible synthetic spectrum with random absorption features and Gaussian noise.
+
+    Feature widths (`sigma_range`, `gamma_range` for Voigt profiles) are in units of x. The continuum is a
+    polynomial in `x - x_range[0]` with `continuum` coefficients (highest power first) and the noise has a
+    standard deviation of continuum / `sn`. The same `seed` always gives the same spectrum.
+    """
+    rng = np.random.default_rng(seed)
+    xs = create_grid(x_range, number_of_values, grid)
+
+    features = np.sort(rng.uniform(xs[0], xs[-1], number_of_features))
+    sigmas = rng.uniform(*sigma_range, number_of_features)
+    depths = rng.uniform(*depth_range, number_of_features)
+    gammas = None if gamma_range is None else rng.uniform(*gamma_range, number_of_features)
+
+    ys_cont = np.polyval(continuum, xs - xs[0])
+    errors = ys_cont / sn
+    ys = ys_cont * (1 - absorption_profiles(xs, features, sigmas, depths, gammas, cutoff))
+    ys += rng.standard_normal(len(xs)) * errors
+    return SyntheticSpectrum(xs, ys, errors, features, sigmas, gammas, depths)
+
+
+def gaussian_equivalent_widths(spectrum):
+    """Return the true EWs of the Gaussian features of a synthetic spectrum."""
+    return spectrum.depths * spectrum.sigmas * np.sqrt(2 * np.pi)
@@ -0,0 +1,165 @@
+import numpy as np
+
+
+MEASUREMENT_DTYPE = np.dtype([('spectrum', np.int32), ('feature', np.int32), ('ew', np.float64),
+                              ('ew_error', np.float64), ('ew_min', np.float64), ('ew_max', np.float64)])
+INITIAL_CAPACITY = 64
+
+
+class MeasurementTable:
+    """Columnar table of EW measurements backed by a growable structured NumPy array.
+
+    Features and spectra are stored as integer ids into `features` and `spectra`, rows are appended in
+    amortized O(1) by doubling the capacity of the array. Aggregations work on whole columns at once.
+    """
+    __slots__ = ('features', 'spectra', '_feature_ids', '_spectrum_ids', '_data', '_size')
+
+    def __init__(self, features, capacity=INITIAL_CAPACITY):
+        self.features = np.asarray(features, dtype=float)
+        self.spectra = []
+        self._feature_ids = {feature: i for i, feature in enumerate(self.features.tolist())}
+        self._spectrum_ids = {}
+        self._data = np.empty(capacity, dtype=MEASUREMENT_DTYPE)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def data(self):
+        """The rows of the table as structured array (a view, valid until the next append)."""
+        return self._data[:self._size]
+
+    def feature_id(self, feature):
+        try:
+            return self._feature_ids[float(feature)]
+        except KeyError:
+            raise ValueError(f'Unknown feature {feature}.') from None
+
+    def spectrum_id(self, spectrum):
+        if spectrum not in self._spectrum_ids:
+            self._spectrum_ids[spectrum] = len(self.spectra)
+            self.spectra.append(spectrum)
+        return self._spectrum_ids[spectrum]
+
+    def _reserve(self, n):
+        if self._size + n <= len(self._data):
+            return
+        capacity = max(2 * len(self._data), self._size + n)
+        data = np.empty(capacity, dtype=MEASUREMENT_DTYPE)
+        data[:self._size] = self.data
+        self._data = data
+
+    def append(self, spectrum, feature, ew, ew_range=None, ew_error=np.nan):
+        self._reserve(1)
+        ew_min, ew_max = (np.nan, np.nan) if ew_range is None else ew_range
+        self._data[self._size] = (self.spectrum_id(spectrum), self.feature_id(feature), ew, ew_error, ew_min, ew_max)
+        self._size += 1
+
+    def extend(self, spectrum, features, ews, ew_ranges=None, ew_errors=None):
+        """Append the measurements of many features of one spectrum at once."""
+        ews = np.asarray(ews, dtype=float)
+        n = len(ews)
+        self._reserve(n)
+        rows = self._data[self._size:self._size + n]
+        rows['spectrum'] = self.spectrum_id(spectrum)
+        rows['feature'] = [self.feature_id(feature) for feature in features]
+        rows['ew'] = ews
+        rows['ew_error'] = np.nan if ew_errors is None else ew_errors
+        ew_ranges = np.full((n, 2), np.nan) if ew_ranges is None else np.asarray(ew_ranges, dtype=float)
+        rows['ew_min'] = ew_ranges[:, 0]
+        rows['ew_max'] = ew_ranges[:, 1]
+        self._size += n
+
+    def select(self, spectrum=None, feature=None):
+        """Return the rows of a spectrum and/or feature."""
+        data = self.data
+        mask = np.ones(len(data), dtype=bool)
+        if spectrum is not None:
+            mask &= data['spectrum'] == self._spectrum_ids.get(spectrum, -1)
+        if feature is not None:
+            mask &= data['feature'] == self.feature_id(feature)
+        return data[mask]
+
+    def results(self, spectrum=None):
+        """Return the EWs as dict shaped like `Measurements.results`, keyed by `str(feature)`."""
+        rows = self.select(spectrum)
+        order = np.argsort(rows['feature'], kind='stable')
+        ids, starts = np.unique(rows['feature'][order], return_index=True)
+        ews = np.split(rows['ew'][order], starts[1:])
+        results = {str(feature): [] for feature in self.features.tolist()}
+        for i, feature_ews in zip(ids, ews):
+            results[str(self.features[i])] = feature_ews.tolist()
+        return results
+
+    def statistics(self, by=('feature',)):
+        """Return count, mean, standard deviation, minimum and maximum of the EWs grouped by the `by` columns.
+
+        The result is a structured array with one row per group, NaN EWs are ignored.
+        """
+        data = self.data
+        keys = np.stack([data[column] for column in by], axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        n_groups = len(groups)
+
+        valid = np.isfinite(data['ew'])
+        ews = np.where(valid, data['ew'], 0.)
+        counts = np.bincount(inverse, weights=valid, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.bincount(inverse, weights=ews, minlength=n_groups) / counts
+            squares = np.bincount(inverse, weights=np.where(valid, ews - means[inverse], 0.) ** 2, minlength=n_groups)
+            stds = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+        minima = np.full(n_groups, np.inf)
+        maxima = np.full(n_groups, -np.inf)
+        np.minimum.at(minima, inverse[valid], ews[valid])
+        np.maximum.at(maxima, inverse[valid], ews[valid])
+
+        dtype = [(column, np.int32) for column in by] + [('count', np.int64), ('mean', np.float64),
+                                                         ('std', np.float64), ('min', np.float64),
+                                                         ('max', np.float64)]
+        statistics = np.empty(n_groups, dtype=dtype)
+        for i, column in enumerate(by):
+            statistics[column] = groups[:, i]
+        statistics['count'] = counts
+        statistics['mean'] = means
+        statistics['std'] = stds
+        statistics['min'] = np.where(counts > 0, minima, np.nan)
+        statistics['max'] = np.where(counts > 0, maxima, np.nan)
+        return statistics
+
+    def summary(self):
+        """Return one line per measured feature with the number, mean and scatter of its EWs."""
+        return '\n'.join(f'{self.features[row["feature"]]} n={row["count"]} mean={row["mean"]:.4g} std={row["std"]:.2g}'
+                         for row in self.statistics())
+
+    def columns(self):
+        """Return the columns with spectrum names and feature wavelengths instead of ids."""
+        data = self.data
+        columns = {name: data[name] for name in MEASUREMENT_DTYPE.names}
+        columns['spectrum'] = np.array(self.spectra + [''])[data['spectrum']].astype(str)
+        columns['feature'] = self.features[data['feature']]
+        return columns
+
+    def to_fits(self, output_file, overwrite=False):
+        from astropy.table import Table
+        Table(self.columns()).write(output_file, format='fits', overwrite=overwrite)
+
+    def to_parquet(self, output_file):
+        """Write the table as Parquet file, requires pyarrow."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table(self.columns()), output_file)
+
+    @classmethod
+    def from_results(cls, results, features=None):
+        """Build a table from per spectrum results as returned by `nifty.batch.run_batch`."""
+        if features is None:
+            features = sorted({float(feature) for spectrum_results in results.values() for feature in spectrum_results})
+        table = cls(features)
+        for spectrum, spectrum_results in results.items():
+            measured = [(feature, ew) for feature, ews in spectrum_results.items() for ew in ews]
+            table.spectrum_id(spectrum)
+            if measured:
+                table.extend(spectrum, *zip(*measured))
+        return table
@@ -0,0 +1,153 @@
+import bisect
+import contextlib
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+
+# environment variable that switches the instrumentation on at import, a value other than a boolean one is
+# the file the command line interface writes the timings to
+TIMING_ENV = 'NIFTY_TIMINGS'
+FALSE_VALUES = ('', '0', 'false', 'no', 'off')
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+# upper edges of the latency histogram bins in seconds, four per decade from 1 µs to 100 s
+BIN_EDGES = [10 ** (exponent / 4) for exponent in range(-24, 9)]
+
+_enabled = os.environ.get(TIMING_ENV, '').strip().lower() not in FALSE_VALUES
+_stages = {}
+# stages are recorded from the prefetch thread of interactive sessions as well
+_lock = threading.Lock()
+
+
+class _NullTimer:
+    # contextlib.nullcontext needs Python 3.7
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null = _NullTimer()
+
+
+class StageTimings:
+    """Count, total, extremes and a logarithmic histogram of the latencies of one stage."""
+    __slots__ = ('count', 'total', 'min', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = 0.
+        # the last bin counts everything above the largest edge
+        self.histogram = [0] * (len(BIN_EDGES) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.histogram[bisect.bisect_left(BIN_EDGES, seconds)] += 1
+
+    def quantile(self, q):
+        """Approximate quantile `q` of the latencies, the upper edge of the bin it falls into."""
+        if not self.count:
+            return math.nan
+        cumulative = 0
+        for edge, count in zip(BIN_EDGES + [self.max], self.histogram):
+            cumulative += count
+            if cumulative >= q * self.count:
+                return min(edge, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.total / self.count, 'min': self.min,
+                'max': self.max, 'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'histogram': self.histogram}
+
+
+def enable(enabled=True):
+    """Switch the recording of stage latencies on (or off)."""
+    global _enabled
+    _enabled = enabled
+
+
+def env_timings_file():
+    """Return the timings output file named by the environment variable, None for a boolean value."""
+    value = os.environ.get(TIMING_ENV, '').strip()
+    return None if value.lower() in FALSE_VALUES + TRUE_VALUES else value
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def record(stage, seconds):
+    with _lock:
+        if stage not in _stages:
+            _stages[stage] = StageTimings()
+        _stages[stage].add(seconds)
+
+
+@contextlib.contextmanager
+def _timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def timer(stage):
+    """Context manager recording the latency of its block as `stage`, a shared no-op while disabled."""
+    return _timer(stage) if _enabled else _null
+
+
+def timed(stage):
+    """Decorator recording the latency of every call as `stage`, while disabled it only checks a flag."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def timings():
+    """Return the recorded statistics of every stage as dict, as dumped by `write_timings_json`."""
+    with _lock:
+        return {'bin_edges': BIN_EDGES, 'stages': {stage: _stages[stage].to_dict() for stage in sorted(_stages)}}
+
+
+def summary():
+    """Return one line per stage with count, mean, median, 90th percentile and maximum latency in ms."""
+    with _lock:
+        stages = dict(_stages)
+    if not stages:
+        return 'No timings recorded.' if _enabled else f'Timings are disabled, enable them with {TIMING_ENV}=1.'
+    lines = [f'{"stage":32s} {"count":>7s} {"mean":>9s} {"p50":>9s} {"p90":>9s} {"max":>9s}  [ms]']
+    for stage in sorted(stages):
+        stats = stages[stage]
+        lines.append(f'{stage:32s} {stats.count:7d} {stats.total / stats.count * 1e3:9.3f} '
+                     f'{stats.quantile(0.5) * 1e3:9.3f} {stats.quantile(0.9) * 1e3:9.3f} {stats.max * 1e3:9.3f}')
+    return '\n'.join(lines)
+
+
+def write_timings_json(output_file):
+    with open(output_file, 'w') as f:
+        json.dump(timings(), f)
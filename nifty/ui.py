@@ -1,26 +1,148 @@
+import threading
+
 import numpy as np
-from scipy import signal
 from matplotlib import pyplot as plt
+from matplotlib.patches import Patch
 from matplotlib.widgets import SpanSelector
 
+from nifty.autocontinuum import continuum_mask, feature_bounds, mask_runs
+from nifty.continuum import ContinuumFit, get_indices, index_ranges, normalize
+from nifty.decimate import MinMaxPyramid, minmax_decimate
+from nifty.ew import equivalent_widths
+from nifty.features import FeatureIndex
+from nifty.prefetch import Prefetcher
+from nifty.synthetic import create_spectrum
+from nifty.table import MeasurementTable
+from nifty.timing import summary as timing_summary, timed, timer
+from nifty.uncertainty import DEFAULT_PERCENTILES, DEFAULT_REALIZATIONS, MonteCarloEW, ew_error, ew_percentiles
+
+
+# fraction of the visible x range that is kept as line data on each side
+VIEW_MARGIN = 0.5
+# number of points drawn per screen pixel, decimated lines keep the minimum and maximum of each bin
+POINTS_PER_PIXEL = 2
+
+
+def create_span_selector(ax, onselect):
+    span_props = dict(alpha=0.5, facecolor='yellow')
+    try:
+        return SpanSelector(ax, onselect, 'horizontal', useblit=True, props=span_props)
+    except TypeError:
+        # matplotlib < 3.5
+        return SpanSelector(ax, onselect, 'horizontal', useblit=True, rectprops=span_props)
+
 
 class PlotUI:
-    def __init__(self, config):
+    def __init__(self, config, show=True, store=None, spectrum=''):
         self.config = config
-        self.measurements = Measurements(self.config.dibs)
+        self.measurements = Measurements(self.config.dibs, store=store, spectrum=spectrum)
 
         self.fig, (self.ax1, self.ax2, self.ax3) = plt.subplots(3, figsize=(8, 6), constrained_layout=True)
-        self.fig.canvas.set_window_title('NIFTY')
-
+        if self.fig.canvas.manager is not None:
+            self.fig.canvas.manager.set_window_title('NIFTY')
+
+        # the spectra are persistent artists, everything depending on the fit is animated and blitted on top of
+        # a cached background of its axes
+        self.backgrounds = {}
+        self.ew_fill = None
+        if self.config.pyramid is None:
+            self.config.pyramid = MinMaxPyramid(self.config.xs, self.config.ys)
+        self.pyramid = self.config.pyramid
+        self.cid_draw = self.fig.canvas.mpl_connect('draw_event', self.ondraw)
+        self.create_plot()
         self.reset_plot()
+        self.config.prefetch_neighbours()
 
         self.cid = self.fig.canvas.mpl_connect('key_press_event', self.onpress)
-        self.span_fit = SpanSelector(self.ax2, self.onselect_fit_range, 'horizontal', useblit=True,
-                                rectprops=dict(alpha=0.5, facecolor='yellow'))
-        self.span_ew = SpanSelector(self.ax3, self.onselect_ew_range, 'horizontal', useblit=True,
-                               rectprops=dict(alpha=0.5, facecolor='yellow'))
-        plt.show()
+        self.span_fit = create_span_selector(self.ax2, self.onselect_fit_range)
+        self.span_ew = create_span_selector(self.ax3, self.onselect_ew_range)
+        if show:
+            plt.show()
 
+    def create_plot(self):
+        self.ax1.set_title('Full Spectrum')
+        self.line_top, = self.ax1.plot(*self.pyramid.select(self.config.xs[0], self.config.xs[-1],
+                                                            self.max_points(self.ax1)), '-', color='C0')
+        self.dib_markers, = self.ax1.plot(*self.dib_marker_data(self.config.xs[0], self.config.xs[-1]), 'k|')
+        self.selected_marker, = self.ax1.plot([], [], 'rv', animated=True)
+
+        self.ax2.set_title('DIB Region')
+        self.line_middle, = self.ax2.plot([], [], '-', color='C0')
+        self.fit_line, = self.ax2.plot([], [], '-', color='k', alpha=0.5, animated=True)
+        self.fit_points, = self.ax2.plot([], [], 'o', color='C1', alpha=0.5, animated=True)
+        # a fixed legend location, 'best' has to check every data point on each blit
+        self.fit_legend = self.ax2.legend([self.fit_line], [''], loc='lower left')
+        self.fit_legend.set_animated(True)
+
+        self.ax3.set_title('Local Norm')
+        self.ax3.axhline(1, color='k', alpha=0.5)
+        self.line_bottom, = self.ax3.plot([], [], '-', color='C0', animated=True)
+        self.ew_legend = self.ax3.legend([Patch(color='green', alpha=0.5)], [''], loc='lower left')
+        self.ew_legend.set_animated(True)
+
+        for ax in (self.ax1, self.ax2, self.ax3):
+            ax.callbacks.connect('xlim_changed', self.update_lines)
+
+    def max_points(self, ax, margin=0.):
+        return int(ax.bbox.width * POINTS_PER_PIXEL * (1 + 2 * margin))
+
+    def line_data(self, ax, ys=None):
+        # data covering the x limits of `ax` plus a margin, decimated to the resolution of the axis
+        xmin, xmax = ax.get_xlim()
+        margin = (xmax - xmin) * VIEW_MARGIN
+        max_points = self.max_points(ax, VIEW_MARGIN)
+        if ys is None:
+            return self.pyramid.select(xmin - margin, xmax + margin, max_points)
+        indmin, indmax = self.config.view_bounds(xmin, xmax, VIEW_MARGIN)
+        return minmax_decimate(self.config.xs[indmin:indmax], ys[indmin:indmax], max_points)
+
+    def dib_marker_data(self, xmin, xmax):
+        dibs = self.config.features[self.config.features.in_range(xmin, xmax)]
+        return dibs, np.full(len(dibs), 1.1)
+
+    def update_lines(self, ax):
+        # called whenever the x limits change, e.g. by navigating or zooming with the toolbar
+        if ax is self.ax1:
+            self.line_top.set_data(*self.line_data(ax))
+            self.dib_markers.set_data(*self.dib_marker_data(*ax.get_xlim()))
+        elif ax is self.ax2:
+            self.line_middle.set_data(*self.line_data(ax))
+            if self.config.fit.windows:
+                self.fit_line.set_data(*self.line_data(ax, self.config.ys_fit))
+        else:
+            self.line_bottom.set_data(*self.line_data(ax, self.config.ys_norm if self.config.fit.windows else None))
+
+    def overlays(self, ax):
+        if ax is self.ax1:
+            return [self.selected_marker]
+        if ax is self.ax2:
+            return [self.fit_line, self.fit_points, self.fit_legend]
+        return [self.line_bottom, self.ew_fill, self.ew_legend]
+
+    @timed('ui.draw')
+    def ondraw(self, event):
+        # a full draw invalidates all backgrounds, e.g. after changing limits or resizing the window
+        for ax in (self.ax1, self.ax2, self.ax3):
+            self.backgrounds[ax] = self.fig.canvas.copy_from_bbox(ax.bbox)
+            self.draw_overlays(ax)
+
+    def draw_overlays(self, ax):
+        for artist in self.overlays(ax):
+            if artist is not None and artist.get_visible():
+                ax.draw_artist(artist)
+
+    @timed('ui.blit')
+    def blit(self, *axes):
+        if not self.backgrounds:
+            self.fig.canvas.draw()
+            return
+        for ax in axes:
+            self.fig.canvas.restore_region(self.backgrounds[ax])
+            self.draw_overlays(ax)
+            self.fig.canvas.blit(ax.bbox)
+        self.fig.canvas.flush_events()
+
+    @timed('ui.reset_plot')
     def reset_plot(self):
         self.config.reset_fit()
 
@@ -30,99 +152,151 @@ class PlotUI:
 
         self.fig.canvas.draw()
 
+    @timed('ui.reset_fit_plot')
+    def reset_fit_plot(self):
+        # limits stay the same, only the overlays need to be redrawn
+        self.config.reset_fit()
+        self.reset_overlays()
+        self.blit(self.ax2, self.ax3)
+
+    def reset_overlays(self):
+        self.fit_line.set_data([], [])
+        self.fit_points.set_data([], [])
+        self.fit_legend.set_visible(False)
+        self.line_bottom.set_data(*self.line_data(self.ax3))
+        self.remove_ew_fill()
+
+    def remove_ew_fill(self):
+        if self.ew_fill is not None:
+            self.ew_fill.remove()
+            self.ew_fill = None
+        self.ew_legend.set_visible(False)
+
     def reset_plot_top(self):
-        self.ax1.clear()
-        self.ax1.set_title('Full Spectrum')
-        self.ax1.plot(self.config.xs, self.config.ys, '-', color='C0')
-        self.ax1.plot(self.config.dibs, [1.1] * len(self.config.dibs), 'k|')
-        self.ax1.plot(self.config.selected_dib, [1.1], 'rv')
+        self.selected_marker.set_data([self.config.selected_dib], [1.1])
 
     def reset_plot_middle(self):
-        self.ax2.clear()
-        self.ax2.set_title('DIB Region')
-        self.ax2.plot(self.config.xs, self.config.ys, '-', color='C0')
-        self.ax2.set_xlim(self.config.selected_dib * (1 - self.config.x_range_factor),
-                          self.config.selected_dib * (1 + self.config.x_range_factor))
+        self.fit_line.set_data([], [])
+        self.fit_points.set_data([], [])
+        self.fit_legend.set_visible(False)
+        self.ax2.set_xlim(*self.config.x_range())
+        self.update_lines(self.ax2)
+        self.ax2.relim()
+        self.ax2.autoscale_view(scalex=False)
 
     def reset_plot_bottom(self):
-        self.ax3.clear()
-        self.ax3.set_title('Local Norm')
-        self.ax3.plot(self.config.xs, self.config.ys, '-', color='C0')
-        self.ax3.set_xlim(self.config.selected_dib * (1 - self.config.x_range_factor),
-                          self.config.selected_dib * (1 + self.config.x_range_factor))
+        self.remove_ew_fill()
+        self.ax3.set_xlim(*self.config.x_range())
         self.ax3.set_ylim(1. - self.config.y_range_factor, 1.1)
+        self.update_lines(self.ax3)
 
+    @timed('ui.select_fit_range')
     def onselect_fit_range(self, xmin, xmax):
         # get x and y values of selection
-        indmin, indmax = np.searchsorted(self.config.xs, (xmin, xmax))
-        indmin = max(0, indmin - 2)
-        indmax = min(len(self.config.xs) - 1, indmax)
-
-        thisx = self.config.xs[indmin:indmax]
-        thisy = self.config.ys[indmin:indmax]
-
-        # append to fit region and attempt to fit
-        self.config.xs_fit_data = np.append(thisx, self.config.xs_fit_data)
-        self.config.ys_fit_data = np.append(thisy, self.config.ys_fit_data)
-        # noinspection PyTupleAssignmentBalance
-        k, d = np.polyfit(self.config.xs_fit_data, self.config.ys_fit_data, 1)
-        self.config.ys_fit = [k * x + d for x in self.config.xs]
-        self.config.ys_norm = self.config.ys / self.config.ys_fit
-
-        # redraw everything
-        self.ax2.clear()
-        self.ax2.set_title('DIB Region')
-        self.ax2.set_xlim(self.config.selected_dib * (1 - self.config.x_range_factor),
-                          self.config.selected_dib * (1 + self.config.x_range_factor))
-        self.ax2.plot(self.config.xs, self.config.ys, '-', color='C0')
-        self.ax2.plot(self.config.xs, self.config.ys_fit, '-', color='k', alpha=0.5, label='k={:6.2f}'.format(k))
-        # ax2.plot(thisx, thisy, '-', color='C1', linewidth=2)
-        self.ax2.plot(self.config.xs_fit_data, self.config.ys_fit_data, 'o', color='C1', alpha=0.5)
-        self.ax2.legend()
-
-        self.ax3.clear()
-        self.ax3.set_title('Local Norm')
-        self.ax3.set_xlim(self.config.selected_dib * (1 - self.config.x_range_factor),
-                          self.config.selected_dib * (1 + self.config.x_range_factor))
-        self.ax3.set_ylim(1. - self.config.y_range_factor, 1.1)
-        self.ax3.axhline(1, self.config.xs.min(), self.config.xs.max(), color='k', alpha=0.5)
-        self.ax3.plot(self.config.xs, self.config.ys_norm)
+        indmin, indmax = get_indices(self.config.xs, (xmin, xmax))
 
-        self.fig.canvas.draw()
+        # add to fit region and attempt to fit
+        self.config.fit.add(indmin, indmax)
+        self.config.fit_ranges.append((xmin, xmax))
+        self.update_fit()
 
+    @timed('ui.auto_fit_range')
+    def auto_fit_range(self):
+        # replace the current fit by the automatically selected continuum pixels around the DIB
+        self.config.reset_fit()
+        self.reset_overlays()
+        windows = self.config.auto_fit_windows()
+        # ranges replayed by `nifty.batch` select exactly the same pixels
+        for (indmin, indmax), fit_range in zip(windows, index_ranges(self.config.xs, windows).tolist()):
+            self.config.fit.add(indmin, indmax)
+            self.config.fit_ranges.append(tuple(fit_range))
+        if self.config.fit.windows:
+            self.update_fit()
+        else:
+            self.blit(self.ax2, self.ax3)
+
+    @timed('ui.undo_fit_range')
+    def undo_fit_range(self):
+        if not self.config.fit.windows:
+            return
+        self.config.fit.undo()
+        self.config.fit_ranges.pop()
+        if self.config.fit.windows:
+            self.update_fit()
+        else:
+            self.reset_fit_plot()
+
+    @timed('ui.update_fit')
+    def update_fit(self):
+        k = self.config.fit.slope
+        with timer('ui.normalize'):
+            normalize(self.config.xs, self.config.ys, self.config.fit.coefficients, self.config.selected_dib,
+                      ys_fit=self.config.ys_fit, ys_norm=self.config.ys_norm, bounds=self.config.norm_bounds())
+
+        # redraw fit and normalization
+        self.update_lines(self.ax2)
+        self.update_lines(self.ax3)
+        self.fit_points.set_data(*minmax_decimate(self.config.fit.xs_data, self.config.fit.ys_data,
+                                                  self.max_points(self.ax2)))
+        self.fit_legend.get_texts()[0].set_text('k={:6.2f}'.format(k))
+        self.fit_legend.set_visible(True)
+        self.remove_ew_fill()
+        self.blit(self.ax2, self.ax3)
+
+    @timed('ui.select_ew_range')
     def onselect_ew_range(self, xmin, xmax):
+        if not self.config.fit.windows:
+            return
         # get x and y values of selection
-        indmin, indmax = np.searchsorted(self.config.xs, (xmin, xmax))
-        indmin = max(0, indmin - 2)
-        indmax = min(len(self.config.xs) - 1, indmax)
-
-        diff = self.config.ys_norm[indmin:indmax] * (self.config.xs[1] - self.config.xs[0])
-        ew = sum(diff)
-        self.measurements.results[str(self.config.selected_dib)].append(ew)
-
-        self.ax3.clear()
-        self.ax3.set_title('Local Norm')
-        self.ax3.set_xlim(self.config.dibs[self.config.selection] * (1 - self.config.x_range_factor),
-                          self.config.dibs[self.config.selection] * (1 + self.config.x_range_factor))
-        self.ax3.set_ylim(1. - self.config.y_range_factor, 1.1)
-        self.ax3.axhline(1, self.config.xs.min(), self.config.xs.max(), color='k', alpha=0.5)
-        self.ax3.plot(self.config.xs, self.config.ys_norm)
-        self.ax3.fill_between(self.config.xs, self.config.ys_norm, 1,
-                              where=(self.config.xs > self.config.xs[indmin]) & (self.config.xs <= self.config.xs[indmax]),
-                              color='green', alpha=0.5, label='EW={:6.2f}'.format(ew))
-        self.ax3.legend()
-        self.fig.canvas.draw()
+        indmin, indmax = get_indices(self.config.xs, (xmin, xmax))
+
+        ew = equivalent_widths(self.config.xs, self.config.ys, [(indmin, indmax)], self.config.fit.coefficients,
+                               self.config.selected_dib)[0]
+        error = percentiles = None
+        if self.config.realizations:
+            samples = MonteCarloEW(self.config.xs, self.config.ys, [(indmin, indmax)], self.config.selected_dib,
+                                   fit_bounds=[self.config.fit.windows],
+                                   degree=self.config.degree).sample(self.config.realizations)
+            error = ew_error(samples)[0]
+            percentiles = ew_percentiles(samples)[:, 0]
+            print(' '.join(f'{q:g}%={value:.4g}' for q, value in zip(DEFAULT_PERCENTILES, percentiles)))
+        self.measurements.add(self.config.selected_dib, ew, self.config.fit_ranges, (xmin, xmax),
+                              coefficients=self.config.fit.coefficients, ew_error=error, ew_percentiles=percentiles)
+
+        # the EW of a window holding other features is that of the blend
+        blend = self.config.features.blended(xmin, xmax, self.config.selected_dib)
+        if blend:
+            print(f'Blended with {blend}')
+
+        self.remove_ew_fill()
+        xs_fill, ys_fill = minmax_decimate(self.config.xs[indmin + 1:indmax + 1],
+                                           self.config.ys_norm[indmin + 1:indmax + 1], self.max_points(self.ax3))
+        self.ew_fill = self.ax3.fill_between(xs_fill, ys_fill, 1, color='green', alpha=0.5, animated=True)
+        if error is None:
+            text = 'EW={:6.2f}'.format(ew)
+        else:
+            text = 'EW={:6.2f}±{:.2f}'.format(ew, error)
+        self.ew_legend.get_texts()[0].set_text(text + (' (blend)' if blend else ''))
+        self.ew_legend.set_visible(True)
+        self.blit(self.ax3)
 
+    @timed('ui.key_press')
     def onpress(self, event):
         print(event.key)
         if event.key == 'r':
-            self.reset_plot()
+            self.reset_fit_plot()
+        if event.key == 'a':
+            self.auto_fit_range()
+        if event.key == 'backspace':
+            self.undo_fit_range()
         if event.key == 'left':
             self.config.previous_dib()
             self.reset_plot()
+            self.config.prefetch_neighbours()
         if event.key == 'right':
             self.config.next_dib()
             self.reset_plot()
+            self.config.prefetch_neighbours()
         if event.key == 'up':
             self.config.increase_y_range()
             self.reset_plot()
@@ -136,14 +310,19 @@ class PlotUI:
             self.config.increase_x_range()
             self.reset_plot()
         if event.key == ' ':
-            for k, v in self.measurements.results.items():
-                print(k, v)
+            print(self.measurements.table.summary())
+        if event.key == 't':
+            print(timing_summary())
+        if event.key == 'u':
+            self.config.toggle_uncertainties()
+            print(f'Monte Carlo uncertainties with {self.config.realizations} realizations'
+                  if self.config.realizations else 'Monte Carlo uncertainties off')
         if event.key == 'escape':
             plt.close()
 
 
 class PlotConfig:
-    def __init__(self, xs=None, ys=None, dibs=None):
+    def __init__(self, xs=None, ys=None, dibs=None, executor=None):
         # parameter for full spectrum
         if any((xs is None, ys is None, dibs is None)):
             self.create_spectrum()
@@ -153,47 +332,141 @@ class PlotConfig:
             self.dibs = dibs
 
         # parameter for norm
-        self.xs_fit_data = np.array([])
-        self.ys_fit_data = np.array([])
-        self.ys_fit = np.array([])
+        self.degree = 1
+        self.fit = None
+        self.fit_ranges = []
+        # preallocated and reused by every fit, NaN outside of the normalized region
+        self.ys_fit = np.full(len(self.xs), np.nan)
+        # fraction of the visible DIB region added on each side when normalizing, None for the full spectrum
+        self._norm_margin = 0.5
+        # continuum pixels of the whole spectrum, selected on the first automatic fit
+        self.continuum_mask = None
+        self.continuum_lock = threading.Lock()
+        # fraction of the DIB wavelength fitted on each side by the automatic fit
+        self.auto_fit_factor = 1e-2
+        # Monte Carlo realizations for the EW uncertainty of every measurement, 0 to switch them off
+        self.realizations = 0
 
         # parameter for measurement
-        self.ys_norm = np.array([])
+        self.ys_norm = np.full(len(self.xs), np.nan)
 
         # additional parameters
+        self._x_range_factor = 0.1
+        self.y_range_factor = 1.1
+        # the bounds of the DIB regions are precomputed with the margins of the normalization and the views
+        self.features = FeatureIndex(self.dibs, self.xs, self._x_range_factor, margins=self.region_margins())
+        self.dibs = self.features.features.tolist()
         self.selection = 0
         self.selected_dib = self.dibs[self.selection]
-        self.x_range_factor = 0.1
-        self.y_range_factor = 1.1
+
+        # with a (shared) executor the automatic fit windows of the neighbouring DIBs are computed in the
+        # background, see `prefetch_neighbours`
+        self.prefetcher = Prefetcher(executor) if executor is not None else None
+        # decimation levels of the spectrum for PlotUI, built there if not prepared in advance
+        self.pyramid = None
+
+        self.reset_fit()
 
     def create_spectrum(self, x_range=(100, 200), sigma_range=(1, 5), strength_range=(0, 1), number_of_values=300,
-                        number_of_dibs=10, sn=10):
+                        number_of_dibs=10, sn=10, seed=None):
         if x_range is None:
-            x_range_min, x_range_max = (100, 500)
-        else:
-            x_range_min, x_range_max = x_range
-
-        self.xs = np.linspace(x_range_min, x_range_max, number_of_values)
-        noise = np.random.rand(self.xs.size)
-        self.ys = 1 + noise / sn - np.mean(noise / sn)
-
-        sigma_min, sigma_max = sigma_range
-        strength_min, strength_max = strength_range
-        self.dibs = []
-        for i in range(number_of_dibs):
-            sigma = sigma_min + np.random.rand() * sigma_max
-            strength = strength_min + np.random.rand() * strength_max
-            gaussian = signal.gaussian(number_of_values * 2, sigma)
-            dib_index = int(np.random.rand() * number_of_values) - 1
-            self.dibs.append(self.xs[number_of_values - dib_index])
-            self.ys = self.ys - strength * gaussian[dib_index:dib_index + number_of_values]
-        self.dibs.sort()
+            x_range = (100, 500)
+
+        # sigma_range is given in pixels
+        step = (x_range[1] - x_range[0]) / (number_of_values - 1)
+        spectrum = create_spectrum(x_range, number_of_values, number_of_dibs,
+                                   sigma_range=(sigma_range[0] * step, sigma_range[1] * step),
+                                   depth_range=strength_range, sn=sn, seed=seed)
+        self.xs = spectrum.xs
+        self.ys = spectrum.ys
+        self.dibs = spectrum.features.tolist()
 
     def reset_fit(self):
-        self.xs_fit_data = np.array([])
-        self.ys_fit_data = np.array([])
-        self.ys_fit = np.array([])
-        self.ys_norm = np.array([])
+        self.fit = ContinuumFit(self.xs, self.ys, self.selected_dib, self.degree)
+        self.fit_ranges = []
+        self.ys_fit.fill(np.nan)
+        self.ys_norm.fill(np.nan)
+
+    def toggle_uncertainties(self):
+        self.realizations = 0 if self.realizations else DEFAULT_REALIZATIONS
+
+    def auto_fit_windows(self):
+        if self.prefetcher is None:
+            return self.compute_auto_fit_windows(self.selection, self.auto_fit_factor)
+        return self.prefetcher.get(('auto_fit', self.selection, self.auto_fit_factor), self.compute_auto_fit_windows,
+                                   self.selection, self.auto_fit_factor)
+
+    def compute_auto_fit_windows(self, selection, auto_fit_factor):
+        # also called from the prefetch thread, the continuum mask is selected only once
+        with self.continuum_lock:
+            if self.continuum_mask is None:
+                self.continuum_mask = continuum_mask(self.xs, self.ys, self.dibs)
+        bounds = feature_bounds(self.xs, self.dibs[selection], auto_fit_factor)[0]
+        return mask_runs(self.continuum_mask, bounds)
+
+    def prefetch_neighbours(self):
+        """Start computing the automatic fit windows of the selected, the next and the previous DIB."""
+        if self.prefetcher is None:
+            return
+        for offset in (0, 1, -1):
+            selection = (self.selection + offset) % len(self.dibs)
+            self.prefetcher.prefetch(('auto_fit', selection, self.auto_fit_factor), self.compute_auto_fit_windows,
+                                     selection, self.auto_fit_factor)
+
+    def prepare(self):
+        """Do the work of opening this spectrum in PlotUI in advance, e.g. in a prefetch thread."""
+        self.pyramid = MinMaxPyramid(self.xs, self.ys)
+        self.compute_auto_fit_windows(self.selection, self.auto_fit_factor)
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+
+    @property
+    def x_range_factor(self):
+        return self._x_range_factor
+
+    @x_range_factor.setter
+    def x_range_factor(self, x_range_factor):
+        self._x_range_factor = x_range_factor
+        self.features.update(x_range_factor=x_range_factor)
+
+    @property
+    def norm_margin(self):
+        return self._norm_margin
+
+    @norm_margin.setter
+    def norm_margin(self, norm_margin):
+        self._norm_margin = norm_margin
+        self.features.update(margins=self.region_margins())
+
+    def region_margins(self):
+        # a view margin is relative to the width of the region, a region margin to its half width
+        margins = [2 * VIEW_MARGIN]
+        if self._norm_margin is not None:
+            margins.append(self._norm_margin)
+        return margins
+
+    def x_range(self, margin=0.):
+        return tuple(self.features.region(self.selected_dib, margin).tolist())
+
+    def region_bounds(self, margin=0.):
+        return self.features.region_bounds(self.selection, margin)
+
+    def view_bounds(self, xmin, xmax, margin=0.):
+        """Return the pixel bounds of [xmin, xmax] widened by `margin` times its width on each side.
+
+        While the DIB region is shown the precomputed bounds are used, after zooming or panning they are searched.
+        """
+        if (xmin, xmax) == self.x_range():
+            return self.region_bounds(2 * margin)
+        width = xmax - xmin
+        return get_indices(self.xs, (xmin - margin * width, xmax + margin * width))
+
+    def norm_bounds(self):
+        if self.norm_margin is None:
+            return None
+        return self.region_bounds(self.norm_margin)
 
     def next_dib(self):
         self.selection = (self.selection + 1) % len(self.dibs)
@@ -217,5 +490,27 @@ class PlotConfig:
 
 
 class Measurements:
-    def __init__(self, dibs):
-        self.results = {str(dib): [] for dib in dibs}
+    def __init__(self, dibs, store=None, spectrum=''):
+        self.table = MeasurementTable(dibs)
+        # continuum and integration windows of every measurement, one set per continuum fit of a feature,
+        # can be replayed by `nifty.batch`
+        self.windows = {}
+        # every measurement is also appended to the `MeasurementStore` as `spectrum` if given
+        self.store = store
+        self.spectrum = spectrum
+
+    @property
+    def results(self):
+        return self.table.results()
+
+    def add(self, dib, ew, fit_ranges, ew_range, coefficients=None, ew_error=None, ew_percentiles=None):
+        self.table.append(self.spectrum, dib, ew, ew_range=ew_range, ew_error=np.nan if ew_error is None else ew_error)
+        if self.store is not None:
+            self.store.add(self.spectrum, dib, ew, ew_range=ew_range, fit_ranges=fit_ranges, coefficients=coefficients,
+                           ew_error=ew_error, ew_percentiles=ew_percentiles)
+        # EW ranges are replayed against the continuum they were measured with, every fit gets its own set
+        fit_ranges = [list(fit_range) for fit_range in fit_ranges]
+        window_sets = self.windows.setdefault(str(dib), [])
+        if not window_sets or window_sets[-1]['fit'] != fit_ranges:
+            window_sets.append({'fit': fit_ranges, 'ew': []})
+        window_sets[-1]['ew'].append(list(ew_range))
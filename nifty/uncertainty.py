@@ -0,0 +1,152 @@
+from functools import partial
+
+import numpy as np
+
+from nifty.continuum import concatenate_ranges, evaluate_continuum
+from nifty.ew import pixel_widths
+from nifty.noise import estimate_noise
+from nifty.parallel import run_parallel
+
+
+DEFAULT_REALIZATIONS = 1000
+DEFAULT_PERCENTILES = (2.5, 16., 50., 84., 97.5)
+# number of simulated flux values (realizations x pixels) per block, bounds the memory to some 32 MB per array
+BLOCK_ELEMENTS = 2 ** 22
+
+
+def _segment_sums(values, lengths):
+    # sums over consecutive segments of the last axis, empty segments sum to zero
+    cumulative = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    np.cumsum(values, axis=-1, out=cumulative[..., 1:])
+    ends = np.cumsum(lengths)
+    return cumulative[..., ends] - cumulative[..., ends - lengths]
+
+
+def _sample_block(template, job):
+    realizations, seed = job
+    return template.measure(template.realizations(realizations, np.random.default_rng(seed)))
+
+
+class MonteCarloEW:
+    """Monte Carlo distribution of the EWs of integration windows including the continuum uncertainty.
+
+    Every realization adds Gaussian noise to the flux of all pixels involved, refits the polynomial continuum
+    of every feature to its fit windows `fit_bounds` (n_features, n_windows, 2) and integrates the EWs of
+    `ew_bounds` (n_ew_windows, 2) against the continuum of feature `groups[i]`, like `equivalent_widths`.
+    Without fit windows the continuum `coefficients` stay fixed. The noise is `errors` if given, else the
+    scatter of the flux around the continuum fit of each feature (for fixed continua the estimate of
+    `estimate_noise`). Only the pixels of the windows are kept and the normal equations of the continua are
+    inverted once for all realizations.
+    """
+    def __init__(self, xs, ys, ew_bounds, centers, fit_bounds=None, coefficients=None, degree=1, groups=None,
+                 errors=None):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        centers = np.atleast_1d(np.asarray(centers, dtype=float))
+        ew_bounds = np.asarray(ew_bounds, dtype=int).reshape(-1, 2)
+        groups = np.arange(len(ew_bounds)) if groups is None else np.asarray(groups, dtype=int)
+        if fit_bounds is None and coefficients is None:
+            raise ValueError('Either continuum fit windows or coefficients are needed.')
+        if fit_bounds is not None:
+            fit_bounds = np.asarray(fit_bounds, dtype=int).reshape(len(centers), -1, 2)
+            fit_pixels, fit_windows = concatenate_ranges(fit_bounds.reshape(-1, 2))
+            # windows are ordered by feature, so the pixels of every feature are consecutive
+            fit_features = fit_windows // fit_bounds.shape[1]
+        else:
+            fit_pixels = fit_features = np.zeros(0, dtype=int)
+        ew_pixels, ew_windows = concatenate_ranges(ew_bounds)
+
+        # the flux of a pixel is drawn once per realization, also if fit and integration windows overlap
+        self.pixels, inverse = np.unique(np.concatenate([fit_pixels, ew_pixels]), return_inverse=True)
+        self.fit_index = inverse[:len(fit_pixels)]
+        self.ew_index = inverse[len(fit_pixels):]
+        self.ys = ys[self.pixels]
+
+        self.fit_lengths = np.bincount(fit_features, minlength=len(centers))
+        self.fit_dx = xs[fit_pixels] - centers[fit_features]
+        self.fit_powers = self.fit_dx ** np.arange(degree + 1)[:, np.newaxis]
+        sums_xx = np.stack([np.bincount(fit_features, weights=self.fit_dx ** k, minlength=len(centers))
+                            for k in range(2 * degree + 1)], axis=1)
+        matrices = sums_xx[:, np.add.outer(np.arange(degree + 1), np.arange(degree + 1))]
+        valid = sums_xx[:, 0] > degree
+        matrices[~valid] = np.eye(degree + 1)
+        self.solvers = np.linalg.inv(matrices)
+        self.solvers[~valid] = np.nan
+        self.coefficients = None if fit_bounds is not None else np.atleast_2d(np.asarray(coefficients, dtype=float))
+
+        self.ew_lengths = np.bincount(ew_windows, minlength=len(ew_bounds))
+        self.ew_features = groups[ew_windows]
+        self.ew_dx = xs[ew_pixels] - centers[self.ew_features]
+        self.ew_widths = pixel_widths(xs, ew_pixels)
+        self.ew_total_widths = _segment_sums(self.ew_widths, self.ew_lengths)
+
+        if errors is not None:
+            self.sigmas = np.asarray(errors, dtype=float)[self.pixels]
+        elif fit_bounds is None:
+            self.sigmas = estimate_noise(ys)[self.pixels]
+        else:
+            self.sigmas = np.empty(len(self.pixels))
+            sigmas = self.residual_noise()
+            self.sigmas[self.fit_index] = sigmas[fit_features]
+            self.sigmas[self.ew_index] = sigmas[self.ew_features]
+
+    def residual_noise(self):
+        """Return the noise of every feature estimated from the scatter around its fitted continuum."""
+        coefficients = self.fit(self.ys[np.newaxis])[0]
+        features = np.repeat(np.arange(len(self.fit_lengths)), self.fit_lengths)
+        residuals = self.ys[self.fit_index] - evaluate_continuum(coefficients[features], self.fit_dx)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variances = _segment_sums(residuals ** 2, self.fit_lengths) / (self.fit_lengths - len(self.fit_powers))
+        return np.sqrt(variances)
+
+    def fit(self, ys):
+        """Fit the continua of flux realizations `ys` (n_realizations, n_pixels) of `pixels`."""
+        if self.coefficients is not None:
+            return np.broadcast_to(self.coefficients, (len(ys),) + self.coefficients.shape)
+        sums_xy = _segment_sums(ys[:, np.newaxis, self.fit_index] * self.fit_powers, self.fit_lengths)
+        return np.einsum('fij,rjf->rfi', self.solvers, sums_xy)[..., ::-1]
+
+    def measure(self, ys):
+        """Return the EWs of flux realizations `ys` (n_realizations, n_pixels) of `pixels`."""
+        continua = evaluate_continuum(self.fit(ys)[:, self.ew_features], self.ew_dx)
+        # EW = Σ width - Σ width·F/Fc, the temporaries are reused in place
+        ratios = np.divide(ys[:, self.ew_index], continua, out=continua)
+        ratios *= self.ew_widths
+        return self.ew_total_widths - _segment_sums(ratios, self.ew_lengths)
+
+    def realizations(self, n, rng):
+        ys = rng.standard_normal((n, len(self.pixels)))
+        ys *= self.sigmas
+        ys += self.ys
+        return ys
+
+    def sample(self, realizations=DEFAULT_REALIZATIONS, seed=None, workers=1, block_elements=BLOCK_ELEMENTS):
+        """Return the EWs of `realizations` noisy copies of the spectrum, shape (realizations, n_ew_windows).
+
+        Realizations are simulated in blocks of at most `block_elements` flux values, with `workers` > 1 the
+        blocks run in a process pool. Every block draws from its own seed spawned from `seed`, so the result
+        only depends on the seed, not on the number of workers.
+        """
+        block = max(1, block_elements // max(1, len(self.pixels) * (len(self.fit_powers) + 1)))
+        sizes = [min(block, realizations - start) for start in range(0, realizations, block)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        samples = []
+        # one chunk of blocks per worker, so the template is sent to every worker only once
+        jobs = list(zip(sizes, seeds))
+        chunksize = -(-len(jobs) // max(1, workers))
+        for _, ews, error in run_parallel(partial(_sample_block, self), jobs, workers=workers, chunksize=chunksize):
+            if error is not None:
+                raise RuntimeError(f'Monte Carlo block failed: {error}')
+            samples.append(ews)
+        return np.concatenate(samples + [np.empty((0, len(self.ew_lengths)))])
+
+
+def ew_percentiles(samples, q=DEFAULT_PERCENTILES):
+    """Return the percentiles `q` of EW samples per window, shape (len(q), n_windows), ignoring NaNs."""
+    return np.nanpercentile(samples, q, axis=0)
+
+
+def ew_error(samples):
+    """Return half the 16th to 84th percentile range of EW samples, the 1 sigma error for normal errors."""
+    lower, upper = ew_percentiles(samples, (16., 84.))
+    return 0.5 * (upper - lower)
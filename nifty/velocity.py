@@ -0,0 +1,74 @@
+import hashlib
+
+import numpy as np
+
+from nifty.io import LRUCache
+
+
+# speed of light in km/s
+C_KMS = 299792.458
+RESAMPLER_CACHE_SIZE = 16
+
+
+def doppler_factor(velocity):
+    """Return the (non-relativistic) factor 1 + v/c wavelengths are scaled with by a velocity in km/s."""
+    return 1 + velocity / C_KMS
+
+
+def shift_features(features, velocity):
+    """Move rest wavelengths of features into a frame moving with `velocity` (km/s) relative to them."""
+    return np.asarray(features, dtype=float) * doppler_factor(velocity)
+
+
+def velocity_from_grids(xs, xs_shifted):
+    """Return the velocity in km/s between a wavelength grid and its shifted copy (e.g. `lambda` and `bclambda`)."""
+    return (np.median(np.asarray(xs_shifted) / np.asarray(xs)) - 1) * C_KMS
+
+
+class Resampler:
+    """Linear interpolation from one wavelength grid onto another.
+
+    The interpolation indices and weights are computed once, afterwards resampling is a weighted sum of two
+    gathers for any number of spectra on the same grid. Points outside of the source grid are NaN.
+    """
+    def __init__(self, xs_from, xs_to):
+        xs_from = np.asarray(xs_from, dtype=float)
+        xs_to = np.asarray(xs_to, dtype=float)
+        self.indices = np.clip(np.searchsorted(xs_from, xs_to, side='right') - 1, 0, len(xs_from) - 2)
+        lower = xs_from[self.indices]
+        self.weights = (xs_to - lower) / (xs_from[self.indices + 1] - lower)
+        self.outside = (xs_to < xs_from[0]) | (xs_to > xs_from[-1])
+
+    def __call__(self, ys):
+        """Resample spectra `ys` with shape (n,) or (n_spectra, n) on the source grid."""
+        ys = np.asarray(ys, dtype=float)
+        resampled = ys[..., self.indices] * (1 - self.weights) + ys[..., self.indices + 1] * self.weights
+        resampled[..., self.outside] = np.nan
+        return resampled
+
+
+_resamplers = LRUCache(RESAMPLER_CACHE_SIZE)
+
+
+def _grid_key(xs):
+    return hashlib.sha1(np.ascontiguousarray(xs, dtype=np.float64).tobytes()).hexdigest()
+
+
+def shifted_resampler(xs, velocity, grid=None):
+    """Return the cached `Resampler` from the grid `xs` shifted by `velocity` onto `grid` (by default `xs`)."""
+    key = (_grid_key(xs), None if grid is None else _grid_key(grid), float(velocity))
+    resampler = _resamplers.get(key)
+    if resampler is None:
+        resampler = Resampler(np.asarray(xs, dtype=float) * doppler_factor(velocity), xs if grid is None else grid)
+        _resamplers.put(key, resampler)
+    return resampler
+
+
+def shift_spectrum(xs, ys, velocity, grid=None):
+    """Return the flux of spectra on `xs` moved by `velocity` (km/s) and sampled on `grid` (by default `xs`).
+
+    The barycentric correction moves an observed spectrum into the barycentric frame, the negative velocity of
+    an absorber moves it (to first order in v/c) into the rest frame of the absorber. The interpolation kernel
+    is cached per grid and velocity, so repeated shifts of spectra on the same grid skip the setup.
+    """
+    return shifted_resampler(xs, velocity, grid)(ys)
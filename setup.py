@@ -40,6 +40,7 @@ setup(
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
+    package_data={'nifty': ['resources/*']},
     keywords='nifty',
     name='nifty',
     packages=find_packages(include=['nifty', 'nifty.*']),
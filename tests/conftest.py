@@ -0,0 +1,10 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def spectrum():
+    xs = np.linspace(500., 580., 4001)
+    continuum = 2. + 0.01 * (xs - 500.)
+    absorption = 1 - 0.4 * np.exp(-0.5 * (xs - 520.) ** 2) - 0.2 * np.exp(-0.5 * ((xs - 560.) / 0.5) ** 2)
+    return xs, continuum * absorption
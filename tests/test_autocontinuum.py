@@ -0,0 +1,45 @@
+"""Tests for `nifty.autocontinuum`."""
+
+import numpy as np
+import pytest
+
+from nifty.autocontinuum import auto_continuum, block_quantile, exclude_ranges, mask_runs, sigma_clip_continuum
+from nifty.synthetic import create_spectrum
+
+
+def test_block_quantile():
+    ys = np.arange(12.)
+    ys[1] = np.nan
+    # block medians 3 (NaN ignored) and 8.5 at the block centers 2.5 and 8.5, constant beyond
+    filtered = block_quantile(ys, 6)
+    assert filtered[[0, 2, 5, 8, 11]] == pytest.approx([3., 3., 3. + 5.5 * 2.5 / 6, 8.5 - 5.5 * 0.5 / 6, 8.5])
+
+    mask = np.ones(12, dtype=bool)
+    mask[6:] = False
+    assert block_quantile(ys, 6, q=1., mask=mask) == pytest.approx(np.full(12, 5.))
+    assert np.isnan(block_quantile(ys, 6, mask=np.zeros(12, dtype=bool))).all()
+
+
+def test_mask_runs_and_exclude_ranges():
+    mask = np.array([1, 1, 0, 1, 1, 1, 0, 0, 1, 1], dtype=bool)
+    assert mask_runs(mask).tolist() == [[0, 2], [3, 6], [8, 10]]
+    assert mask_runs(mask, (1, 9)).tolist() == [[1, 2], [3, 6], [8, 9]]
+    assert mask_runs(exclude_ranges(mask, [(4, 5), (8, 12)])).tolist() == [[0, 2], [3, 4], [5, 6]]
+
+
+def test_sigma_clip_continuum():
+    spectrum = create_spectrum((400, 700), 30000, 20, sigma_range=(0.1, 0.5), depth_range=(0.3, 0.6), sn=100,
+                               seed=3)
+    continuum, mask = sigma_clip_continuum(spectrum.ys, width=1001)
+    assert continuum == pytest.approx(np.ones(30000), abs=0.01)
+    # the line cores are clipped, most of the spectrum is continuum
+    assert not mask[np.searchsorted(spectrum.xs, spectrum.features)].any()
+    assert mask.mean() > 0.8
+
+
+def test_auto_continuum():
+    spectrum = create_spectrum((400, 700), 30000, 20, sigma_range=(0.1, 0.5), depth_range=(0.1, 0.6), sn=100,
+                               continuum=(1e-3, 1.), seed=3)
+    coefficients, mask = auto_continuum(spectrum.xs, spectrum.ys, spectrum.features)
+    assert coefficients.shape == (20, 2)
+    assert coefficients[:, 1] == pytest.approx(np.polyval((1e-3, 1.), spectrum.features - 400), rel=2e-2)
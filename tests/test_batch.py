@@ -0,0 +1,205 @@
+"""Tests for the batch normalization and EW engine."""
+
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table
+from click.testing import CliRunner
+
+from nifty import cli
+from nifty.batch import (measure_file, measure_records, measure_spectrum, merge_results, normalize_files, run_batch,
+                         spectrum_seed)
+from nifty.continuum import fit_continuum, get_indices, normalize
+from nifty.ew import equivalent_widths
+from nifty.io import (ContinuumDefinition, read_measurements_json, read_norm_cache, write_cont, write_norm_cache,
+                      write_windows_json)
+from nifty.store import MeasurementStore
+
+
+FEATURES = [520., 560.]
+WINDOWS = {
+    '520.0': {'fit': [[505., 512.], [528., 535.]], 'ew': [[515., 525.]]},
+    '560.0': {'fit': [[545., 552.], [568., 575.]], 'ew': [[555., 565.], [557., 563.]]},
+}
+
+
+def test_measure_spectrum(spectrum):
+    xs, ys = spectrum
+    results = measure_spectrum(xs, ys, FEATURES + [540.], WINDOWS)
+    assert results['540.0'] == []
+    assert len(results['560.0']) == 2
+    assert results['520.0'][0] == pytest.approx(0.4 * np.sqrt(2 * np.pi), rel=1e-2)
+    assert results['560.0'][0] == pytest.approx(0.2 * 0.5 * np.sqrt(2 * np.pi), rel=1e-2)
+
+    # a single feature measured on its own (as in the interactive session) gives the same EW
+    bounds = get_indices(xs, WINDOWS['520.0']['fit'])
+    coefficients = fit_continuum(xs, ys, [bounds], [520.])
+    ew = equivalent_widths(xs, ys, [get_indices(xs, WINDOWS['520.0']['ew'][0])], coefficients, [520.])[0]
+    assert ew == results['520.0'][0]
+
+
+def test_measure_records_warns_about_blends(spectrum, caplog):
+    xs, ys = spectrum
+    records = measure_records(xs, ys, FEATURES + [522.], WINDOWS)
+    assert [record['feature'] for record in records] == [520., 560., 560.]
+    assert 'The integration window [515.0, 525.0] of 520.0 is blended with [522.0].' in caplog.text
+    assert '560.0 is blended' not in caplog.text
+
+
+def test_measure_records_with_profiles(spectrum):
+    xs, ys = spectrum
+    records = measure_records(xs, ys, FEATURES, WINDOWS, profile='gaussian')
+    assert len(records) == 3
+    profile = records[0]['profile']
+    assert profile['name'] == 'gaussian' and profile['converged']
+    assert profile['center'][0] == pytest.approx(520., abs=1e-3)
+    assert profile['fwhm'][0] == pytest.approx(2 * np.sqrt(2 * np.log(2)), rel=1e-2)
+    assert profile['depth'][0] == pytest.approx(0.4, rel=1e-2)
+    assert profile['ew'][0] == pytest.approx(records[0]['ew'], rel=1e-2)
+    assert np.array(profile['covariance']).shape == (3, 3)
+    assert records[1]['profile']['center'][0] == pytest.approx(560., abs=1e-3)
+
+    # centers and widths are given in the rest frame of the features
+    moved = measure_records(xs * (1 + 100. / 299792.458), ys, FEATURES, WINDOWS, profile='gaussian', velocity=100.)
+    assert moved[0]['profile']['center'][0] == pytest.approx(520., abs=1e-3)
+    assert moved[0]['profile']['fwhm'][0] == pytest.approx(profile['fwhm'][0], rel=1e-3)
+
+
+def test_measure_records_with_uncertainties(spectrum):
+    xs, ys = spectrum
+    ys = ys + np.random.default_rng(2).normal(0., 0.01, len(ys))
+    records = measure_records(xs, ys, FEATURES, WINDOWS, realizations=200, seed=1)
+    assert all(record['ew_error'] > 0 for record in records)
+    lower, median, upper = np.array([record['ew_percentiles'] for record in records])[:, 1:4].T
+    assert np.all((lower < median) & (median < upper))
+    assert median == pytest.approx([record['ew'] for record in records], abs=0.05)
+
+    normalized = measure_records(xs, ys / 2.2, [520.], {'520.0': {'ew': WINDOWS['520.0']['ew']}}, normalized=True,
+                                 realizations=200, seed=1)
+    assert normalized[0]['ew_error'] < records[0]['ew_error']
+
+
+def test_run_batch_and_cli(spectrum, tmp_path):
+    xs, ys = spectrum
+    columns = [fits.Column(name='lambda', format='D', array=xs), fits.Column(name='flux', format='D', array=ys)]
+    fits.BinTableHDU.from_columns(columns).writeto(tmp_path / 'star.fits')
+    windows_file = str(tmp_path / 'windows.json')
+    write_windows_json(WINDOWS, windows_file)
+
+    results, errors = run_batch(str(tmp_path), WINDOWS)
+    assert list(results) == ['star.fits']
+    assert errors == {}
+    assert results['star.fits'] == measure_spectrum(xs, ys, FEATURES, WINDOWS)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['batch', str(tmp_path), '--windows', windows_file])
+    assert result.exit_code == 0
+    assert 'star.fits' in result.output
+
+    output_file = str(tmp_path / 'results.json')
+    store_file = str(tmp_path / 'results.db')
+    table_file = str(tmp_path / 'results.fits')
+    result = runner.invoke(cli.main, ['batch', str(tmp_path), '-w', windows_file, '-o', output_file, '-s', store_file,
+                                      '-t', table_file])
+    assert result.exit_code == 0
+    assert read_measurements_json(output_file) == results
+    assert len(Table.read(table_file)) == 3
+    with MeasurementStore(store_file) as store:
+        assert store.results('star.fits') == {feature: ews for feature, ews in results['star.fits'].items() if ews}
+        record = next(store.query('star.fits', 560.))
+        assert record['ew_range'] == tuple(WINDOWS['560.0']['ew'][0])
+        assert record['fit_ranges'] == WINDOWS['560.0']['fit']
+        assert len(record['coefficients']) == 2
+        assert record['profile'] is None
+
+    result = runner.invoke(cli.main, ['batch', str(tmp_path), '-w', windows_file, '--profile', 'gaussian'])
+    assert result.exit_code != 0
+    result = runner.invoke(cli.main, ['batch', str(tmp_path), '-w', windows_file, '-s', store_file,
+                                      '--pattern', 'star.fits', '--profile', 'gaussian', '--realizations', '10'])
+    assert result.exit_code == 0
+    with MeasurementStore(store_file) as store:
+        record = list(store.query('star.fits', 520.))[-1]
+        assert record['profile']['center'][0] == pytest.approx(520., abs=1e-3)
+        assert len(record['ew_percentiles']) == 5
+
+
+def test_measure_file_uncertainties_are_reproducible(spectrum, tmp_path):
+    xs, ys = spectrum
+    ys = ys + np.random.default_rng(3).normal(0., 0.01, len(ys))
+    columns = [fits.Column(name='lambda', format='D', array=xs), fits.Column(name='flux', format='D', array=ys)]
+    fits.BinTableHDU.from_columns(columns).writeto(tmp_path / 'star.fits')
+
+    def errors(seed):
+        records = measure_file(str(tmp_path / 'star.fits'), WINDOWS, FEATURES, records=True, realizations=20,
+                               seed=seed)
+        return [record['ew_error'] for record in records]
+
+    assert errors(1) == errors(1)
+    assert errors(1) != errors(2)
+    assert spectrum_seed(1, str(tmp_path / 'star.fits')) != spectrum_seed(1, str(tmp_path / 'other.fits'))
+
+
+def test_run_batch_parallel_isolates_errors(spectrum, tmp_path):
+    xs, ys = spectrum
+    columns = [fits.Column(name='lambda', format='D', array=xs), fits.Column(name='flux', format='D', array=ys)]
+    for arm in ('UVB', 'VIS', 'NIR'):
+        (tmp_path / arm).mkdir()
+        fits.BinTableHDU.from_columns(columns).writeto(tmp_path / arm / 'star.fits')
+    (tmp_path / 'VIS' / 'corrupt.fits').write_bytes(b'not a fits file')
+
+    results, errors = run_batch(str(tmp_path), WINDOWS, pattern='*/*.fits', workers=2, ordered=False)
+    assert sorted(results) == [os.path.join(arm, 'star.fits') for arm in ('NIR', 'UVB', 'VIS')]
+    assert list(errors) == [os.path.join('VIS', 'corrupt.fits')]
+
+    merged = merge_results(results)
+    assert len(merged['520.0']) == 3
+    assert len(merged['560.0']) == 6
+
+
+def test_measure_normalized_cache(spectrum, tmp_path):
+    xs, ys = spectrum
+    coefficients = fit_continuum(xs, ys, [get_indices(xs, WINDOWS['520.0']['fit'])], [520.])
+    ys_fit, ys_norm = normalize(xs, ys, coefficients[0], 520.)
+    write_norm_cache(str(tmp_path / 'star.norm.npy'), xs, ys_norm, ys_fit)
+
+    windows = {'520.0': {'ew': WINDOWS['520.0']['ew']}}
+    results, errors = run_batch(str(tmp_path), windows, pattern='*.norm.npy')
+    assert results['star.norm.npy']['520.0'] == pytest.approx(measure_spectrum(xs, ys, [520.], WINDOWS)['520.0'])
+
+
+def test_measure_spectrum_with_automatic_continuum(spectrum):
+    xs, ys = spectrum
+    windows = {feature: {'ew': ranges['ew']} for feature, ranges in WINDOWS.items()}
+    results = measure_spectrum(xs, ys, FEATURES, windows, auto=True)
+    assert results['520.0'][0] == pytest.approx(0.4 * np.sqrt(2 * np.pi), rel=3e-2)
+    assert results['560.0'][0] == pytest.approx(0.2 * 0.5 * np.sqrt(2 * np.pi), rel=3e-2)
+
+
+def test_normalize_files_with_continuum_definition(spectrum, tmp_path):
+    xs, ys = spectrum
+    # two spectra share a grid and are normalized together, the third is shifted by one pixel
+    for i, scale in enumerate((1., 2., 3.)):
+        columns = [fits.Column(name='lambda', format='D', array=xs[i // 2:]),
+                   fits.Column(name='flux', format='D', array=scale * ys[i // 2:])]
+        fits.BinTableHDU.from_columns(columns).writeto(tmp_path / f'star{i}.fits')
+    cont_file = str(tmp_path / 'star.cont')
+    write_cont(ContinuumDefinition([[[505., 512.], [528., 535.]], [[545., 552.], [568., 575.]]], [1, 1],
+                                   np.empty((0, 2))), cont_file)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['normalize', str(tmp_path), '--cont', cont_file])
+    assert result.exit_code == 0
+    output_files = result.output.split()
+    assert output_files == normalize_files(sorted(str(tmp_path / f'star{i}.fits') for i in range(3)), cont_file)
+
+    # the continuum scales with the flux, all spectra normalize to the same result
+    _, ys_norm, ys_fit, _, provenance = read_norm_cache(output_files[0])
+    assert provenance['continuum_definition'] == cont_file
+    assert np.allclose(read_norm_cache(output_files[1])[1], ys_norm, equal_nan=True)
+    assert np.allclose(read_norm_cache(output_files[2])[2], 3 * ys_fit[1:], equal_nan=True)
+
+    windows = {'520.0': {'ew': WINDOWS['520.0']['ew']}}
+    results, _ = run_batch(str(tmp_path), windows, pattern='*.fits.npy')
+    assert results['star0.fits.npy']['520.0'][0] == pytest.approx(0.4 * np.sqrt(2 * np.pi), rel=2e-2)
@@ -0,0 +1,82 @@
+"""Tests for `nifty.continuum`."""
+
+import numpy as np
+
+from nifty.continuum import ContinuumFit, ContinuumTemplate, fit_continuum, get_indices, index_ranges, normalize
+from nifty.io import ContinuumDefinition
+
+
+def test_fit_continuum_matches_polyfit(spectrum):
+    xs, ys = spectrum
+    bounds = get_indices(xs, [[505., 512.], [528., 535.]])
+    coefficients = fit_continuum(xs, ys, [bounds], [520.], degree=2)[0]
+    pixels = np.concatenate([np.arange(*b) for b in bounds])
+    expected = np.polyfit(xs[pixels] - 520., ys[pixels], 2)
+    assert np.allclose(coefficients, expected)
+
+
+def test_index_ranges_round_trip():
+    xs = np.linspace(500., 600., 101)
+    bounds = np.array([[0, 10], [1, 5], [40, 41], [90, 100]])
+    assert np.array_equal(get_indices(xs, index_ranges(xs, bounds)), bounds)
+
+
+def test_fit_continuum_without_pixels_is_nan(spectrum):
+    xs, ys = spectrum
+    coefficients = fit_continuum(xs, ys, [[[0, 0]], [[10, 100]]], [510., 520.])
+    assert np.isnan(coefficients[0]).all()
+    assert np.isfinite(coefficients[1]).all()
+
+
+def test_incremental_continuum_fit(spectrum):
+    xs, ys = spectrum
+    bounds = get_indices(xs, [[505., 512.], [528., 535.], [540., 545.]])
+    fit = ContinuumFit(xs, ys, 520., degree=2)
+    for indmin, indmax in bounds:
+        fit.add(indmin, indmax)
+    assert np.array_equal(fit.coefficients, fit_continuum(xs, ys, [bounds], [520.], degree=2)[0])
+    assert len(fit.xs_data) == (bounds[:, 1] - bounds[:, 0]).sum()
+
+    fit.undo()
+    assert np.allclose(fit.coefficients, fit_continuum(xs, ys, [bounds[:2]], [520.], degree=2)[0])
+    assert np.allclose(fit.polyfit_coefficients, np.polyfit(fit.xs_data, fit.ys_data, 2))
+
+    fit.remove(*bounds[0])
+    fit.remove(*bounds[1])
+    assert fit.windows == []
+    assert np.isnan(fit.coefficients).all()
+
+
+def test_normalize_into_preallocated_arrays(spectrum):
+    xs, ys = spectrum
+    coefficients = np.array([0.01, 2.2])
+    expected_fit = np.polyval(coefficients, xs - 520.)
+
+    ys_fit, ys_norm = normalize(xs, ys, coefficients, 520.)
+    assert np.allclose(ys_fit, expected_fit)
+    assert np.allclose(ys_norm, ys / expected_fit)
+
+    buffers = np.empty(len(xs)), np.empty(len(xs))
+    result = normalize(xs, ys, coefficients, 520., *buffers, bounds=(100, 200))
+    assert result[0] is buffers[0] and result[1] is buffers[1]
+    assert np.isnan(buffers[1][:100]).all() and np.isnan(buffers[1][200:]).all()
+    assert np.allclose(buffers[1][100:200], ys[100:200] / expected_fit[100:200])
+
+
+def test_continuum_template():
+    xs = np.linspace(500., 600., 1001)
+    definition = ContinuumDefinition([[[505., 510.], [520., 525.]], [[550., 560.], [570., 580.]]], [1, 2],
+                                     np.empty((0, 2)))
+    template = ContinuumTemplate(definition, xs)
+    ys = np.stack([2. + 0.01 * (xs - 500.), 1. + 1e-4 * (xs - 560.) ** 2])
+    ys_fit, ys_norm = template.normalize(ys)
+
+    # polynomials are exact inside their region, NaN outside of all regions
+    inside = (xs >= 505.) & (xs <= 525.) | (xs >= 550.) & (xs <= 580.)
+    assert np.allclose(ys_fit[0, inside], ys[0, inside])
+    assert np.allclose(ys_norm[1, (xs >= 550.) & (xs <= 580.)], 1.)
+    assert np.isnan(ys_fit[:, (xs < 505.) | (xs > 580.)]).all()
+    # linear between the regions and the same for a single spectrum
+    gap = (xs > 525.) & (xs < 550.)
+    assert np.allclose(ys_fit[0, gap], ys[0, gap])
+    assert np.allclose(template.continuum(ys[1]), ys_fit[1], equal_nan=True)
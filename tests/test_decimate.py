@@ -0,0 +1,32 @@
+"""Tests for `nifty.decimate`."""
+
+import numpy as np
+
+from nifty.decimate import MinMaxPyramid, minmax_decimate
+
+
+def test_pyramid_keeps_narrow_features():
+    xs = np.linspace(0., 1., 1000001)
+    ys = np.ones_like(xs)
+    ys[123457] = 0.
+    ys[654321] = 2.
+    pyramid = MinMaxPyramid(xs, ys)
+
+    for max_points in (100, 1000, 10000):
+        xs_level, ys_level = pyramid.select(0., 1., max_points)
+        assert len(xs_level) <= max_points + 2
+        assert np.all(np.diff(xs_level) >= 0)
+        assert ys_level.min() == 0. and ys_level.max() == 2.
+
+    # zoomed in far enough all pixels are drawn
+    xs_zoom, ys_zoom = pyramid.select(0.1234, 0.1235, 1000)
+    assert np.array_equal(xs_zoom, xs[123399:123501])
+
+
+def test_minmax_decimate_ignores_nan():
+    xs = np.arange(10000.)
+    ys = np.full(10000, np.nan)
+    ys[5000:6000] = np.sin(xs[5000:6000])
+    xs_dec, ys_dec = minmax_decimate(xs, ys, 500)
+    assert len(xs_dec) <= 500
+    assert np.nanmin(ys_dec) == np.nanmin(ys) and np.nanmax(ys_dec) == np.nanmax(ys)
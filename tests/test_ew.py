@@ -0,0 +1,74 @@
+"""Tests for `nifty.ew`."""
+
+import numpy as np
+import pytest
+
+from nifty.ew import EWIntegrator, equivalent_widths, pixel_widths
+
+
+@pytest.fixture
+def log_spectrum():
+    # constant resolution grid with two Gaussian absorption lines
+    xs = 500. * np.exp(np.arange(20000) * 1e-5)
+    ys_norm = 1 - 0.4 * np.exp(-0.5 * ((xs - 505.) / 0.2) ** 2) - 0.1 * np.exp(-0.5 * ((xs - 515.) / 0.4) ** 2)
+    return xs, ys_norm
+
+
+def test_pixel_widths_non_uniform(log_spectrum):
+    xs, _ = log_spectrum
+    widths = pixel_widths(xs)
+    assert widths.sum() == pytest.approx(xs[-1] - xs[0] + 0.5 * (widths[0] + widths[-1]))
+    assert widths[-1] > widths[0]
+
+
+@pytest.mark.parametrize('method', ['edges', 'trapezoid'])
+def test_ew_integrator(log_spectrum, method):
+    xs, ys_norm = log_spectrum
+    integrator = EWIntegrator(xs, ys_norm, method=method)
+    ews = integrator.measure([[503., 507.], [510., 520.], [503., 505.], [505., 507.]])
+    assert ews[0] == pytest.approx(0.4 * 0.2 * np.sqrt(2 * np.pi), rel=1e-6)
+    assert ews[1] == pytest.approx(0.1 * 0.4 * np.sqrt(2 * np.pi), rel=1e-6)
+    assert ews[2] + ews[3] == pytest.approx(ews[0])
+
+
+def test_ew_integrator_errors(log_spectrum):
+    xs, ys_norm = log_spectrum
+    integrator = EWIntegrator(xs, ys_norm, errors=np.full(len(xs), 0.01))
+    ews, errors = integrator.measure([[503., 507.]])
+    indmin, indmax = np.searchsorted(integrator.edges, [503., 507.])
+    widths = pixel_widths(xs)[indmin:indmax]
+    assert errors[0] == pytest.approx(0.01 * np.sqrt(np.sum(widths ** 2)), rel=1e-2)
+
+
+@pytest.mark.parametrize('method', ['edges', 'trapezoid'])
+def test_ew_integrator_variance_is_exact(method):
+    # the EW is linear in the depths, the weight of every pixel is the EW of a unit depth at that pixel
+    rng = np.random.default_rng(3)
+    xs = np.cumsum(rng.uniform(0.5, 1.5, 12))
+    errors = rng.uniform(0.01, 0.1, len(xs))
+    ranges = [[xs[0] - 5, xs[-1] + 5], [xs[3], xs[7]], [xs[4] + 0.1, xs[4] + 0.3], [xs[2] + 0.2, xs[9] - 0.7],
+              [xs[0] + 0.1, xs[1] - 0.1], [xs[5], xs[5]]]
+    weights = np.array([EWIntegrator(xs, 1 - unit, method=method).measure(ranges) for unit in np.eye(len(xs))])
+    _, ew_errors = EWIntegrator(xs, np.ones(len(xs)), errors=errors, method=method).measure(ranges)
+    assert np.allclose(ew_errors, np.sqrt(np.sum((errors[:, np.newaxis] * weights) ** 2, axis=0)))
+
+    # a missing pixel only spoils the windows overlapping it
+    ys_norm = np.ones(len(xs))
+    ys_norm[4] = np.nan
+    ews = EWIntegrator(xs, ys_norm, method=method).measure(ranges)
+    assert np.array_equal(np.isnan(ews), weights[4] > 0)
+
+
+def test_equivalent_widths_matches_integrator(log_spectrum):
+    xs, ys_norm = log_spectrum
+    bounds = np.searchsorted(xs, [[503., 507.], [510., 520.]])
+    ews, errors = equivalent_widths(xs, ys_norm, bounds, [[1.]], [0.], groups=[0, 0], errors=np.full(len(xs), 0.01))
+    edges = EWIntegrator(xs, ys_norm).edges
+    assert np.allclose(ews, EWIntegrator(xs, ys_norm).measure(edges[bounds]))
+    assert np.all(errors > 0)
+
+
+def test_pixel_widths_of_selected_pixels(log_spectrum):
+    xs, _ = log_spectrum
+    pixels = np.array([0, 1, 5000, len(xs) - 1])
+    assert np.allclose(pixel_widths(xs, pixels), pixel_widths(xs)[pixels])
@@ -0,0 +1,38 @@
+"""Tests for `nifty.features`."""
+
+import numpy as np
+
+from nifty.continuum import get_indices
+from nifty.features import FeatureIndex
+from nifty.io import read_features
+
+
+def test_feature_index_bounds():
+    xs = np.linspace(400., 700., 3001)
+    index = FeatureIndex([600., 450., 500.], xs, x_range_factor=0.01)
+    assert index.features.tolist() == [450., 500., 600.]
+    assert np.array_equal(index.bounds[1], get_indices(xs, (495., 505.)))
+
+    index.update(x_range_factor=0.02)
+    assert np.array_equal(index.bounds[1], get_indices(xs, (490., 510.)))
+
+    # regions widened by half their half width on each side
+    index.update(margins=[0.5])
+    assert np.array_equal(index.region_bounds(1, 0.5), get_indices(xs, (485., 515.)))
+    assert np.array_equal(index.region_bounds(1, 1.), get_indices(xs, (480., 520.)))
+    assert list(index.margin_bounds) == [0.5]
+
+
+def test_feature_index_queries():
+    index = FeatureIndex([0.5780, 0.5797, 0.6196, 0.6203, 0.6614], x_range_factor=0.002)
+    assert index[index.in_range(0.57, 0.62)].tolist() == [0.5780, 0.5797, 0.6196]
+    assert index.in_ranges([[0.619, 0.621], [0.66, 0.67], [0.7, 0.8]]).tolist() == [[2, 4], [4, 5], [5, 5]]
+    assert index.blended(0.619, 0.621, 0.6196) == [0.6203]
+    assert index.blended(0.66, 0.67, 0.6614) == []
+
+
+def test_feature_index_of_packaged_dibs():
+    features = read_features()
+    index = FeatureIndex(features)
+    assert len(index) == 153
+    assert np.all(np.diff(index.features) >= 0)
@@ -0,0 +1,54 @@
+"""Import checks for headless use of `nifty`."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import nifty
+from nifty.io import write_norm_cache, write_windows_json
+
+
+GUI_MODULES = ('matplotlib', 'scipy', 'astropy')
+# generous cold start budget of the command line interface in seconds, some ten times the headless import;
+# importing the GUI or astropy stack at start up again exceeds it on a typical machine
+CLI_IMPORT_BUDGET = 2.
+
+
+def run_python(*args, cwd=None):
+    # a fresh interpreter that finds this copy of nifty from any working directory
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(nifty.__file__))))
+    return subprocess.run([sys.executable] + list(args), cwd=cwd, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+def test_headless_imports_skip_gui_modules():
+    for module in ('nifty', 'nifty.cli', 'nifty.batch'):
+        statement = (f'import sys, {module}; '
+                     f'print(" ".join(sorted({{name.split(".")[0] for name in sys.modules}})))')
+        imported = set(run_python('-c', statement).stdout.split())
+        assert module.split('.')[0] in imported
+        assert not imported.intersection(GUI_MODULES), module
+
+
+def test_cli_import_time_budget():
+    # the cumulative import time as reported by the interpreter, independent of the interpreter start up
+    stderr = run_python('-X', 'importtime', '-c', 'import nifty.cli').stderr
+    cumulative = [int(line.split('|')[1]) for line in stderr.splitlines()
+                  if line.startswith('import time:') and line.split('|')[-1].strip() == 'nifty.cli']
+    if not cumulative:
+        pytest.skip('-X importtime needs Python 3.7')
+    assert cumulative[0] * 1e-6 < CLI_IMPORT_BUDGET
+
+
+def test_batch_of_normalized_spectra_skips_astropy(spectrum, tmp_path):
+    xs, ys = spectrum
+    write_norm_cache(str(tmp_path / 'star.norm.npy'), xs, ys / (2. + 0.01 * (xs - 500.)))
+    write_windows_json({'520.0': {'ew': [[515., 525.]]}}, str(tmp_path / 'windows.json'))
+    statement = ('import sys; from nifty.cli import main; '
+                 f'main(["batch", {str(tmp_path)!r}, "-w", {str(tmp_path / "windows.json")!r}, '
+                 '"--pattern", "*.npy", "-o", "results.json"], standalone_mode=False); '
+                 f'assert not {set(GUI_MODULES)!r}.intersection(sys.modules)')
+    run_python('-c', statement, cwd=str(tmp_path))
+    assert (tmp_path / 'results.json').exists()
@@ -0,0 +1,153 @@
+"""Tests for `nifty.io`."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from nifty import io
+from nifty.continuum import ContinuumTemplate
+
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'example')
+UVB_DIR = os.path.join(EXAMPLE_DIR, 'UVB')
+VIS_FILE = os.path.join(EXAMPLE_DIR, 'VIS', 'StRS136_VIS_095.C-0446_XSHOO.2015-08-13T03_50_38.281_tpl_A_handy_bcorr.fits')
+
+
+def test_read_2d_fits_spectrum():
+    io.clear_fits_cache()
+    xs, ys = io.read_2d_fits_spectrum(VIS_FILE)
+    with fits.open(VIS_FILE) as fits_file:
+        assert np.array_equal(xs, fits_file[1].data['lambda'])
+        assert np.array_equal(ys, fits_file[1].data['flux'])
+    assert xs.dtype == np.dtype('>f8')
+    assert not xs.flags.writeable
+
+    # cached columns are returned as they are, native columns are converted once
+    assert io.read_2d_fits_spectrum(VIS_FILE)[0] is xs
+    native_xs, _ = io.read_2d_fits_spectrum(VIS_FILE, native=True)
+    assert native_xs.dtype.isnative
+    assert np.array_equal(native_xs, xs)
+
+
+def test_read_2d_fits_spectrum_reloads_modified_file(tmp_path):
+    input_file = str(tmp_path / 'spectrum.fits')
+    for i in range(2):
+        n = 5 + 100 * i
+        columns = [fits.Column(name='lambda', format='D', array=np.arange(float(n))),
+                   fits.Column(name='flux', format='E', array=np.full(n, i))]
+        fits.BinTableHDU.from_columns(columns).writeto(input_file, overwrite=True)
+        # rewritten within the resolution of the mtime
+        os.utime(input_file, ns=(10 ** 9, 10 ** 9))
+        xs, ys = io.read_2d_fits_spectrum(input_file)
+        assert ys.dtype == np.float64
+        assert len(ys) == n and (ys == i).all()
+
+
+def test_read_2d_fits_spectrum_columns_in_different_hdus(tmp_path):
+    input_file = str(tmp_path / 'spectrum.fits')
+    hdus = [fits.PrimaryHDU(), fits.BinTableHDU.from_columns([fits.Column(name='lambda', format='D', array=[1., 2.])]),
+            fits.BinTableHDU.from_columns([fits.Column(name='flux', format='D', array=[3., 4.])])]
+    fits.HDUList(hdus).writeto(input_file)
+    xs, ys = io.read_2d_fits_spectrum(input_file)
+    assert xs.tolist() == [1., 2.] and ys.tolist() == [3., 4.]
+
+
+def test_read_2d_fits_spectrum_from_threads(tmp_path, monkeypatch):
+    input_files = [str(tmp_path / f'spectrum{i}.fits') for i in range(3)]
+    for i, input_file in enumerate(input_files):
+        columns = [fits.Column(name='lambda', format='D', array=np.arange(1000.)),
+                   fits.Column(name='flux', format='D', array=np.full(1000, i))]
+        fits.BinTableHDU.from_columns(columns).writeto(input_file)
+    # every read evicts and closes the file read before, also when another thread reads it
+    io.clear_fits_cache()
+    monkeypatch.setattr(io._fits_handles, 'maxsize', 1)
+    monkeypatch.setattr(io._fits_columns, 'maxsize', 1)
+
+    def read(i):
+        return io.read_2d_fits_spectrum(input_files[i % 3], native=True)[1].sum() == 1000 * (i % 3)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(read, range(60)))
+    io.clear_fits_cache()
+
+
+def test_lru_cache_evicts_once_from_threads():
+    evicted = []
+    cache = io.LRUCache(8, on_evict=evicted.append)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda key: cache.put(key, key) or cache.get(key), range(1000)))
+    assert len(cache.items) == 8
+    assert sorted(evicted + list(cache.items)) == list(range(1000))
+
+
+def test_read_2d_fits_spectrum_missing_keys():
+    with pytest.raises(ValueError):
+        io.read_2d_fits_spectrum(VIS_FILE, ykey='missing')
+
+
+def test_norm_cache(tmp_path):
+    norm_file = str(tmp_path / 'spectrum.norm')
+    with open(norm_file, 'w') as f:
+        f.write('wave flux\n500.0 1.0\n500.1 0.5\n500.2 0.9\n')
+
+    xs, ys_norm = io.load_norm(norm_file)
+    assert np.array_equal(xs, [500.0, 500.1, 500.2])
+    assert np.array_equal(ys_norm, [1.0, 0.5, 0.9])
+
+    cache_file = io.norm_cache_path(norm_file)
+    xs, ys_norm, ys_fit, errors, provenance = io.read_norm_cache(cache_file)
+    assert isinstance(xs, np.memmap)
+    assert np.isnan(ys_fit).all() and np.isnan(errors).all()
+    assert provenance['source'] == os.path.abspath(norm_file)
+
+    io.write_norm_cache(cache_file, xs, ys_norm * 2, np.ones(3), provenance={'source': 'fit'})
+    assert np.array_equal(io.read_norm_cache(cache_file)[1], [2.0, 1.0, 1.8])
+    assert io.read_norm_cache(cache_file)[4]['source'] == 'fit'
+
+    # flux errors have their own row, the continuum stays empty
+    io.write_spectrum_cache(cache_file, xs, ys_norm, errors=[0.1, 0.2, 0.3])
+    _, _, ys_fit, errors, provenance = io.read_norm_cache(cache_file)
+    assert np.isnan(ys_fit).all() and np.array_equal(errors, [0.1, 0.2, 0.3])
+    assert not provenance['normalized']
+
+    # caches without the error row are still read
+    np.save(cache_file, np.stack([xs, ys_norm, np.ones(3)]))
+    _, _, ys_fit, errors, _ = io.read_norm_cache(cache_file)
+    assert np.array_equal(ys_fit, np.ones(3)) and np.isnan(errors).all()
+
+
+def test_cont_round_trip(tmp_path):
+    for arm in ('UVB', 'VIS', 'NIR'):
+        cont_file = [name for name in os.listdir(os.path.join(EXAMPLE_DIR, arm)) if name.endswith('.cont')][0]
+        cont_file = os.path.join(EXAMPLE_DIR, arm, cont_file)
+        definition = io.read_cont(cont_file)
+        assert len(definition.regions) == len(definition.orders)
+        io.write_cont(definition, str(tmp_path / 'written.cont'))
+        with open(cont_file) as expected, open(tmp_path / 'written.cont') as written:
+            assert written.read() == expected.read()
+
+    definition = io.read_cont(cont_file)
+    assert definition.orders[:3] == [3, 3, 3]
+    assert definition.regions[0][0].tolist() == [995.382, 996.430]
+
+
+def test_cont_template_reproduces_stored_continuum():
+    # the UVB handy file holds the continuum fitted with its .cont file
+    name = 'StRS136_UVB_095.C-0446_XSHOO.2015-08-13T03_50_33.070_tpl_A_notac'
+    definition = io.read_cont(os.path.join(UVB_DIR, name + '.cont'))
+    xs, ys = io.read_2d_fits_spectrum(os.path.join(UVB_DIR, name + '_handy.fits'))
+    _, ys_cont = io.read_2d_fits_spectrum(os.path.join(UVB_DIR, name + '_handy.fits'), ykey='cont')
+
+    ys_fit = ContinuumTemplate(definition, xs).continuum(ys)
+    assert np.array_equal(np.isnan(ys_fit), np.isnan(ys_cont))
+    assert np.allclose(ys_fit, ys_cont, rtol=1e-3, equal_nan=True)
+
+
+def test_read_cont_mismatched_orders(tmp_path):
+    cont_file = tmp_path / 'broken.cont'
+    cont_file.write_text('# Ranges grouped in regions\n500.0 510.0\n520.0 530.0\n# Orders\n3\n')
+    with pytest.raises(ValueError):
+        io.read_cont(str(cont_file))
@@ -2,36 +2,135 @@
 
 """Tests for `nifty` package."""
 
+import json
+import os
+import threading
+
+import matplotlib
+import numpy as np
 import pytest
 
 from click.testing import CliRunner
 
-from nifty import main
 from nifty import cli
+from nifty.io import write_spectrum_cache
 
+matplotlib.use('Agg')
 
-@pytest.fixture
-def response():
-    """Sample pytest fixture.
 
-    See more at: http://doc.pytest.org/en/latest/fixture.html
-    """
-    # import requests
-    # return requests.get('https://github.com/audreyr/cookiecutter-pypackage')
+EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'example')
+UVB_FILE = os.path.join(EXAMPLE_DIR, 'UVB',
+                        'StRS136_UVB_095.C-0446_XSHOO.2015-08-13T03_50_33.070_tpl_A_notac_handy.fits')
 
 
-def test_content(response):
-    """Sample pytest test function with the pytest fixture as an argument."""
-    # from bs4 import BeautifulSoup
-    # assert 'GitHub' in BeautifulSoup(response.content).title.string
+@pytest.fixture
+def runner():
+    yield CliRunner()
+    from matplotlib import pyplot
+    pyplot.close('all')
 
 
-def test_command_line_interface():
+def test_command_line_interface(runner):
     """Test the CLI."""
-    runner = CliRunner()
     result = runner.invoke(cli.main)
     assert result.exit_code == 0
-    assert 'nifty.cli.main' in result.output
+    for command in ('interactive', 'batch', 'convert', 'normalize', 'stitch', 'bench'):
+        assert command in result.output
     help_result = runner.invoke(cli.main, ['--help'])
     assert help_result.exit_code == 0
-    assert '--help  Show this message and exit.' in help_result.output
+    assert '--timings FILE' in help_result.output
+    assert 'Show this message and exit.' in help_result.output
+
+
+def test_interactive(runner, tmp_path):
+    output_file = str(tmp_path / 'measurements.json')
+    result = runner.invoke(cli.main, ['interactive', UVB_FILE, '--feature-scale', '1000', '-o', output_file])
+    assert result.exit_code == 0
+    with open(output_file) as f:
+        measurements = json.load(f)
+    assert measurements and all(float(feature) < 556. for feature in measurements)
+
+    # the packaged DIB list is in micron, the UVB spectrum in nm
+    result = runner.invoke(cli.main, ['interactive', UVB_FILE])
+    assert result.exit_code != 0
+    assert '--feature-scale' in result.output
+
+    result = runner.invoke(cli.main, ['interactive'])
+    assert result.exit_code == 0
+    assert 'Demo mode' in result.output
+
+
+def test_interactive_several_spectra(runner, tmp_path):
+    cache_file = str(tmp_path / 'star.npy')
+    result = runner.invoke(cli.main, ['stitch', UVB_FILE, '--x-scale', '1', '-o', cache_file])
+    assert result.exit_code == 0
+    output_file = str(tmp_path / 'measurements.json')
+    result = runner.invoke(cli.main, ['interactive', UVB_FILE, cache_file, '--feature-scale', '1000',
+                                      '-o', output_file])
+    assert result.exit_code == 0
+    with open(output_file) as f:
+        measurements = json.load(f)
+    assert list(measurements) == [UVB_FILE, cache_file]
+
+    # a spectrum without features is skipped, the others are still measured and written
+    empty_file = str(tmp_path / 'empty.npy')
+    write_spectrum_cache(empty_file, np.linspace(1e4, 1.1e4, 100), np.ones(100))
+    result = runner.invoke(cli.main, ['interactive', UVB_FILE, empty_file, cache_file, '--feature-scale', '1000',
+                                      '-o', output_file])
+    assert result.exit_code == 1
+    assert f'Failed to open {empty_file}' in result.output
+    with open(output_file) as f:
+        measurements = json.load(f)
+    assert list(measurements) == [UVB_FILE, cache_file]
+
+
+def test_interactive_prefetches_next_spectrum(runner, tmp_path, monkeypatch):
+    from nifty import ui
+
+    spectra = [str(tmp_path / f'star{i}.npy') for i in range(4)]
+    xs = np.linspace(500., 560., 3000)
+    for spectrum in spectra:
+        write_spectrum_cache(spectrum, xs, 1 - 0.3 * np.exp(-0.5 * ((xs - 520.) / 0.5) ** 2), normalized=True)
+    threads = {}
+    started = {spectrum: threading.Event() for spectrum in spectra}
+    interactive_config = cli._interactive_config
+
+    def recording_config(spectrum, *args):
+        threads[spectrum] = threading.current_thread().name
+        started[spectrum].set()
+        return interactive_config(spectrum, *args)
+
+    def plot_ui(config, **kwargs):
+        # the next spectrum is in the works before the current one is closed
+        i = spectra.index(kwargs['spectrum'])
+        if i + 1 < len(spectra):
+            assert started[spectra[i + 1]].wait(10)
+        return plot_ui.original(config, **kwargs)
+
+    plot_ui.original = ui.PlotUI
+    monkeypatch.setattr(cli, '_interactive_config', recording_config)
+    monkeypatch.setattr(ui, 'PlotUI', plot_ui)
+    result = runner.invoke(cli.main, ['interactive'] + spectra + ['--feature-scale', '1000'])
+    assert result.exit_code == 0
+    assert threads[spectra[0]] == threading.current_thread().name
+    assert all(threads[spectrum].startswith('nifty-prefetch') for spectrum in spectra[1:])
+
+
+def test_stitch(runner, tmp_path):
+    vis_file = os.path.join(EXAMPLE_DIR, 'VIS', 'StRS136_VIS_095.C-0446_XSHOO.2015-08-13T03_50_38.281_tpl_A_handy.fits')
+    output_file = str(tmp_path / 'star.npy')
+    result = runner.invoke(cli.main, ['stitch', UVB_FILE, vis_file, '--x-scale', '1e-3', '--x-scale', '1',
+                                      '-o', output_file])
+    assert result.exit_code == 0
+    with open(output_file + '.json') as f:
+        provenance = json.load(f)
+    assert provenance['x_scales'] == [1e-3, 1.] and not provenance['normalized']
+
+    result = runner.invoke(cli.main, ['stitch', UVB_FILE, vis_file, '--x-scale', '1e-3', '-o', output_file])
+    assert result.exit_code != 0
+
+
+def test_bench(runner):
+    result = runner.invoke(cli.main, ['bench', '-n', '1000', '-r', '1'])
+    assert result.exit_code == 0
+    assert 'measure_spectrum' in result.output
@@ -0,0 +1,15 @@
+"""Tests for `nifty.noise`."""
+
+import numpy as np
+import pytest
+
+from nifty.noise import estimate_noise
+
+
+def test_estimate_noise():
+    rng = np.random.default_rng(1)
+    xs = np.linspace(0., 10., 20000)
+    sigma = np.where(xs < 5., 0.01, 0.05)
+    noise = estimate_noise(1. + 0.1 * xs + rng.normal(0., sigma), width=501)
+    assert np.median(noise[xs < 4.]) == pytest.approx(0.01, rel=0.1)
+    assert np.median(noise[xs > 6.]) == pytest.approx(0.05, rel=0.1)
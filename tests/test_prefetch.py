@@ -0,0 +1,57 @@
+"""Tests for `nifty.prefetch`."""
+
+import threading
+from types import SimpleNamespace
+
+import matplotlib
+import numpy as np
+
+matplotlib.use('Agg')
+
+from nifty.prefetch import Prefetcher, create_executor  # noqa: E402
+from nifty.ui import PlotConfig, PlotUI  # noqa: E402
+
+
+def test_prefetcher():
+    prefetcher = Prefetcher(maxsize=2)
+    try:
+        release = threading.Event()
+        prefetcher.prefetch('blocking', release.wait)
+        prefetcher.prefetch('queued', threading.get_ident)
+        # a computation still queued behind the blocking one is done right away when it is needed
+        assert prefetcher.get('queued', threading.get_ident) == threading.get_ident()
+        release.set()
+        assert prefetcher.get('blocking', release.wait)
+
+        prefetcher.prefetch('background', threading.get_ident)
+        prefetcher.futures.get('background').result()
+        assert prefetcher.get('background', threading.get_ident) != threading.get_ident()
+        assert list(prefetcher.futures.items) == ['blocking', 'background']
+        assert prefetcher.get('blocking', lambda: None)
+    finally:
+        prefetcher.close()
+    assert not prefetcher.futures.items
+
+
+def test_plot_config_prefetches_neighbours(spectrum):
+    xs, ys = spectrum
+    executor = create_executor()
+    try:
+        config = PlotConfig(xs, ys, [520., 540., 560.], executor=executor)
+        config.prepare()
+        assert config.pyramid is not None and config.continuum_mask is not None
+        ui = PlotUI(config, show=False)
+        assert ui.pyramid is config.pyramid
+        assert len(config.prefetcher.futures.items) == 3
+
+        ui.onpress(SimpleNamespace(key='right'))
+        ui.onpress(SimpleNamespace(key='a'))
+        reference = PlotConfig(xs, ys, [520., 540., 560.])
+        reference.next_dib()
+        windows = config.auto_fit_windows()
+        assert len(windows) and np.array_equal(windows, reference.auto_fit_windows())
+        assert len(config.prefetcher.futures.items) <= 4
+        matplotlib.pyplot.close(ui.fig)
+        config.close()
+    finally:
+        executor.shutdown()
@@ -0,0 +1,61 @@
+"""Tests for `nifty.profiles`."""
+
+import numpy as np
+import pytest
+
+from nifty.profiles import GAUSSIAN_FWHM, fit_profiles, pad_windows, profile_properties
+from nifty.synthetic import absorption_profiles, create_spectrum
+
+
+def test_pad_windows():
+    xs = np.arange(10.)
+    ys = np.arange(10.) + 1
+    ys[3] = np.nan
+    x, y, w = pad_windows(xs, ys, [(1, 5), (6, 8)], coefficients=[[2.], [0.5]], centers=[2., 7.])
+    assert x.shape == (2, 4)
+    assert np.array_equal(x[1], [6., 7., 6., 6.])
+    assert np.allclose(y, [[1., 1.5, 1., 2.5], [14., 16., 1., 1.]])
+    assert np.array_equal(w, [[4., 4., 0., 4.], [0.25, 0.25, 0., 0.]])
+
+
+@pytest.mark.parametrize('profile', ['gaussian', 'voigt'])
+def test_fit_profiles(profile):
+    # evenly spaced features keep the windows free of blends
+    features = np.linspace(410., 690., 20)
+    sigmas = np.linspace(0.1, 0.4, 20)
+    gammas = np.linspace(0.05, 0.2, 20) if profile == 'voigt' else None
+    depths = np.linspace(0.4, 0.1, 20)
+    spectrum = create_spectrum((400., 700.), 30000, 0, sn=500, continuum=(0., 2.), seed=4)
+    ys = spectrum.ys * (1 - absorption_profiles(spectrum.xs, features, sigmas, depths, gammas))
+
+    bounds = np.searchsorted(spectrum.xs, np.stack([features - 5., features + 5.], axis=1))
+    fit = fit_profiles(spectrum.xs, ys, bounds, features + 0.2, profile=profile, coefficients=np.full((20, 1), 2.))
+    assert fit.converged.all()
+    assert np.allclose(fit.parameters[:, 0, 0], features, atol=1e-2)
+    assert np.allclose(fit.parameters[:, 0, 1], sigmas, rtol=0.05)
+    assert np.allclose(fit.parameters[:, 0, -1], depths, atol=5e-3)
+
+    properties = profile_properties(fit)
+    pulls = (properties['center'][:, 0] - features) / properties['center_error'][:, 0]
+    assert np.all(np.abs(pulls) < 5)
+    if profile == 'gaussian':
+        assert np.allclose(properties['fwhm'][:, 0], GAUSSIAN_FWHM * sigmas, rtol=0.05)
+        assert np.allclose(properties['ew'][:, 0], depths * sigmas * np.sqrt(2 * np.pi), rtol=0.05)
+    else:
+        assert np.allclose(fit.parameters[:, 0, 2], gammas, rtol=0.1)
+
+
+def test_fit_blended_components():
+    spectrum = create_spectrum((500., 520.), 4000, 0, sn=1000, seed=5)
+    ys = spectrum.ys * (1 - absorption_profiles(spectrum.xs, np.array([509., 511.]), np.array([0.4, 0.3]),
+                                                np.array([0.3, 0.2])))
+    # explicit initial centers and centers spread over the window
+    fit = fit_profiles(spectrum.xs, ys, [(0, 4000), (0, 4000)], [[508.5, 511.5], [510., 510.]], components=2)
+    assert fit.parameters.shape == (2, 2, 3)
+    fit = fit_profiles(spectrum.xs, ys, [(0, 4000)], [510.], components=2)
+    assert np.allclose(fit.parameters[0, :, 0], [509., 511.], atol=1e-2)
+    assert np.allclose(fit.parameters[0, :, 2], [0.3, 0.2], atol=5e-3)
+
+    # too few pixels for the parameters
+    fit = fit_profiles(spectrum.xs, ys, [(0, 5)], [509.], components=2)
+    assert np.isnan(fit.parameters).all() and not fit.converged.any()
@@ -0,0 +1,68 @@
+"""Tests for `nifty.stitch`."""
+
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from nifty.features import FeatureIndex
+from nifty.io import read_2d_fits_spectrum, read_features, read_norm_cache, read_spectrum, write_spectrum_cache
+from nifty.stitch import common_grid, stitch
+
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'example')
+
+
+def test_common_grid():
+    grid = common_grid([np.linspace(300., 560., 1001), np.linspace(530., 1000., 2001)])
+    steps = np.diff(grid) / grid[:-1]
+    assert grid[0] == 300. and grid[-1] == pytest.approx(1000., rel=steps[0])
+    assert np.allclose(steps, steps[0])
+    assert steps[0] == pytest.approx(np.diff(np.linspace(530., 1000., 2001))[0] / 765., rel=1e-3)
+
+
+def test_stitch_weights_overlap_by_sn():
+    rng = np.random.default_rng(2)
+    blue = np.linspace(400., 520., 6001)
+    red = np.linspace(500., 700., 10001)
+    arms = [(blue, 1. + rng.normal(0., 0.1, len(blue))), (red, 1. + rng.normal(0., 0.01, len(red)))]
+    grid = np.linspace(400., 700., 3001)
+    xs, ys, errors = stitch(arms, errors=[np.full(len(blue), 0.1), np.full(len(red), 0.01)], grid=grid)
+
+    assert xs is grid
+    overlap = (grid > 500.) & (grid < 520.)
+    assert np.allclose(errors[overlap], 1 / np.sqrt(1 / 0.1 ** 2 + 1 / 0.01 ** 2))
+    assert np.allclose(errors[grid < 500.], 0.1) and np.allclose(errors[grid > 520.], 0.01)
+    expected = (np.interp(grid, *arms[0]) / 0.1 ** 2 + np.interp(grid, *arms[1]) / 0.01 ** 2) * errors ** 2
+    assert np.allclose(ys[overlap], expected[overlap])
+
+    with pytest.raises(ValueError):
+        stitch(arms, errors=[None])
+
+
+def test_stitch_gaps_and_bad_pixels():
+    arms = [(np.linspace(400., 500., 101), np.ones(101)), (np.linspace(600., 700., 101), np.full(101, 2.))]
+    arms[1][1][50] = 0.
+    xs, ys, _ = stitch(arms, errors=[np.full(101, 0.1)] * 2, grid=np.arange(400., 701.))
+    assert np.isnan(ys[(xs > 500.) & (xs < 600.)]).all()
+    assert np.isnan(ys[xs == 650.]) and ys[xs == 652.] == 2.
+
+
+def test_stitch_xshooter_arms(tmp_path):
+    arms = []
+    for arm in ('UVB', 'VIS', 'NIR'):
+        xs, ys = read_2d_fits_spectrum(glob.glob(os.path.join(EXAMPLE_DIR, arm, '*_bcorr.fits'))[0], ykey='norm')
+        # the UVB arm is in nm, the others in micron
+        arms.append((xs / 1000. if arm == 'UVB' else xs, ys))
+    xs, ys, errors = stitch(arms)
+    assert np.all(np.diff(xs) > 0)
+    assert xs[0] == arms[0][0][0] and xs[-1] <= arms[-1][0][-1]
+
+    output_file = str(tmp_path / 'star.npy')
+    write_spectrum_cache(output_file, xs, ys, errors)
+    assert np.array_equal(read_norm_cache(output_file)[3], errors, equal_nan=True)
+    xs, ys, normalized = read_spectrum(output_file)
+    assert not normalized
+    index = FeatureIndex(read_features())
+    assert len(index[index.in_range(xs[0], xs[-1])]) == len(index.features)
@@ -0,0 +1,52 @@
+"""Tests for `nifty.store`."""
+
+import sqlite3
+
+import pytest
+
+from nifty.store import MeasurementStore
+
+
+def test_store_appends_and_queries(tmp_path):
+    path = str(tmp_path / 'measurements.db')
+    with MeasurementStore(path) as store:
+        store.add('star1.fits', 520., 1.0, ew_range=(515., 525.), fit_ranges=[(505., 512.), (528., 535.)],
+                  coefficients=[0.01, 2.2])
+        store.add_many('star2.fits', [dict(feature=520., ew=1.1), dict(feature=560., ew=0.25, ew_error=0.01)])
+        # committed measurements are visible to other connections right away
+        reader = sqlite3.connect(path)
+        assert reader.execute('SELECT COUNT(*) FROM measurements').fetchone()[0] == 3
+        assert reader.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        reader.close()
+
+    with MeasurementStore(path) as store:
+        assert store.spectra() == ['star1.fits', 'star2.fits']
+        record, = store.query('star1.fits')
+        assert record['ew_range'] == (515., 525.)
+        assert record['fit_ranges'] == [[505., 512.], [528., 535.]]
+        assert record['coefficients'] == [0.01, 2.2]
+        assert record['created']
+
+        assert [r['ew'] for r in store.query(feature=520.)] == [1.0, 1.1]
+        assert next(store.query('star2.fits', 560.))['ew_error'] == pytest.approx(0.01)
+        assert store.results() == {'520.0': [1.0, 1.1], '560.0': [0.25]}
+        assert store.results('star2.fits') == {'520.0': [1.1], '560.0': [0.25]}
+
+
+def test_store_adds_new_columns(tmp_path):
+    path = str(tmp_path / 'measurements.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, spectrum TEXT NOT NULL, '
+                       'feature REAL NOT NULL, ew REAL, ew_error REAL, ew_min REAL, ew_max REAL, fit_ranges TEXT, '
+                       'coefficients TEXT, created TEXT NOT NULL)')
+    connection.execute("INSERT INTO measurements (spectrum, feature, ew, created) VALUES ('old.fits', 520., 1., '')")
+    connection.commit()
+    connection.close()
+
+    with MeasurementStore(path) as store:
+        store.add('new.fits', 520., 1.1, profile={'name': 'gaussian', 'center': [520.01]},
+                  ew_percentiles=[1.0, 1.1, 1.2])
+        old, new = store.query(feature=520.)
+        assert old['profile'] is None and old['ew_percentiles'] is None
+        assert new['profile'] == {'name': 'gaussian', 'center': [520.01]}
+        assert new['ew_percentiles'] == [1.0, 1.1, 1.2]
@@ -0,0 +1,36 @@
+"""Tests for `nifty.synthetic`."""
+
+import numpy as np
+import pytest
+
+from nifty.ew import EWIntegrator
+from nifty.synthetic import create_spectrum, gaussian_equivalent_widths
+
+
+def test_create_spectrum_is_reproducible():
+    a = create_spectrum(number_of_values=1000, seed=42)
+    b = create_spectrum(number_of_values=1000, seed=42)
+    assert np.array_equal(a.ys, b.ys)
+    assert not np.array_equal(a.ys, create_spectrum(number_of_values=1000, seed=1).ys)
+
+
+def test_gaussian_features_on_log_grid():
+    spectrum = create_spectrum((400., 700.), 2000000, 2000, sigma_range=(0.02, 0.1), depth_range=(0.1, 0.5),
+                               sn=np.inf, grid='log', seed=0)
+    assert np.all(np.diff(np.diff(spectrum.xs)) > 0)
+
+    # isolated lines recover their analytic EW
+    widths = 6 * spectrum.sigmas
+    isolated = np.ones(len(spectrum.features), dtype=bool)
+    isolated[1:] &= np.diff(spectrum.features) > widths[1:] + widths[:-1]
+    isolated[:-1] &= np.diff(spectrum.features) > widths[1:] + widths[:-1]
+    ranges = np.stack([spectrum.features - widths, spectrum.features + widths], axis=1)[isolated]
+    ews = EWIntegrator(spectrum.xs, spectrum.ys).measure(ranges)
+    assert ews == pytest.approx(gaussian_equivalent_widths(spectrum)[isolated], rel=1e-4)
+
+
+def test_voigt_features():
+    spectrum = create_spectrum((500., 510.), 10000, 3, sigma_range=(0.05, 0.1), gamma_range=(0.01, 0.05),
+                               depth_range=(0.5, 0.5), sn=np.inf, seed=3)
+    nearest = np.searchsorted(spectrum.xs, spectrum.features)
+    assert spectrum.ys[nearest] == pytest.approx(0.5, abs=0.05)
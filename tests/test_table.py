@@ -0,0 +1,59 @@
+"""Tests for `nifty.table`."""
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from nifty.table import MeasurementTable
+
+
+@pytest.fixture
+def table():
+    table = MeasurementTable([520., 560., 600.], capacity=2)
+    table.append('star1', 520., 1.0, ew_range=(515., 525.))
+    table.append('star1', 520., 1.2)
+    table.extend('star2', [520., 560., 560.], [0.8, 0.25, np.nan], ew_ranges=[(515., 525.)] * 3)
+    return table
+
+
+def test_table_grows_and_selects(table):
+    assert len(table) == 5
+    assert table.spectra == ['star1', 'star2']
+    assert table.data['feature'].tolist() == [0, 0, 0, 1, 1]
+    assert table.select('star2', 520.)['ew'].tolist() == [0.8]
+    assert table.select('unknown').size == 0
+    assert table.results('star1') == {'520.0': [1.0, 1.2], '560.0': [], '600.0': []}
+    with pytest.raises(ValueError):
+        table.append('star1', 530., 1.)
+
+
+def test_table_statistics(table):
+    statistics = table.statistics()
+    assert statistics['feature'].tolist() == [0, 1]
+    assert statistics['count'].tolist() == [3, 1]
+    assert statistics['mean'] == pytest.approx([1.0, 0.25])
+    assert statistics['std'][0] == pytest.approx(0.2)
+    assert np.isnan(statistics['std'][1])
+    assert statistics['min'].tolist() == [0.8, 0.25]
+
+    per_star = table.statistics(by=('spectrum', 'feature'))
+    assert per_star[['spectrum', 'feature']].tolist() == [(0, 0), (1, 0), (1, 1)]
+    assert per_star['mean'] == pytest.approx([1.1, 0.8, 0.25])
+    assert table.summary().splitlines()[0] == '520.0 n=3 mean=1 std=0.2'
+
+
+def test_table_export(table, tmp_path):
+    table.to_fits(str(tmp_path / 'measurements.fits'))
+    written = Table.read(str(tmp_path / 'measurements.fits'))
+    assert written['spectrum'].tolist() == ['star1', 'star1', 'star2', 'star2', 'star2']
+    assert written['feature'].tolist() == [520., 520., 520., 560., 560.]
+    assert np.array_equal(written['ew'], table.data['ew'], equal_nan=True)
+
+    pytest.importorskip('pyarrow')
+    table.to_parquet(str(tmp_path / 'measurements.parquet'))
+
+
+def test_table_from_results():
+    table = MeasurementTable.from_results({'a.fits': {'520.0': [1.0], '560.0': []}, 'b.fits': {'520.0': [2.0]}})
+    assert table.features.tolist() == [520., 560.]
+    assert table.results() == {'520.0': [1.0, 2.0], '560.0': []}
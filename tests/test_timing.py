@@ -0,0 +1,115 @@
+"""Tests for `nifty.timing`."""
+
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from nifty import cli, timing
+from nifty.batch import measure_records
+from nifty.io import write_norm_cache, write_windows_json
+
+
+WINDOWS = {'520.0': {'fit': [[505., 512.], [528., 535.]], 'ew': [[515., 525.]]}}
+
+
+@pytest.fixture
+def timings():
+    enabled = timing.is_enabled()
+    timing.reset()
+    yield timing
+    timing.enable(enabled)
+    timing.reset()
+
+
+def test_disabled_timers_record_nothing(timings):
+    timings.enable(False)
+    with timings.timer('block'):
+        pass
+    assert timings.timed('call')(abs)(-1) == 1
+    assert timings.timings()['stages'] == {}
+    assert 'disabled' in timings.summary()
+
+
+def test_stage_statistics(timings):
+    timings.enable()
+    for seconds in [1e-3] * 9 + [1.]:
+        timings.record('stage', seconds)
+    with timings.timer('block'):
+        pass
+    with pytest.raises(ValueError):
+        timings.timed('call')(float)('x')
+
+    stages = timings.timings()['stages']
+    assert sorted(stages) == ['block', 'call', 'stage']
+    stats = stages['stage']
+    assert stats['count'] == 10 and sum(stats['histogram']) == 10
+    assert stats['total'] == pytest.approx(1.009)
+    assert stats['min'] == 1e-3 and stats['max'] == 1.
+    assert 1e-3 <= stats['p50'] < 1e-3 * 10 ** 0.25
+    assert stats['p99'] == 1.
+    assert stages['call']['count'] == 1
+    assert 'stage' in timings.summary().splitlines()[-1]
+
+
+def test_record_from_threads(timings):
+    timings.enable()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda i: timings.record(f'stage{i % 2}', 1e-3), range(2000)))
+    stages = timings.timings()['stages']
+    assert stages['stage0']['count'] == stages['stage1']['count'] == 1000
+
+
+@pytest.mark.parametrize('value, enabled, timings_file', [
+    ('', False, None), ('0', False, None), ('false', False, None), ('1', True, None),
+    ('timings.json', True, 'timings.json')])
+def test_environment_variable(value, enabled, timings_file, monkeypatch):
+    monkeypatch.setenv(timing.TIMING_ENV, value)
+    assert timing.env_timings_file() == timings_file
+    env = dict(os.environ, **{timing.TIMING_ENV: value})
+    result = subprocess.run([sys.executable, '-c', 'from nifty import timing; print(timing.is_enabled())'],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True, cwd=os.path.join(os.path.dirname(__file__), os.pardir))
+    assert result.stdout.strip() == str(enabled)
+
+
+def test_batch_stages_and_cli(spectrum, timings, tmp_path):
+    xs, ys = spectrum
+    timings.enable()
+    measure_records(xs, ys, [520.], WINDOWS, profile='gaussian', realizations=10, seed=1)
+    stages = timings.timings()['stages']
+    for stage in ['batch.measure_records', 'batch.continuum', 'batch.equivalent_widths', 'batch.profiles',
+                  'batch.uncertainties']:
+        assert stages[stage]['count'] == 1
+    assert stages['batch.measure_records']['total'] >= stages['batch.profiles']['total']
+
+    timings.enable(False)
+    timings.reset()
+    write_norm_cache(str(tmp_path / 'star.npy'), xs, ys / (2. + 0.01 * (xs - 500.)))
+    write_windows_json(WINDOWS, str(tmp_path / 'windows.json'))
+    timings_file = str(tmp_path / 'timings.json')
+    result = CliRunner().invoke(cli.main, ['--timings', timings_file, 'batch', str(tmp_path), '--pattern', 'star.npy',
+                                           '-w', str(tmp_path / 'windows.json')])
+    assert result.exit_code == 0
+    with open(timings_file) as f:
+        recorded = json.load(f)
+    assert len(recorded['bin_edges']) == len(recorded['stages']['io.read_norm_cache']['histogram']) - 1
+    assert np.all(np.diff(recorded['bin_edges']) > 0)
+    for stage in ['io.read_spectrum', 'io.read_norm_cache', 'batch.measure_records']:
+        assert recorded['stages'][stage]['count'] == 1
+
+    # the environment variable names the output file as well
+    timings.enable(False)
+    timings.reset()
+    env_file = str(tmp_path / 'env_timings.json')
+    result = CliRunner(env={timing.TIMING_ENV: env_file}).invoke(cli.main, ['batch', str(tmp_path), '--pattern',
+                                                                            'star.npy', '-w',
+                                                                            str(tmp_path / 'windows.json')])
+    assert result.exit_code == 0
+    with open(env_file) as f:
+        assert json.load(f)['stages']['batch.measure_records']['count'] == 1
@@ -0,0 +1,157 @@
+"""Tests for `nifty.ui` on a headless canvas."""
+
+from types import SimpleNamespace
+
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use('Agg')
+
+from nifty import timing  # noqa: E402
+from nifty.batch import measure_records  # noqa: E402
+from nifty.continuum import get_indices  # noqa: E402
+from nifty.store import MeasurementStore  # noqa: E402
+from nifty.ui import PlotConfig, PlotUI  # noqa: E402
+
+
+@pytest.fixture
+def ui(spectrum):
+    xs, ys = spectrum
+    config = PlotConfig(xs, ys, [520., 560.])
+    config.x_range_factor = 0.03
+    ui = PlotUI(config, show=False)
+    yield ui
+    matplotlib.pyplot.close(ui.fig)
+
+
+def test_measure_with_blitted_overlays(ui):
+    assert set(ui.backgrounds) == {ui.ax1, ui.ax2, ui.ax3}
+    ui.onselect_fit_range(505., 512.)
+    ui.onselect_fit_range(528., 535.)
+    assert ui.fit_legend.get_visible()
+    assert np.array_equal(ui.fit_points.get_xdata(), ui.config.fit.xs_data)
+
+    ui.onselect_ew_range(515., 525.)
+    assert len(ui.measurements.results['520.0']) == 1
+    assert ui.ew_fill in ui.ax3.collections
+    assert ui.ew_fill.get_animated()
+
+    ui.onpress(SimpleNamespace(key='r'))
+    assert ui.ew_fill is None
+    assert not ui.config.fit.windows
+
+
+def test_uncertainty_mode(ui, capsys):
+    ui.onpress(SimpleNamespace(key='u'))
+    assert ui.config.realizations
+    ui.onselect_fit_range(505., 512.)
+    ui.onselect_fit_range(528., 535.)
+    ui.onselect_ew_range(515., 525.)
+    assert '84%=' in capsys.readouterr().out
+    assert '±' in ui.ew_legend.get_texts()[0].get_text()
+    assert np.isfinite(ui.measurements.table.data['ew_error'][0])
+
+    ui.onpress(SimpleNamespace(key='u'))
+    assert not ui.config.realizations
+
+
+def test_timings_key(ui, capsys):
+    timing.reset()
+    timing.enable()
+    try:
+        ui.onselect_fit_range(505., 512.)
+        ui.onpress(SimpleNamespace(key='t'))
+    finally:
+        timing.enable(False)
+    output = capsys.readouterr().out
+    assert 'ui.select_fit_range' in output and 'ui.normalize' in output
+    timing.reset()
+
+
+def test_navigation_moves_region(ui):
+    ui.onpress(SimpleNamespace(key='right'))
+    assert ui.config.selected_dib == 560.
+    assert ui.ax2.get_xlim() == pytest.approx(ui.config.x_range())
+    assert list(ui.selected_marker.get_xdata()) == [560.]
+    assert ui.line_middle.get_xdata().min() > 520.
+
+
+def test_region_bounds_are_precomputed(ui, monkeypatch):
+    config = ui.config
+    assert np.array_equal(config.features.bounds[0], get_indices(config.xs, config.x_range()))
+    config.increase_x_range()
+    config.norm_margin = 0.25
+    assert np.array_equal(config.features.bounds[0], get_indices(config.xs, config.x_range()))
+    assert np.array_equal(config.norm_bounds(), get_indices(config.xs, config.x_range(0.25)))
+
+    # navigating, normalizing and redrawing the shown region do not search the grid
+    fit_bounds = get_indices(config.xs, [[505., 512.], [528., 535.]])
+    monkeypatch.setattr('nifty.ui.get_indices', None)
+    monkeypatch.setattr('nifty.features.get_indices', None)
+    ui.onpress(SimpleNamespace(key='right'))
+    ui.onpress(SimpleNamespace(key='left'))
+    for indmin, indmax in fit_bounds:
+        config.fit.add(indmin, indmax)
+    ui.update_fit()
+    indmin, indmax = config.norm_bounds()
+    assert np.isfinite(config.ys_norm[indmin:indmax]).all()
+    assert np.isfinite(ui.line_bottom.get_ydata()).any()
+
+
+def test_automatic_fit(ui):
+    ui.onpress(SimpleNamespace(key='a'))
+    assert ui.config.continuum_mask is not None
+    assert ui.config.fit.windows
+    assert len(ui.config.fit_ranges) == len(ui.config.fit.windows)
+    assert ui.fit_legend.get_visible()
+    assert ui.config.fit.coefficients[-1] == pytest.approx(2.2, rel=1e-2)
+
+    # batch replays the automatic fit windows on the same pixels
+    ui.onselect_ew_range(515., 525.)
+    xs, ys = ui.config.xs, ui.config.ys
+    records = measure_records(xs, ys, ui.config.dibs, ui.measurements.windows)
+    assert np.array_equal(get_indices(xs, ui.config.fit_ranges), ui.config.fit.windows)
+    assert records[0]['coefficients'] == pytest.approx(ui.config.fit.coefficients, rel=1e-12)
+    assert records[0]['ew'] == pytest.approx(ui.measurements.results['520.0'][0], rel=1e-12)
+
+
+def test_windows_replay_every_continuum_fit(ui):
+    ui.onselect_fit_range(505., 512.)
+    ui.onselect_fit_range(528., 535.)
+    ui.onselect_ew_range(515., 525.)
+    ui.onselect_ew_range(517., 523.)
+    ui.onpress(SimpleNamespace(key='r'))
+    ui.onselect_fit_range(508., 514.)
+    ui.onselect_ew_range(515., 525.)
+    window_sets = ui.measurements.windows['520.0']
+    assert [len(window_set['ew']) for window_set in window_sets] == [2, 1]
+    assert window_sets[1]['fit'] == [[508., 514.]]
+
+    records = measure_records(ui.config.xs, ui.config.ys, ui.config.dibs, ui.measurements.windows)
+    assert [record['fit_ranges'] for record in records] == [window_sets[0]['fit']] * 2 + [window_sets[1]['fit']]
+    assert [record['ew'] for record in records] == pytest.approx(ui.measurements.results['520.0'], rel=1e-12)
+
+
+def test_blended_ew_window(spectrum, capsys):
+    xs, ys = spectrum
+    ui = PlotUI(PlotConfig(xs, ys, [520., 522., 560.]), show=False)
+    ui.onselect_fit_range(505., 512.)
+    ui.onselect_ew_range(515., 525.)
+    assert 'Blended with [522.0]' in capsys.readouterr().out
+    assert ui.ew_legend.get_texts()[0].get_text().endswith('(blend)')
+    ui.onselect_ew_range(518., 521.)
+    assert 'blend' not in ui.ew_legend.get_texts()[0].get_text()
+    matplotlib.pyplot.close(ui.fig)
+
+
+def test_measurements_are_stored(spectrum, tmp_path):
+    xs, ys = spectrum
+    with MeasurementStore(str(tmp_path / 'measurements.db')) as store:
+        ui = PlotUI(PlotConfig(xs, ys, [520., 560.]), show=False, store=store, spectrum='star.fits')
+        ui.onselect_fit_range(505., 512.)
+        ui.onselect_ew_range(515., 525.)
+        matplotlib.pyplot.close(ui.fig)
+        record, = store.query('star.fits', 520.)
+        assert record['ew'] == ui.measurements.results['520.0'][0]
+        assert record['coefficients'] == ui.config.fit.coefficients.tolist()
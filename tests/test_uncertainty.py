@@ -0,0 +1,60 @@
+"""Tests for `nifty.uncertainty`."""
+
+import numpy as np
+import pytest
+
+from nifty.continuum import fit_continuum, get_indices
+from nifty.ew import equivalent_widths
+from nifty.uncertainty import MonteCarloEW, ew_error, ew_percentiles
+
+
+FIT_RANGES = [[[505., 512.], [528., 535.]], [[545., 552.], [568., 575.]]]
+EW_RANGES = [[515., 525.], [555., 565.], [557., 563.]]
+
+
+@pytest.fixture
+def noisy(spectrum):
+    xs, ys = spectrum
+    errors = 0.01 * ys
+    return xs, ys + np.random.default_rng(7).normal(0., errors), errors
+
+
+def test_realizations_match_single_measurements(noisy):
+    xs, ys, _ = noisy
+    fit_bounds = get_indices(xs, FIT_RANGES)
+    ew_bounds = get_indices(xs, EW_RANGES)
+    monte_carlo = MonteCarloEW(xs, ys, ew_bounds, [520., 560.], fit_bounds=fit_bounds, groups=[0, 1, 1])
+    # the noise estimated from the continuum residuals
+    assert np.median(monte_carlo.sigmas / (0.01 * ys[monte_carlo.pixels])) == pytest.approx(1., rel=0.1)
+
+    realizations = monte_carlo.realizations(3, np.random.default_rng(1))
+    expected = []
+    for realization in realizations:
+        ys_realization = ys.copy()
+        ys_realization[monte_carlo.pixels] = realization
+        coefficients = fit_continuum(xs, ys_realization, fit_bounds, [520., 560.])
+        expected.append(equivalent_widths(xs, ys_realization, ew_bounds, coefficients, [520., 560.],
+                                          groups=[0, 1, 1]))
+    assert np.allclose(monte_carlo.measure(realizations), expected)
+
+
+def test_sample(noisy):
+    xs, ys, errors = noisy
+    ew_bounds = get_indices(xs, EW_RANGES[:1])
+    coefficients = fit_continuum(xs, ys, [get_indices(xs, FIT_RANGES[0])], [520.])
+    ew, ew_sigma = equivalent_widths(xs, ys, ew_bounds, coefficients, [520.], errors=errors)
+
+    # a fixed continuum only propagates the flux noise
+    fixed = MonteCarloEW(xs, ys, ew_bounds, [520.], coefficients=coefficients, errors=errors)
+    samples = fixed.sample(2000, seed=3, block_elements=10000)
+    assert samples.shape == (2000, 1)
+    assert np.array_equal(samples, fixed.sample(2000, seed=3, block_elements=10000))
+    assert ew_error(samples)[0] == pytest.approx(ew_sigma[0], rel=0.1)
+    assert ew_percentiles(samples, [50.])[0, 0] == pytest.approx(ew[0], abs=0.1 * ew_sigma[0])
+
+    # refitting the continuum adds its uncertainty
+    refitted = MonteCarloEW(xs, ys, ew_bounds, [520.], fit_bounds=[get_indices(xs, FIT_RANGES[0])], errors=errors)
+    assert ew_error(refitted.sample(2000, seed=3))[0] > 1.2 * ew_sigma[0]
+
+    with pytest.raises(ValueError):
+        MonteCarloEW(xs, ys, ew_bounds, [520.])
@@ -0,0 +1,50 @@
+"""Tests for `nifty.velocity`."""
+
+import os
+
+import numpy as np
+import pytest
+
+from nifty.batch import measure_spectrum
+from nifty.io import read_2d_fits_spectrum
+from nifty.velocity import (C_KMS, Resampler, shift_features, shift_spectrum, shifted_resampler,
+                            velocity_from_grids)
+
+
+VIS_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'example', 'VIS',
+                        'StRS136_VIS_095.C-0446_XSHOO.2015-08-13T03_50_38.281_tpl_A_handy_bcorr.fits')
+
+
+def test_shift_spectrum_reproduces_barycentric_correction():
+    xs, xs_bary = read_2d_fits_spectrum(VIS_FILE, ykey='bclambda')
+    _, ys_norm = read_2d_fits_spectrum(VIS_FILE, ykey='norm')
+    _, ys_bary = read_2d_fits_spectrum(VIS_FILE, ykey='bcnorm')
+
+    velocity = velocity_from_grids(xs, xs_bary)
+    assert velocity == pytest.approx(-23.67, abs=0.01)
+    assert np.allclose(shift_spectrum(xs, ys_norm, velocity), ys_bary, rtol=0, atol=1e-9, equal_nan=True)
+    assert shifted_resampler(xs, velocity) is shifted_resampler(xs.copy(), velocity)
+
+
+def test_resampler():
+    xs = np.linspace(500., 510., 101)
+    ys = np.stack([np.sin(xs), np.cos(xs)])
+    grid = np.linspace(499., 511., 50)
+    resampled = Resampler(xs, grid)(ys)
+    inside = (grid >= 500.) & (grid <= 510.)
+    assert np.allclose(resampled[:, inside], [np.interp(grid[inside], xs, y) for y in ys])
+    assert np.isnan(resampled[:, ~inside]).all()
+
+
+def test_measure_with_velocity(spectrum):
+    xs, ys = spectrum
+    velocity = 300.
+    windows = {'520.0': {'fit': [[505., 512.], [528., 535.]], 'ew': [[515., 525.]]}}
+    assert shift_features([520.], velocity)[0] == pytest.approx(520. * (1 + velocity / C_KMS))
+
+    # the spectrum moved by the velocity measured with the moved features gives the rest EW
+    ys_shifted = shift_spectrum(xs, ys, velocity)
+    rest = measure_spectrum(xs, ys, [520.], windows)['520.0'][0]
+    moved = measure_spectrum(xs, ys_shifted, [520.], windows, velocity=velocity)['520.0'][0]
+    assert moved == pytest.approx(rest, rel=1e-3)
+    assert measure_spectrum(xs, ys_shifted, [520.], windows)['520.0'][0] != pytest.approx(rest, rel=1e-3)